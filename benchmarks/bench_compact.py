@@ -0,0 +1,90 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Compare the size and render time of the SVG output flags over a corpus.
+
+Usage:
+    python benchmarks/bench_compact.py [--shapes N] [--repeat R]
+"""
+
+import argparse
+import time
+from typing import List, Tuple
+
+from pypikchr.diagram import Arrow, Box, Circle, Diagram, PikchrFlags, from_graph
+from pypikchr.util.pikchr import create_pikchr
+
+MODES: List[Tuple[str, int]] = [
+    ("default", 0),
+    ("compact", PikchrFlags.COMPACT),
+    ("precision(1)", PikchrFlags.precision(1)),
+    ("compact+p(2)", PikchrFlags.COMPACT | PikchrFlags.precision(2)),
+    ("classes", PikchrFlags.COMPACT | PikchrFlags.STYLE_CLASSES),
+    (
+        "all, p(1)",
+        PikchrFlags.COMPACT | PikchrFlags.STYLE_CLASSES | PikchrFlags.precision(1),
+    ),
+]
+
+
+def corpus(n: int) -> List[str]:
+    """Markdown of a chain of styled shapes, a grid of boxes and a DAG."""
+    chain = Diagram()
+    for i in range(n):
+        chain.add(Box(f"node {i}").fill("lightblue") if i % 2 else Arrow())
+        if i % 10 == 0:
+            chain.add(Circle(f"c{i}").color("red"))
+    grid = "\n".join(
+        f'box "{i}" width 0.37 at ({i % 40 * 0.41:.3f}, {i // 40 * 0.29:.3f})'
+        for i in range(n)
+    )
+    nodes = n // 4
+    tree = [(i, j) for j in range(1, nodes) for i in [(j - 1) // 2]]
+    return [chain.md, grid, from_graph(tree).md]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sources = corpus(args.shapes)
+    results = []
+    for name, flags in MODES:
+        size = sum(len(create_pikchr(md, "", flags, 0, 0)) for md in sources)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for md in sources:
+                create_pikchr(md, "", flags, 0, 0)
+        results.append((name, size, (time.perf_counter() - start) / args.repeat))
+
+    base_size, base_time = results[0][1:]
+    print(f"{len(sources)} diagrams, {args.shapes} shapes each")
+    print(f"{'mode':>14} {'bytes':>10} {'size':>7} {'time':>10} {'vs default':>10}")
+    for name, size, seconds in results:
+        print(
+            f"{name:>14} {size:>10} {size / base_size:>7.1%} "
+            f"{seconds * 1000:>7.1f} ms {seconds / base_time:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Time importing and rendering random DAGs with `from_graph`.
+
+Reports the time spent in the layered layout, in generating the markdown and
+in pikchr, for graphs of increasing size.
+
+Usage:
+    python benchmarks/bench_graph.py [--sizes N [N ...]]
+"""
+
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from pypikchr.diagram import from_graph
+
+
+def random_dag(n: int, seed: int = 0) -> List[Tuple[int, int]]:
+    """Each node gets one or two parents among the previous 50 nodes."""
+    rng = random.Random(seed)
+    edges = [(rng.randrange(max(0, i - 50), i), i) for i in range(1, n)]
+    edges += [(rng.randrange(max(0, i - 50), i), i) for i in range(1, n, 3)]
+    return edges
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'edges':>8} {'layout':>10} {'markdown':>10} {'render':>10}")
+    for n in args.sizes:
+        edges = random_dag(n)
+        start = time.perf_counter()
+        d = from_graph(edges)
+        laid_out = time.perf_counter()
+        md = d.md
+        generated = time.perf_counter()
+        svg = str(d)
+        rendered = time.perf_counter()
+        if not svg.startswith("<svg"):
+            raise SystemExit(f"{n} nodes failed to render ({len(md)} characters)")
+        print(
+            f"{n:>8} {len(edges):>8} "
+            f"{(laid_out - start) * 1000:>8.1f}ms "
+            f"{(generated - laid_out) * 1000:>8.1f}ms "
+            f"{(rendered - generated) * 1000:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Time hit-testing against the spatial index of a laid-out diagram.
+
+A real diagram is laid out to check the index against pikchr's geometry. Since
+pikchr limits the number of tokens in a script, the large cases use synthetic
+geometry: a grid of boxes joined by arrows, like a large flow chart.
+
+Usage:
+    python benchmarks/bench_hittest.py [--queries N]
+"""
+
+import argparse
+import random
+import time
+from typing import List
+
+from pypikchr.diagram import Arrow, Box, Diagram
+from pypikchr.geometry import ShapeGeometry, SpatialIndex
+
+
+def synthetic(n_shapes: int) -> List[ShapeGeometry]:
+    shape = Box("x")
+    items: List[ShapeGeometry] = []
+    cols = int(n_shapes**0.5)
+    for i in range(n_shapes // 2):
+        x, y = (i % cols) * 150.0, (i // cols) * 100.0
+        items.append(
+            ShapeGeometry(shape, (x, y, x + 100, y + 70), (x + 50, y + 35), ())
+        )
+        path = ((x + 100, y + 35), (x + 150, y + 35))
+        items.append(
+            ShapeGeometry(shape, (x + 100, y + 35, x + 150, y + 35), path[0], path)
+        )
+    return items
+
+
+def time_queries(
+    index: SpatialIndex, items: List[ShapeGeometry], n_queries: int
+) -> None:
+    rng = random.Random(0)
+    width = max(g.bbox[2] for g in items)
+    height = max(g.bbox[3] for g in items)
+    points = [(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(n_queries)]
+    start = time.perf_counter()
+    for x, y in points:
+        index.at_point(x, y)
+    point_us = (time.perf_counter() - start) / n_queries * 1e6
+    start = time.perf_counter()
+    for x, y in points:
+        index.in_rect(x, y, x + 300, y + 200)
+    rect_us = (time.perf_counter() - start) / n_queries * 1e6
+    print(f"{len(index):>8} {point_us:>12.1f} {rect_us:>12.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'shapes':>8} {'point us':>12} {'rect us':>12}")
+    d = Diagram()
+    for i in range(2000):
+        d.add(Box(f"Node {i}"))
+        d.add(Arrow())
+    start = time.perf_counter()
+    layout = d.layout(svg=False)
+    layout.index
+    elapsed = time.perf_counter() - start
+    time_queries(layout.index, layout.shapes, args.queries)
+    print(
+        f"  (layout and index of {len(layout.shapes)} shapes: {elapsed * 1e3:.1f} ms)"
+    )
+
+    for n in (10_000, 100_000):
+        items = synthetic(n)
+        start = time.perf_counter()
+        index = SpatialIndex(items)
+        elapsed = time.perf_counter() - start
+        time_queries(index, items, args.queries)
+        print(f"  (index built in {elapsed * 1e3:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Track the memory cost of shapes in large diagrams.
+
+Reports bytes per shape for the object graph alone, and once the markdown has
+been generated (which also caches each shape's fragment), next to the size of
+the markdown itself.
+
+Usage:
+    python benchmarks/bench_memory.py [--shapes N]
+"""
+
+import argparse
+import gc
+import tracemalloc
+from typing import Callable, Dict
+
+from pypikchr.diagram import Arrow, Box, Circle, Diagram, Shape
+
+
+def plain(i: int) -> Shape:
+    return Box(f"n{i}")
+
+
+def styled(i: int) -> Shape:
+    return Box(f"node {i}").label(f"N{i}").fill("lightblue").width(1.2)
+
+
+def linked(i: int) -> Shape:
+    if i % 2:
+        return Arrow().right(0.5)
+    return Circle(f"c{i}").url(f"https://example.com/{i}")
+
+
+def measure(factory: Callable[[int], Shape], n: int) -> Dict[str, float]:
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    d = Diagram()
+    for i in range(n):
+        d.add(factory(i))
+    built, _ = tracemalloc.get_traced_memory()
+    md = d.md
+    rendered, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "graph": (built - start) / n,
+        "with_md": (rendered - start) / n,
+        "md": len(md.encode()) / n,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{args.shapes} shapes, bytes per shape")
+    print(f"{'kind':>8} {'graph':>10} {'with md':>10} {'md text':>10}")
+    for name, factory in (("plain", plain), ("styled", styled), ("linked", linked)):
+        r = measure(factory, args.shapes)
+        print(f"{name:>8} {r['graph']:>10.1f} {r['with_md']:>10.1f} {r['md']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Compare peak memory and time of writing an SVG via str() against render_to.
+
+Each mode runs in a fresh subprocess, since the SVG buffers are allocated by
+the C extension and are not visible to tracemalloc.
+
+Usage:
+    python benchmarks/bench_render_to.py [--shapes N]
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from pypikchr.diagram import Arrow, Box, Diagram
+
+
+def build(n: int) -> Diagram:
+    d = Diagram()
+    for i in range(n):
+        d.add(Box(f"node {i}").fill("lightblue") if i % 2 else Arrow())
+    return d
+
+
+def run(mode: str, shapes: int) -> None:
+    d = build(shapes)
+    d.md  # Generate the markdown before measuring
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryFile() as f:
+        start = time.perf_counter()
+        if mode == "str":
+            f.write(str(d).encode())
+        else:
+            d.render_to(f)
+        elapsed = time.perf_counter() - start
+        size = f.tell()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        f"{mode:>10} {elapsed * 1000:>8.1f} ms {(peak - base) / 1024:>8.1f} MiB"
+        f" peak, {size / 2**20:.1f} MiB SVG"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=20000)
+    parser.add_argument("--mode", choices=("str", "render_to"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.shapes)
+        return
+
+    print(f"{args.shapes} shapes, time and peak RSS growth")
+    for mode in ("str", "render_to"):
+        subprocess.run(
+            [sys.executable, __file__, "--shapes", str(args.shapes), "--mode", mode],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Time DiagramService responses for fresh, cached and conditional requests.
+
+Usage:
+    python benchmarks/bench_serve.py [--shapes N] [--repeat R]
+"""
+
+import argparse
+import time
+from typing import Callable, Dict
+
+from pypikchr.diagram import Arrow, Box, Circle, Diagram
+from pypikchr.serve import DiagramService, Response, encode_diagram
+
+
+def build(n: int) -> Diagram:
+    d = Diagram()
+    for i in range(n):
+        d.add(Box(f"node {i}").fill("lightblue").url(f"/n/{i}") if i % 2 else Arrow())
+        if i % 10 == 0:
+            d.add(Circle(f"c{i}").color("red"))
+    return d
+
+
+def timed(fn: Callable[[], Response], repeat: int) -> float:
+    best: float = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    body: bytes = encode_diagram(build(args.shapes))
+    json_type: Dict[str, str] = {"content-type": "application/json"}
+    gzip_type: Dict[str, str] = dict(json_type, **{"accept-encoding": "gzip"})
+    service = DiagramService()
+    first: Response = service.handle("POST", "", json_type, body)
+    etag: str = dict(first.headers)["ETag"]
+    compressed: Response = service.handle("POST", "", gzip_type, body)
+
+    def fresh() -> Response:
+        service.clear()
+        return service.handle("POST", "", json_type, body)
+
+    def fresh_gzip() -> Response:
+        service.clear()
+        return service.handle("POST", "", gzip_type, body)
+
+    def cached() -> Response:
+        return service.handle("POST", "", json_type, body)
+
+    def cached_gzip() -> Response:
+        return service.handle("POST", "", gzip_type, body)
+
+    def not_modified() -> Response:
+        return service.handle(
+            "POST", "", dict(json_type, **{"if-none-match": etag}), body
+        )
+
+    results: Dict[str, float] = {}
+    for name, fn in [
+        ("render", fresh),
+        ("render+gzip", fresh_gzip),
+        ("cached", cached),
+        ("cached gzip", cached_gzip),
+        ("304", not_modified),
+    ]:
+        results[name] = timed(fn, args.repeat)
+
+    print(f"{args.shapes} shapes, {len(body)} byte request")
+    print(f"svg {len(first.body)} bytes, gzip {len(compressed.body)} bytes")
+    for name, seconds in results.items():
+        print(f"{name:>12} {seconds * 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
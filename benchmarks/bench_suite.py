@@ -0,0 +1,277 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Time and memory-profile each stage of rendering synthetic diagrams.
+
+Diagrams of several kinds (plain boxes, labelled DAGs, URL-heavy diagrams,
+nested groups and stacks, and long `>>` chains) are generated at each size,
+and every stage is measured separately:
+
+    build     creating the shapes and adding them to the diagram
+    markdown  the first generation of the markdown and object tags
+    render    create_pikchr on that markdown, in C
+    str       str(diagram) end to end, on a freshly built diagram
+
+Times are the best of --repeat runs. Memory is the peak of Python allocations
+seen by tracemalloc during one more run, which includes the returned SVG but
+not pikchr's internal buffers. Diagrams beyond pikchr's token limit cannot be
+rendered, so their render stages are reported as n/a.
+
+Results can be saved as a baseline and later runs compared against it. Stages
+slower or larger than the baseline by more than --threshold are flagged, and
+the script exits with status 1.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 10 100 ...] [--kinds boxes ...]
+        [--repeat R] [--save FILE] [--compare FILE] [--threshold 0.2]
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pypikchr
+from pypikchr.diagram import Arrow, Box, Diagram, Direction, Group, Shape, Stack
+from pypikchr.util.pikchr import create_pikchr
+
+STAGES: Tuple[str, ...] = ("build", "markdown", "render", "str")
+
+# Times below this are too noisy to flag as regressions, in seconds
+MIN_TIME: float = 0.002
+
+
+def boxes(n: int) -> Diagram:
+    d = Diagram()
+    for i in range(n):
+        d.add(Box(f"n{i}"))
+    return d
+
+
+def dag(n: int) -> Diagram:
+    """Labelled nodes in rows of 10, each joined to two nodes of the row above."""
+    d = Diagram(direction=Direction.down)
+    nodes = n // 3 + 1
+    placed: List[Shape] = []
+    for i in range(nodes):
+        box = Box(f"node {i}").label(f"N{i}")
+        if i % 10:
+            box.right_of(placed[i - 1])
+        elif i:
+            box.below(placed[i - 10])
+        placed.append(box)
+        d.add(box)
+    for i in range(10, nodes):
+        for parent in (i - 10, i - 10 + (i * 7) % 10 - i % 10):
+            if 0 <= parent < i:
+                d.add(Arrow().from_pos(f"N{parent}.s").to_pos(f"N{i}.n"))
+    return d
+
+
+def urls(n: int) -> Diagram:
+    d = Diagram()
+    for i in range(n):
+        d.add(Box(f"Node {i}").url(f"https://example.com/{i}?q=a&b"))
+    return d
+
+
+def nested(n: int) -> Diagram:
+    """Stacks of 10 boxes, grouped 10 at a time."""
+    d = Diagram()
+    group = Group()
+    for i in range(0, n, 10):
+        stack = Stack(direction="down" if i % 20 else "right")
+        for j in range(i, min(i + 10, n)):
+            stack.add(Box(f"s{j}"))
+        group.add(stack)
+        if len(group._shapes) == 10:
+            d.add(group)
+            group = Group()
+    if group._shapes:
+        d.add(group)
+    return d
+
+
+def chain(n: int) -> Diagram:
+    shape: Shape = Box("start")
+    for i in range(n // 2):
+        shape = shape >> Arrow() >> Box(f"b{i}")
+    return Diagram().add(shape)
+
+
+KINDS: Dict[str, Callable[[int], Diagram]] = {
+    "boxes": boxes,
+    "dag": dag,
+    "urls": urls,
+    "nested": nested,
+    "chain": chain,
+}
+
+
+def time_stages(kind: Callable[[int], Diagram], n: int) -> Dict[str, float]:
+    times: Dict[str, float] = {}
+
+    def timed(stage: str, func: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        times[stage] = min(times.get(stage, elapsed), elapsed)
+        return result
+
+    d = timed("build", lambda: kind(n))
+    objects: List[Any] = []
+    md = timed("markdown", lambda: d._get_md(objects))
+    timed("render", lambda: create_pikchr(md, "", 0, 0, 0, objects))
+    fresh = kind(n)
+    timed("str", lambda: str(fresh))
+    return times
+
+
+def memory_stages(kind: Callable[[int], Diagram], n: int) -> Dict[str, int]:
+    peaks: Dict[str, int] = {}
+
+    def traced(stage: str, func: Callable[[], Any]) -> Any:
+        gc.collect()
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks[stage] = peak - base
+        return result
+
+    d = traced("build", lambda: kind(n))
+    objects: List[Any] = []
+    md = traced("markdown", lambda: d._get_md(objects))
+    traced("render", lambda: create_pikchr(md, "", 0, 0, 0, objects))
+    fresh = kind(n)
+    traced("str", lambda: str(fresh))
+    return peaks
+
+
+def measure(name: str, n: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Measure each stage of one kind of diagram at one size."""
+    kind = KINDS[name]
+    d = kind(n)
+    objects: List[Any] = []
+    svg = create_pikchr(d._get_md(objects), "", 0, 0, 0, objects)
+    renders = svg.startswith("<svg")
+
+    times: Dict[str, float] = {}
+    for _ in range(repeat):
+        for stage, elapsed in time_stages(kind, n).items():
+            times[stage] = min(times.get(stage, elapsed), elapsed)
+    peaks = memory_stages(kind, n)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for stage in STAGES:
+        if not renders and stage in ("render", "str"):
+            results[stage] = {"time": None, "memory": None}
+        else:
+            results[stage] = {"time": times[stage], "memory": peaks[stage]}
+    return results
+
+
+def compare(
+    current: Dict[str, Any], baseline: Optional[Dict[str, Any]], threshold: float
+) -> Tuple[str, bool]:
+    """Format the change from the baseline and whether it is a regression."""
+    if not baseline or current["time"] is None or baseline["time"] is None:
+        return "", False
+    time_ratio = current["time"] / max(baseline["time"], 1e-9)
+    mem_ratio = current["memory"] / max(baseline["memory"], 1)
+    slower = time_ratio > 1 + threshold and current["time"] >= MIN_TIME
+    larger = mem_ratio > 1 + threshold and current["memory"] >= 1024
+    flag = " REGRESSION" if slower or larger else ""
+    return f" {time_ratio:>7.2f}x {mem_ratio:>7.2f}x{flag}", slower or larger
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000]
+    )
+    parser.add_argument("--kinds", nargs="+", choices=list(KINDS), default=list(KINDS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="FILE", help="Write results as JSON.")
+    parser.add_argument(
+        "--compare", metavar="FILE", help="Compare against saved results."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown or growth flagged as a regression.",
+    )
+    args = parser.parse_args()
+
+    baseline: Dict[str, Any] = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    header = f"{'kind':>8} {'shapes':>8} {'stage':>9} {'ms':>10} {'peak KiB':>10}"
+    if baseline:
+        header += f" {'time':>8} {'memory':>8}"
+    print(header)
+
+    results: Dict[str, Any] = {}
+    regressions: List[str] = []
+    for name in args.kinds:
+        for n in args.sizes:
+            # Large diagrams are slow enough to time once
+            repeat = args.repeat if n < 10000 else 1
+            for stage, result in measure(name, n, repeat).items():
+                key = f"{name}/{n}/{stage}"
+                results[key] = result
+                if result["time"] is None:
+                    print(f"{name:>8} {n:>8} {stage:>9} {'n/a':>10} {'n/a':>10}")
+                    continue
+                change, regressed = compare(result, baseline.get(key), args.threshold)
+                if regressed:
+                    regressions.append(key)
+                print(
+                    f"{name:>8} {n:>8} {stage:>9} {result['time'] * 1e3:>10.2f}"
+                    f" {result['memory'] / 1024:>10.1f}{change}"
+                )
+
+    if args.save:
+        meta = {
+            "pypikchr": pypikchr.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "threshold": args.threshold,
+        }
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for key in regressions:
+            print(f"  {key}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Compare building large diagrams from shapes against a ShapeTable.
+
+Times constructing the diagram and generating its markdown both ways, and
+checks that the markdown is identical.
+
+Usage:
+    python benchmarks/bench_table.py [--shapes N]
+"""
+
+import argparse
+import time
+from typing import Tuple
+
+from pypikchr.diagram import Box, Diagram, ShapeTable
+
+
+def with_shapes(n: int) -> Tuple[float, str]:
+    start = time.perf_counter()
+    d = Diagram()
+    for i in range(n):
+        d.add(
+            Box(f"node {i}")
+            .label(f"N{i}")
+            .width(1.2)
+            .fill("lightblue")
+            .at(f"({i % 300}, {i // 300})")
+        )
+    md = d.md
+    return time.perf_counter() - start, md
+
+
+def with_table(n: int) -> Tuple[float, str]:
+    start = time.perf_counter()
+    table = ShapeTable(
+        texts=[f"node {i}" for i in range(n)],
+        labels=[f"N{i}" for i in range(n)],
+        widths=1.2,
+        fills="lightblue",
+        positions=[(i % 300, i // 300) for i in range(n)],
+    )
+    md = Diagram().add(table).md
+    return time.perf_counter() - start, md
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=100_000)
+    args = parser.parse_args()
+
+    shapes_time, shapes_md = with_shapes(args.shapes)
+    table_time, table_md = with_table(args.shapes)
+    print(f"{args.shapes} shapes, build + markdown")
+    print(f"{'shapes':>8} {shapes_time * 1000:>10.1f} ms")
+    print(f"{'table':>8} {table_time * 1000:>10.1f} ms")
+    print(
+        f"speedup {shapes_time / table_time:.1f}x, identical: {shapes_md == table_md}"
+    )
+
+
+if __name__ == "__main__":
+    main()
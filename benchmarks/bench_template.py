@@ -0,0 +1,101 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Compare rebuilding a diagram for every render against a compiled template.
+
+A status dashboard is simulated: the topology is fixed and only the fill
+colors of a few shapes change between renders.
+
+Usage:
+    python benchmarks/bench_template.py [--shapes N] [--params P] [--renders R]
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import Dict, List, Union
+
+from pypikchr.diagram import Arrow, Box, Diagram, Param
+
+COLORS: List[str] = ["green", "orange", "red", "gray"]
+
+
+def build(n: int, fills: Dict[str, Union[str, Param]]) -> Diagram:
+    """Boxes joined by arrows, with a status fill on every n/len(fills)th box."""
+    names = list(fills)
+    step = max(n // len(names), 1)
+    d = Diagram()
+    for i in range(n):
+        box = Box(f"service {i}")
+        if i % step == 0 and i // step < len(names):
+            name = names[i // step]
+            box.fill(fills[name]).url(f"https://status.example.com/{name}")
+        d.add(box).add(Arrow())
+    return d
+
+
+def strip_ids(svg: str) -> str:
+    return re.sub(r'data-pypikchr-id="\d+"', "", svg)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=500)
+    parser.add_argument("--params", type=int, default=20)
+    parser.add_argument("--renders", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = [f"s{i}" for i in range(args.params)]
+    states = [{name: rng.choice(COLORS) for name in names} for _ in range(args.renders)]
+
+    start = time.perf_counter()
+    for values in states:
+        rebuilt = str(build(args.shapes, values))
+    rebuild_time = (time.perf_counter() - start) / args.renders
+
+    template = build(args.shapes, {name: Param(name) for name in names}).compile(
+        cache_entries=0
+    )
+    start = time.perf_counter()
+    for values in states:
+        rendered = template.render(values)
+    template_time = (time.perf_counter() - start) / args.renders
+
+    cached = build(args.shapes, {name: Param(name) for name in names}).compile()
+    # Dashboards cycle through a few states, so most renders hit the cache
+    repeated = states[:10] * (args.renders // 10)
+    start = time.perf_counter()
+    for values in repeated:
+        cached.render(values)
+    cached_time = (time.perf_counter() - start) / len(repeated)
+
+    print(f"{args.shapes} shapes, {args.params} params, per render")
+    print(f"{'rebuild':>10} {rebuild_time * 1000:>8.2f} ms")
+    print(f"{'template':>10} {template_time * 1000:>8.2f} ms")
+    print(f"{'cached':>10} {cached_time * 1000:>8.3f} ms")
+    print(
+        f"template speedup {rebuild_time / template_time:.2f}x, "
+        f"identical: {strip_ids(rendered) == strip_ids(rebuilt)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
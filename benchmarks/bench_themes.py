@@ -0,0 +1,72 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Compare rendering light and dark SVGs separately against render_themes.
+
+Usage:
+    python benchmarks/bench_themes.py [--shapes N] [--repeat R]
+"""
+
+import argparse
+import time
+
+from pypikchr.diagram import Arrow, Box, Circle, Diagram, PikchrFlags
+
+
+def build(n: int) -> Diagram:
+    d = Diagram()
+    for i in range(n):
+        d.add(Box(f"node {i}").fill("lightblue") if i % 2 else Arrow())
+        if i % 10 == 0:
+            d.add(Circle(f"c{i}").color("red"))
+    return d
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    light = build(args.shapes)
+    dark = Diagram(flags=PikchrFlags.DARK_MODE)
+    for item in light._shapes:
+        dark.add(item)
+    light.md, dark.md  # Generate the markdown outside the timings
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        separate = (str(light), str(dark))
+    separate_time = (time.perf_counter() - start) / args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        themes = light.render_themes()
+    themes_time = (time.perf_counter() - start) / args.repeat
+
+    print(f"{args.shapes} shapes, light + dark")
+    print(f"{'separate':>10} {separate_time * 1000:>8.1f} ms")
+    print(f"{'themes':>10} {themes_time * 1000:>8.1f} ms")
+    print(
+        f"speedup {separate_time / themes_time:.2f}x, identical: {separate == themes}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+"""Time rendering of URL-heavy diagrams.
+
+The <a>/<g> wrappers are emitted by the renderer itself, so the cost should be
+proportional to the SVG size: the reported microseconds per KiB should stay
+roughly flat as shapes are added.
+
+Usage:
+    python benchmarks/bench_urls.py [--repeat N]
+"""
+
+import argparse
+import time
+from typing import List
+
+from pypikchr.diagram import Box, Diagram
+
+
+def url_diagram(n_shapes: int) -> Diagram:
+    d = Diagram()
+    for i in range(n_shapes):
+        d.add(Box(f"Node {i}").url(f"https://example.com/{i}"))
+    return d
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sizes: List[int] = [500, 1000, 2000, 5000]
+    print(f"{'shapes':>8} {'svg KiB':>10} {'best ms':>10} {'us/KiB':>10}")
+    for n in sizes:
+        d = url_diagram(n)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            svg = str(d)
+            best = min(best, time.perf_counter() - start)
+        kib = len(svg) / 1024
+        print(f"{n:>8} {kib:>10.1f} {best * 1e3:>10.2f} {best * 1e6 / kib:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,155 @@ char *pikchr(
   int *pnHeight          /* OUT: Write height here, if not NULL */
 );
 
+/* Identifies an object in the input text so that pikchr_ext() wraps its
+** SVG elements in <g data-pypikchr-id="iId">, or in
+** <a href="zUrl" data-pypikchr-id="iId"> when zUrl is not NULL.
+**
+** iOffset is the byte offset in zText of the object's class name (for
+** example "box"), or of the closing "]" for a [...] sublist.  zUrl must
+** already be escaped for use inside a double-quoted XML attribute.
+*/
+typedef struct PikchrObjTag PikchrObjTag;
+struct PikchrObjTag {
+  unsigned int iOffset;    /* Offset in zText of the object's errTok */
+  long iId;                /* Value of the data-pypikchr-id attribute */
+  const char *zUrl;        /* Attribute-escaped URL, or NULL */
+};
+
+/* Optional settings for pikchr_ext().
+*/
+typedef struct PikchrOpts PikchrOpts;
+typedef struct PikchrErrInfo PikchrErrInfo;
+typedef struct PikchrGeomList PikchrGeomList;
+typedef struct PikchrSvg PikchrSvg;
+typedef struct PikchrStats PikchrStats;
+struct PikchrOpts {
+  const PikchrObjTag *aTag;  /* Object tags, sorted by iOffset */
+  int nTag;                  /* Number of entries in aTag[] */
+  unsigned int mOpts;        /* PIKCHR_OPT_* bits */
+  PikchrErrInfo *pErr;       /* OUT: Details of the first error, or NULL */
+  PikchrGeomList *pGeom;     /* OUT: Geometry of tagged objects, or NULL */
+  PikchrSvg *pDark;          /* OUT: Dark-mode copy of the SVG, or NULL */
+  unsigned int nSizeHint;    /* Initial size of the output buffer, or 0 */
+  int (*xWrite)(void*,const char*,unsigned int); /* Stream the SVG here */
+  void *pWriteArg;           /* First argument to xWrite */
+  PikchrStats *pStats;       /* OUT: Timings and counters, or NULL */
+};
+
+/* A non-zero PikchrOpts.nSizeHint, such as the length of a previous
+** rendering of the same diagram, is allocated for the output up front
+** so that it does not have to be grown while the SVG is generated.
+**
+** When PikchrOpts.xWrite is not NULL, the SVG is passed to it in chunks
+** of about PIKCHR_STREAM_CHUNK bytes as it is generated, preceded by any
+** output of "print" statements, instead of being returned.  xWrite
+** returns non-zero if the chunk could not be written, which stops the
+** rendering with an error.  Errors found before rendering starts are
+** returned as usual and nothing is written.  A dark-mode copy requested
+** with pDark is never streamed.
+*/
+#define PIKCHR_STREAM_CHUNK 65536
+
+/* When PikchrOpts.pDark is not NULL, the objects are rendered a second
+** time in dark mode after layout, and the result is written here.  The
+** main result is rendered according to mFlags as usual.  z is NULL if
+** there was an error, and must otherwise be released with free().
+*/
+struct PikchrSvg {
+  char *z;                 /* The SVG text, zero-terminated */
+  unsigned int n;          /* Length of z in bytes */
+};
+
+/* When PikchrOpts.pStats is not NULL, it is filled in with how long
+** each phase of the call took and with counters of the work done.
+** Objects are placed as their statements are parsed, so rParse includes
+** their layout.  rLayout covers computing the size of the canvas (and
+** the geometry requested with pGeom), and rRender generating the SVG,
+** any dark-mode copy, and streaming it.  Phases that did not run, for
+** example after an error, are 0.
+*/
+struct PikchrStats {
+  double rParse;           /* Seconds tokenizing, parsing and placing */
+  double rLayout;          /* Seconds computing the canvas and geometry */
+  double rRender;          /* Seconds generating the SVG */
+  double rTotal;           /* Seconds in pikchr_ext() as a whole */
+  unsigned int nToken;     /* Tokens read */
+  unsigned int nObj;       /* Objects created */
+  unsigned int nLookup;    /* Lookups of objects by name */
+  unsigned int nOut;       /* Bytes of output, including any dark copy */
+  unsigned int nRealloc;   /* Times the output buffer was grown */
+};
+
+/* Include PIKCHR_OPT_NO_SVG among the bits of PikchrOpts.mOpts to stop
+** after layout.  The width and height are still computed, but no SVG
+** text is generated, so the result is NULL unless there is an error.
+*/
+#define PIKCHR_OPT_NO_SVG 0x0001
+
+/* Details of the first error, filled in by pikchr_ext() when
+** PikchrOpts.pErr is not NULL.
+*/
+struct PikchrErrInfo {
+  int nErr;                /* Non-zero if an error occurred */
+  int iOffset;             /* Byte offset in zText of the error, or -1 */
+  int nLen;                /* Length in bytes of the token at iOffset */
+  char zMsg[200];          /* The error message, zero-terminated */
+};
+
+/* Geometry of one tagged object, in the units and orientation of the
+** SVG viewBox (x grows to the right, y grows downward).
+*/
+typedef struct PikchrGeom PikchrGeom;
+struct PikchrGeom {
+  long iId;                /* iId of the PikchrObjTag for the object */
+  double x0, y0;           /* Top-left corner of the bounding box */
+  double x1, y1;           /* Bottom-right corner of the bounding box */
+  double cx, cy;           /* Center of the object */
+  int iPath;               /* Index in aPt[] of the first path point */
+  int nPath;               /* Number of path points.  0 for block objects */
+};
+
+/* Geometry of every tagged object, in drawing order.  Filled in by
+** pikchr_ext() when PikchrOpts.pGeom is not NULL.  The caller must
+** free() aObj and aPt.
+*/
+struct PikchrGeomList {
+  int nObj;                /* Number of entries in aObj[] */
+  int nObjAlloc;           /* Allocated entries in aObj[] */
+  PikchrGeom *aObj;        /* One entry per tagged object */
+  int nPt;                 /* Number of points in aPt[] */
+  int nPtAlloc;            /* Allocated points in aPt[] */
+  double *aPt;             /* Path points as x,y pairs */
+  int bOom;                /* True if an allocation failed */
+};
+
+/* Same as pikchr(), with extra settings taken from pOpts (which may be
+** NULL).  If pnOut is not NULL the number of bytes in the returned
+** buffer (excluding the zero terminator) is written to *pnOut.
+*/
+char *pikchr_ext(
+  const char *zText,       /* Input PIKCHR source text.  zero-terminated */
+  const char *zClass,      /* Add class="%s" to <svg> markup */
+  unsigned int mFlags,     /* Flags used to influence rendering behavior */
+  const PikchrOpts *pOpts, /* Extra settings, or NULL */
+  int *pnWidth,            /* OUT: Write width of <svg> here, if not NULL */
+  int *pnHeight,           /* OUT: Write height here, if not NULL */
+  unsigned int *pnOut      /* OUT: Write length of the result here, if not NULL */
+);
+
+/* Return 100 times the width of the text that pikchr would estimate
+** for a string literal whose contents are the nText bytes at zText,
+** without the enclosing quotes.  Backslash escapes and HTML entities are
+** handled as in the source text.  Multiply by the "charwid" setting and
+** divide by 100 to get the width in inches.  zText[nText] must be
+** readable, for example the zero terminator.
+*/
+int pikchr_text_length(
+  const char *zText,       /* Text of the string literal, without quotes */
+  int nText,               /* Number of bytes in zText */
+  int isMonospace          /* True if the text uses the "mono" font */
+);
+
 /* Include PIKCHR_PLAINTEXT_ERRORS among the bits of mFlags on the 3rd
 ** argument to pikchr() in order to cause error message text to come out
 ** as text/plain instead of as text/html
@@ -31,3 +180,23 @@ char *pikchr(
 ** argument to pikchr() to render the image in dark mode.
 */
 #define PIKCHR_DARK_MODE        0x0002
+
+/* Flags for smaller SVG output, for example when serving many diagrams.
+**
+** PIKCHR_COMPACT leaves out the newlines between elements and other
+** optional whitespace, and writes colors as #rrggbb or #rgb instead of
+** rgb(r,g,b).
+**
+** PIKCHR_STYLE_CLASSES moves the values of style attributes used by more
+** than one element into a <style> block at the start of the <svg>, and
+** refers to them with class attributes.  The class names start with a hash
+** of the styles, so several diagrams can be embedded in the same page.
+** Ignored when the output is streamed with PikchrOpts.xWrite.
+**
+** PIKCHR_PRECISION(N) writes coordinates and distances with N decimal
+** places (0 to 6) and no trailing zeros, instead of 6 significant digits.
+*/
+#define PIKCHR_COMPACT          0x0004
+#define PIKCHR_STYLE_CLASSES    0x0008
+#define PIKCHR_PRECISION_MASK   0x0070
+#define PIKCHR_PRECISION(N)     ((((N)&7)+1)<<4)
@@ -122,6 +122,7 @@
 #include <ctype.h>
 #include <math.h>
 #include <assert.h>
+#include <time.h>
 #define count(X) (sizeof(X)/sizeof(X[0]))
 #ifndef M_PI
 # define M_PI 3.1415926535897932385
@@ -151,6 +152,14 @@ typedef struct PPoint PPoint;    /* A position in 2-D space */
 typedef struct PVar PVar;        /* script-defined variable */
 typedef struct PBox PBox;        /* A bounding box */
 typedef struct PMacro PMacro;    /* A "define" macro */
+typedef struct PName PName;      /* Entry in the name index of a PList */
+typedef struct PikchrObjTag PikchrObjTag; /* Wrapper for one rendered object */
+typedef struct PikchrOpts PikchrOpts;     /* Extra settings for pikchr_ext() */
+typedef struct PikchrErrInfo PikchrErrInfo; /* First error, for pikchr_ext() */
+typedef struct PikchrGeom PikchrGeom;     /* Geometry of a tagged object */
+typedef struct PikchrGeomList PikchrGeomList; /* All tagged geometry */
+typedef struct PikchrSvg PikchrSvg;       /* Extra SVG output */
+typedef struct PikchrStats PikchrStats;   /* Timings and counters */
 
 /* Compass points */
 #define CP_N      1
@@ -333,11 +342,26 @@ struct PObj {
   PBox bbox;               /* Bounding box */
 };
 
+/* An entry in the name index of a PList.  Each entry maps either an
+** object name (bText==0) or the content of a text label (bText==1)
+** to the index in PList.a[] of the most recent object carrying it.
+*/
+struct PName {
+  const char *z;        /* Text of the key.  Not zero-terminated */
+  unsigned int n;       /* Bytes in z[] */
+  unsigned int h;       /* Hash of the key */
+  int bText;            /* True if the key is a text label */
+  int iObj;             /* Index into PList.a[] */
+};
+
 /* A list of graphics objects */
 struct PList {
   int n;          /* Number of statements in the list */
   int nAlloc;     /* Allocated slots in a[] */
   PObj **a;       /* Pointers to individual objects */
+  int nName;      /* Number of used slots in aName[] */
+  int nNameAlloc; /* Slots in aName[].  Zero or a power of two. -1 if OOM */
+  PName *aName;   /* Open-addressing index of names and text labels */
 };
 
 /* A macro definition */
@@ -348,6 +372,86 @@ struct PMacro {
   int inUse;           /* Do not allow recursion */
 };
 
+/* Identifies a top-level or nested object in the input text so that its
+** SVG elements can be wrapped in <g data-pypikchr-id="..."> or, when zUrl
+** is not NULL, in <a href="..." data-pypikchr-id="...">.  These must
+** match the definitions in pikchr.h.
+*/
+struct PikchrObjTag {
+  unsigned int iOffset;    /* Offset in zText of the object's errTok */
+  long iId;                /* Value of the data-pypikchr-id attribute */
+  const char *zUrl;        /* Attribute-escaped URL, or NULL */
+};
+
+/* Optional settings for pikchr_ext().
+*/
+struct PikchrOpts {
+  const PikchrObjTag *aTag;  /* Object tags, sorted by iOffset */
+  int nTag;                  /* Number of entries in aTag[] */
+  unsigned int mOpts;        /* PIKCHR_OPT_* bits */
+  PikchrErrInfo *pErr;       /* OUT: Details of the first error, or NULL */
+  PikchrGeomList *pGeom;     /* OUT: Geometry of tagged objects, or NULL */
+  PikchrSvg *pDark;          /* OUT: Dark-mode copy of the SVG, or NULL */
+  unsigned int nSizeHint;    /* Initial size of the output buffer, or 0 */
+  int (*xWrite)(void*,const char*,unsigned int); /* Stream the SVG here */
+  void *pWriteArg;           /* First argument to xWrite */
+  PikchrStats *pStats;       /* OUT: Timings and counters, or NULL */
+};
+#define PIKCHR_OPT_NO_SVG 0x0001  /* Stop after layout */
+#define PIKCHR_STREAM_CHUNK 65536 /* Bytes buffered before calling xWrite */
+
+/* Extra SVG output.  Must match the definition in pikchr.h.
+*/
+struct PikchrSvg {
+  char *z;                 /* The SVG text, zero-terminated */
+  unsigned int n;          /* Length of z in bytes */
+};
+
+/* Timings and counters of one call.  Must match the definition in
+** pikchr.h.
+*/
+struct PikchrStats {
+  double rParse;           /* Seconds tokenizing, parsing and placing */
+  double rLayout;          /* Seconds computing the canvas and geometry */
+  double rRender;          /* Seconds generating the SVG */
+  double rTotal;           /* Seconds in pikchr_ext() as a whole */
+  unsigned int nToken;     /* Tokens read */
+  unsigned int nObj;       /* Objects created */
+  unsigned int nLookup;    /* Lookups of objects by name */
+  unsigned int nOut;       /* Bytes of output, including any dark copy */
+  unsigned int nRealloc;   /* Times the output buffer was grown */
+};
+
+/* Geometry of tagged objects, in SVG viewBox coordinates.  These must
+** match the definitions in pikchr.h.
+*/
+struct PikchrGeom {
+  long iId;                /* iId of the PikchrObjTag for the object */
+  double x0, y0;           /* Top-left corner of the bounding box */
+  double x1, y1;           /* Bottom-right corner of the bounding box */
+  double cx, cy;           /* Center of the object */
+  int iPath;               /* Index in aPt[] of the first path point */
+  int nPath;               /* Number of path points.  0 for block objects */
+};
+struct PikchrGeomList {
+  int nObj;                /* Number of entries in aObj[] */
+  int nObjAlloc;           /* Allocated entries in aObj[] */
+  PikchrGeom *aObj;        /* One entry per tagged object */
+  int nPt;                 /* Number of points in aPt[] */
+  int nPtAlloc;            /* Allocated points in aPt[] */
+  double *aPt;             /* Path points as x,y pairs */
+  int bOom;                /* True if an allocation failed */
+};
+
+/* Details of the first error reported to a pikchr_ext() caller.
+*/
+struct PikchrErrInfo {
+  int nErr;                /* Non-zero if an error occurred */
+  int iOffset;             /* Byte offset in zText of the error, or -1 */
+  int nLen;                /* Length in bytes of the token at iOffset */
+  char zMsg[200];          /* The error message, zero-terminated */
+};
+
 /* Each call to the pikchr() subroutine uses an instance of the following
 ** object to pass around context to all of its subroutines.
 */
@@ -358,8 +462,10 @@ struct Pik {
   char *zOut;              /* Result accumulates here */
   unsigned int nOut;       /* Bytes written to zOut[] so far */
   unsigned int nOutAlloc;  /* Space allocated to zOut[] */
+  char bStream;            /* 1 while zOut is flushed to xWrite, 2 after */
   unsigned char eDir;      /* Current direction */
   unsigned int mFlags;     /* Flags passed to pikchr() */
+  const PikchrOpts *pOpts; /* Extra settings from pikchr_ext(), or NULL */
   PObj *cur;               /* Object under construction */
   PObj *lastRef;           /* Last object references by name */
   PList *list;             /* Object list under construction */
@@ -388,6 +494,15 @@ struct Pik {
   /* Error contexts */
   unsigned int nCtx;       /* Number of error contexts */
   PToken aCtx[10];         /* Nested error contexts */
+  /* Statistics, collected for PikchrOpts.pStats */
+  unsigned int nObj;       /* Objects created */
+  unsigned int nLookup;    /* Lookups of objects by name */
+  unsigned int nRealloc;   /* Times zOut was grown */
+  unsigned int nFlushed;   /* Bytes passed to xWrite */
+  double rStart;           /* Clock when pikchr_ext() started */
+  double rLayout;          /* Clock when pik_render() started, or 0 */
+  double rRender;          /* Clock when SVG output started, or 0 */
+  double rRenderEnd;       /* Clock when SVG output ended, or 0 */
 };
 
 /* Include PIKCHR_PLAINTEXT_ERRORS among the bits of mFlags on the 3rd
@@ -400,6 +515,13 @@ struct Pik {
 */
 #define PIKCHR_DARK_MODE        0x0002
 
+/* Flags for smaller SVG output.  Must match the definitions in pikchr.h.
+*/
+#define PIKCHR_COMPACT          0x0004  /* No newlines, hex colors */
+#define PIKCHR_STYLE_CLASSES    0x0008  /* Move repeated styles to <style> */
+#define PIKCHR_PRECISION_MASK   0x0070  /* Decimal places of coordinates+1 */
+#define PIKCHR_PRECISION(N)     ((((N)&7)+1)<<4)
+
 /*
 ** The behavior of an object class is defined by an instance of
 ** this structure. This is the "virtual method" table.
@@ -420,8 +542,12 @@ struct PClass {
 
 /* Forward declarations */
 static void pik_append(Pik*, const char*,int);
+static void pik_flush(Pik*);
 static void pik_append_text(Pik*,const char*,int,int);
 static void pik_append_num(Pik*,const char*,PNum);
+static void pik_append_end(Pik*,const char*);
+static const char *pik_fmt_num(Pik*,char*,PNum);
+static void pik_merge_styles(Pik*,unsigned int);
 static void pik_append_point(Pik*,const char*,PPoint*);
 static void pik_append_x(Pik*,const char*,PNum,const char*);
 static void pik_append_y(Pik*,const char*,PNum,const char*);
@@ -438,6 +564,7 @@ static void pik_elist_free(Pik*,PList*);
 static void pik_elem_free(Pik*,PObj*);
 static void pik_render(Pik*,PList*);
 static PList *pik_elist_append(Pik*,PList*,PObj*);
+static void pik_elist_index(PList*,int);
 static PObj *pik_elem_new(Pik*,PToken*,PToken*,PList*);
 static void pik_set_direction(Pik*,int);
 static void pik_elem_setname(Pik*,PObj*,PToken*);
@@ -474,6 +601,7 @@ static void pik_bbox_add_xy(PBox*,PNum,PNum);
 static void pik_bbox_addellipse(PBox*,PNum x,PNum y,PNum rx,PNum ry);
 static void pik_add_txt(Pik*,PToken*,int);
 static int pik_text_length(const PToken *pToken, const int isMonospace);
+int pikchr_text_length(const char*,int,int);
 static void pik_size_to_fit(Pik*,PToken*,int);
 static int pik_text_position(int,PToken*);
 static PNum pik_property_of(PObj*,PToken*);
@@ -490,6 +618,11 @@ static PObj *pik_assert(Pik*,PNum,PToken*,PNum);
 static PObj *pik_position_assert(Pik*,PPoint*,PToken*,PPoint*);
 static PNum pik_dist(PPoint*,PPoint*);
 static void pik_add_macro(Pik*,PToken *pId,PToken *pCode);
+char *pikchr_ext(const char*,const char*,unsigned int,const PikchrOpts*,
+                 int*,int*,unsigned int*);
+static const PikchrObjTag *pik_find_tag(Pik*,PObj*);
+static void pik_append_tag_open(Pik*,const PikchrObjTag*);
+static void pik_elist_geom(Pik*,PList*);
 
 
 #line 521 "pikchr.c"
@@ -1266,6 +1399,8 @@ typedef struct yyParser yyParser;
 #include <assert.h>
 #ifndef NDEBUG
 #include <stdio.h>
+/* Process-wide, but only written by pik_parserTrace(), which pypikchr never
+** calls, so concurrent parses only ever read these as NULL. */
 static FILE *yyTraceFILE = 0;
 static char *yyTracePrompt = 0;
 #endif /* NDEBUG */
@@ -3652,7 +3787,7 @@ static void arcRender(Pik *p, PObj *pObj){
   pik_append_xy(p," ", t.x, t.y);
   pik_append(p,"\" ",2);
   pik_append_style(p,pObj,0);
-  pik_append(p,"\" />\n", -1);
+  pik_append_end(p,"\" />\n");
 
   pik_append_txt(p, pObj, 0);
 }
@@ -3794,7 +3929,7 @@ static void boxRender(Pik *p, PObj *pObj){
       pik_append(p,"Z\" ",-1);
     }
     pik_append_style(p,pObj,3);
-    pik_append(p,"\" />\n", -1);
+    pik_append_end(p,"\" />\n");
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -3857,7 +3992,7 @@ static void circleRender(Pik *p, PObj *pObj){
     pik_append_y(p," cy=\"", pt.y, "\"");
     pik_append_dis(p," r=\"", r, "\" ");
     pik_append_style(p,pObj,3);
-    pik_append(p,"\" />\n", -1);
+    pik_append_end(p,"\" />\n");
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -3892,7 +4027,7 @@ static void cylinderRender(Pik *p, PObj *pObj){
     pik_append_arc(p,w2,rad,pt.x+w2,pt.y+h2-rad);
     pik_append(p,"\" ",-1);
     pik_append_style(p,pObj,3);
-    pik_append(p,"\" />\n", -1);
+    pik_append_end(p,"\" />\n");
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -3954,7 +4089,7 @@ static void dotRender(Pik *p, PObj *pObj){
     pik_append_y(p," cy=\"", pt.y, "\"");
     pik_append_dis(p," r=\"", r, "\"");
     pik_append_style(p,pObj,2);
-    pik_append(p,"\" />\n", -1);
+    pik_append_end(p,"\" />\n");
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -4013,7 +4148,7 @@ static void ellipseRender(Pik *p, PObj *pObj){
     pik_append_dis(p," rx=\"", w/2.0, "\"");
     pik_append_dis(p," ry=\"", h/2.0, "\" ");
     pik_append_style(p,pObj,3);
-    pik_append(p,"\" />\n", -1);
+    pik_append_end(p,"\" />\n");
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -4072,13 +4207,13 @@ static void fileRender(Pik *p, PObj *pObj){
     pik_append_xy(p,"L", pt.x-w2,pt.y+h2);
     pik_append(p,"Z\" ",-1);
     pik_append_style(p,pObj,1);
-    pik_append(p,"\" />\n",-1);
+    pik_append_end(p,"\" />\n");
     pik_append_xy(p,"<path d=\"M", pt.x+(w2-rad), pt.y+h2);
     pik_append_xy(p,"L", pt.x+(w2-rad),pt.y+(h2-rad));
     pik_append_xy(p,"L", pt.x+w2, pt.y+(h2-rad));
     pik_append(p,"\" ",-1);
     pik_append_style(p,pObj,0);
-    pik_append(p,"\" />\n",-1);
+    pik_append_end(p,"\" />\n");
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -4108,6 +4243,10 @@ static void lineRender(Pik *p, PObj *pObj){
   if( pObj->sw>0.0 ){
     const char *z = "<path d=\"M";
     int n = pObj->nPath;
+    /* Arrowheads chop the ends of the path.  Restore them afterwards so
+    ** that the objects can be rendered more than once. */
+    PPoint ptFirst = pObj->aPath[0];
+    PPoint ptLast = pObj->aPath[n-1];
     if( pObj->larrow ){
       pik_draw_arrowhead(p,&pObj->aPath[1],&pObj->aPath[0],pObj);
     }
@@ -4125,7 +4264,9 @@ static void lineRender(Pik *p, PObj *pObj){
     }
     pik_append(p,"\" ",-1);
     pik_append_style(p,pObj,pObj->bClose?3:0);
-    pik_append(p,"\" />\n", -1);
+    pik_append_end(p,"\" />\n");
+    pObj->aPath[0] = ptFirst;
+    pObj->aPath[n-1] = ptLast;
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -4225,16 +4366,19 @@ static void radiusPath(Pik *p, PObj *pObj, PNum r){
   }
   pik_append(p,"\" ",-1);
   pik_append_style(p,pObj,pObj->bClose?3:0);
-  pik_append(p,"\" />\n", -1);
+  pik_append_end(p,"\" />\n");
 }
 static void splineRender(Pik *p, PObj *pObj){
   if( pObj->sw>0.0 ){
     int n = pObj->nPath;
     PNum r = pObj->rad;
+    PPoint ptFirst, ptLast;
     if( n<3 || r<=0.0 ){
       lineRender(p,pObj);
       return;
     }
+    ptFirst = pObj->aPath[0];
+    ptLast = pObj->aPath[n-1];
     if( pObj->larrow ){
       pik_draw_arrowhead(p,&pObj->aPath[1],&pObj->aPath[0],pObj);
     }
@@ -4242,6 +4386,8 @@ static void splineRender(Pik *p, PObj *pObj){
       pik_draw_arrowhead(p,&pObj->aPath[n-2],&pObj->aPath[n-1],pObj);
     }
     radiusPath(p,pObj,pObj->rad);
+    pObj->aPath[0] = ptFirst;
+    pObj->aPath[n-1] = ptLast;
   }
   pik_append_txt(p, pObj, 0);
 }
@@ -4506,7 +4652,8 @@ static void pik_draw_arrowhead(Pik *p, PPoint *f, PPoint *t, PObj *pObj){
   pik_append_xy(p,"<polygon points=\"", t->x, t->y);
   pik_append_xy(p," ",bx-ddx, by-ddy);
   pik_append_xy(p," ",bx+ddx, by+ddy);
-  pik_append_clr(p,"\" style=\"fill:",pObj->color,"\"/>\n",0);
+  pik_append_clr(p,"\" style=\"fill:",pObj->color,"\"/>",0);
+  pik_append_end(p,"\n");
   pik_chop(f,t,h/2);
 }
 
@@ -4524,6 +4671,9 @@ static PPoint pik_elem_offset(Pik *p, PObj *pObj, int cp){
 */
 static void pik_append(Pik *p, const char *zText, int n){
   if( n<0 ) n = (int)strlen(zText);
+  if( p->bStream==1 && p->nOut+n>=p->nOutAlloc ){
+    pik_flush(p);
+  }
   if( p->nOut+n>=p->nOutAlloc ){
     int nNew = (p->nOut+n)*2 + 1;
     char *z = realloc(p->zOut, nNew);
@@ -4533,12 +4683,27 @@ static void pik_append(Pik *p, const char *zText, int n){
     }
     p->zOut = z;
     p->nOutAlloc = nNew;
+    p->nRealloc++;
   }
   memcpy(p->zOut+p->nOut, zText, n);
   p->nOut += n;
   p->zOut[p->nOut] = 0;
 }
 
+/*
+** Pass the buffered output to pOpts->xWrite and empty the buffer.  If
+** the write fails, streaming stops and an error is reported.
+*/
+static void pik_flush(Pik *p){
+  unsigned int n = p->nOut;
+  p->nOut = 0;
+  p->nFlushed += n;
+  if( n>0 && p->pOpts->xWrite(p->pOpts->pWriteArg, p->zOut, n) ){
+    p->bStream = 0;
+    pik_error(p, 0, "unable to write the output");
+  }
+}
+
 /*
 ** Given a string and its length, returns true if the string begins
 ** with a construct which syntactically matches an HTML entity escape
@@ -4632,6 +4797,11 @@ static void pik_append_errtxt(Pik *p, const char *zText, int n){
 */
 static void pik_append_num(Pik *p, const char *z,PNum v){
   char buf[100];
+  if( p->mFlags & PIKCHR_PRECISION_MASK ){
+    pik_append(p, z, -1);
+    pik_append(p, pik_fmt_num(p, buf, v), -1);
+    return;
+  }
   snprintf(buf, sizeof(buf)-1, "%.10g", (double)v);
   buf[sizeof(buf)-1] = 0;
   pik_append(p, z, -1);
@@ -4687,38 +4857,77 @@ static int pik_color_to_dark_mode(int x, int isBg){
   return r*0x10000 + g*0x100 + b;
 }
 
+/* Format a coordinate or distance into buf, which holds at least 40 bytes.
+** Numbers have 6 significant digits, or a fixed number of decimal places
+** without trailing zeros if PIKCHR_PRECISION() is among the mFlags.
+*/
+static const char *pik_fmt_num(Pik *p, char *buf, PNum v){
+  int nDigit = (int)((p->mFlags & PIKCHR_PRECISION_MASK)>>4) - 1;
+  int n;
+  if( nDigit<0 || v>1e15 || v<-1e15 ){
+    snprintf(buf, 40, "%g", v);
+    return buf;
+  }
+  n = snprintf(buf, 40, "%.*f", nDigit, v);
+  if( nDigit>0 ){
+    while( buf[n-1]=='0' ) n--;
+    if( buf[n-1]=='.' ) n--;
+    buf[n] = 0;
+  }
+  if( strcmp(buf, "-0")==0 ) return "0";
+  return buf;
+}
+
 /* Append a PNum value surrounded by text.  Do coordinate transformations
 ** on the value.
 */
 static void pik_append_x(Pik *p, const char *z1, PNum v, const char *z2){
-  char buf[200];
+  char buf[200], num[40];
   v -= p->bbox.sw.x;
-  snprintf(buf, sizeof(buf)-1, "%s%g%s", z1, p->rScale*v, z2);
+  snprintf(buf, sizeof(buf)-1, "%s%s%s", z1, pik_fmt_num(p,num,p->rScale*v), z2);
   buf[sizeof(buf)-1] = 0;
   pik_append(p, buf, -1);
 }
 static void pik_append_y(Pik *p, const char *z1, PNum v, const char *z2){
-  char buf[200];
+  char buf[200], num[40];
   v = p->bbox.ne.y - v;
-  snprintf(buf, sizeof(buf)-1, "%s%g%s", z1, p->rScale*v, z2);
+  snprintf(buf, sizeof(buf)-1, "%s%s%s", z1, pik_fmt_num(p,num,p->rScale*v), z2);
   buf[sizeof(buf)-1] = 0;
   pik_append(p, buf, -1);
 }
 static void pik_append_xy(Pik *p, const char *z1, PNum x, PNum y){
-  char buf[200];
+  char buf[200], nx[40], ny[40];
   x = x - p->bbox.sw.x;
   y = p->bbox.ne.y - y;
-  snprintf(buf, sizeof(buf)-1, "%s%g,%g", z1, p->rScale*x, p->rScale*y);
+  snprintf(buf, sizeof(buf)-1, "%s%s,%s", z1, pik_fmt_num(p,nx,p->rScale*x),
+           pik_fmt_num(p,ny,p->rScale*y));
   buf[sizeof(buf)-1] = 0;
   pik_append(p, buf, -1);
 }
 static void pik_append_dis(Pik *p, const char *z1, PNum v, const char *z2){
-  char buf[200];
-  snprintf(buf, sizeof(buf)-1, "%s%g%s", z1, p->rScale*v, z2);
+  char buf[200], num[40];
+  snprintf(buf, sizeof(buf)-1, "%s%s%s", z1, pik_fmt_num(p,num,p->rScale*v), z2);
   buf[sizeof(buf)-1] = 0;
   pik_append(p, buf, -1);
 }
 
+/* Append the end of an SVG element, given as it appears in the normal
+** output.  In PIKCHR_COMPACT mode the trailing newline, and the space
+** before "/>", are left out.
+*/
+static void pik_append_end(Pik *p, const char *z){
+  int n = (int)strlen(z);
+  if( p->mFlags & PIKCHR_COMPACT ){
+    if( n>0 && z[n-1]=='\n' ) n--;
+    if( n>=3 && memcmp(z+n-3, " />", 3)==0 ){
+      pik_append(p, z, n-3);
+      pik_append(p, "/>", 2);
+      return;
+    }
+  }
+  pik_append(p, z, n);
+}
+
 /* Append a color specification to the output.
 **
 ** In PIKCHR_DARK_MODE, the color is inverted.  The "bg" flags indicates that
@@ -4740,7 +4949,13 @@ static void pik_append_clr(Pik *p,const char *z1,PNum v,const char *z2,int bg){
   r = (x>>16) & 0xff;
   g = (x>>8) & 0xff;
   b = x & 0xff;
-  snprintf(buf, sizeof(buf)-1, "%srgb(%d,%d,%d)%s", z1, r, g, b, z2);
+  if( (p->mFlags & PIKCHR_COMPACT)==0 ){
+    snprintf(buf, sizeof(buf)-1, "%srgb(%d,%d,%d)%s", z1, r, g, b, z2);
+  }else if( r%17==0 && g%17==0 && b%17==0 ){
+    snprintf(buf, sizeof(buf)-1, "%s#%x%x%x%s", z1, r/17, g/17, b/17, z2);
+  }else{
+    snprintf(buf, sizeof(buf)-1, "%s#%02x%02x%02x%s", z1, r, g, b, z2);
+  }
   buf[sizeof(buf)-1] = 0;
   pik_append(p, buf, -1);
 }
@@ -4750,12 +4965,12 @@ static void pik_append_clr(Pik *p,const char *z1,PNum v,const char *z2,int bg){
 **    A r1 r2 0 0 0 x y
 */
 static void pik_append_arc(Pik *p, PNum r1, PNum r2, PNum x, PNum y){
-  char buf[200];
+  char buf[200], n1[40], n2[40], nx[40], ny[40];
   x = x - p->bbox.sw.x;
   y = p->bbox.ne.y - y;
-  snprintf(buf, sizeof(buf)-1, "A%g %g 0 0 0 %g %g", 
-     p->rScale*r1, p->rScale*r2,
-     p->rScale*x, p->rScale*y);
+  snprintf(buf, sizeof(buf)-1, "A%s %s 0 0 0 %s %s",
+     pik_fmt_num(p,n1,p->rScale*r1), pik_fmt_num(p,n2,p->rScale*r2),
+     pik_fmt_num(p,nx,p->rScale*x), pik_fmt_num(p,ny,p->rScale*y));
   buf[sizeof(buf)-1] = 0;
   pik_append(p, buf, -1);
 }
@@ -4773,7 +4988,11 @@ static void pik_append_arc(Pik *p, PNum r1, PNum r2, PNum x, PNum y){
 */
 static void pik_append_style(Pik *p, PObj *pObj, int eFill){
   int clrIsBg = 0;
-  pik_append(p, " style=\"", -1);
+  if( (p->mFlags & PIKCHR_COMPACT)!=0 && p->nOut>0 && p->zOut[p->nOut-1]==' ' ){
+    pik_append(p, "style=\"", -1);
+  }else{
+    pik_append(p, " style=\"", -1);
+  }
   if( pObj->fill>=0 && eFill ){
     int fillIsBg = 1;
     if( pObj->fill==pObj->color ){
@@ -5093,7 +5312,7 @@ static void pik_append_txt(Pik *p, PObj *pObj, PBox *pBox){
       nz -= j+1;
       z += j+1;
     }
-    pik_append(p, "</text>\n", -1);
+    pik_append_end(p, "</text>\n");
   }
 }
 
@@ -5165,6 +5384,18 @@ static void pik_error(Pik *p, PToken *pErr, const char *zMsg){
   if( p==0 ) return;
   if( p->nErr ) return;
   p->nErr++;
+  if( p->pOpts && p->pOpts->pErr ){
+    PikchrErrInfo *pInfo = p->pOpts->pErr;
+    pInfo->nErr = 1;
+    pInfo->iOffset = -1;
+    pInfo->nLen = 0;
+    snprintf(pInfo->zMsg, sizeof(pInfo->zMsg), "%s",
+             zMsg ? zMsg : "Out of memory");
+    if( pErr && pErr->z>=p->sIn.z && pErr->z<=p->sIn.z+p->sIn.n ){
+      pInfo->iOffset = (int)(pErr->z - p->sIn.z);
+      pInfo->nLen = (int)pErr->n;
+    }
+  }
   if( zMsg==0 ){
     if( p->mFlags & PIKCHR_PLAINTEXT_ERRORS ){
       pik_append(p, "\nOut of memory\n", -1);
@@ -5236,6 +5467,7 @@ static void pik_elist_free(Pik *p, PList *pList){
     pik_elem_free(p, pList->a[i]);
   }
   free(pList->a);
+  free(pList->aName);
   free(pList);
   return;
 }
@@ -5374,6 +5606,124 @@ static void pik_bbox_addellipse(PBox *pA, PNum x, PNum y, PNum rx, PNum ry){
 
 
 
+/* Hash a name or text label for the PList name index. (FNV-1a)
+*/
+static unsigned int pik_name_hash(const char *z, unsigned int n, int bText){
+  unsigned int h = bText ? 0x811c9dc5 : 0x01000193;
+  unsigned int i;
+  for(i=0; i<n; i++){
+    h ^= (unsigned char)z[i];
+    h *= 0x01000193;
+  }
+  return h;
+}
+
+/* Return the slot in pList->aName[] that holds the given key, or
+** the empty slot where it would be inserted.  The index must exist.
+*/
+static PName *pik_name_slot(
+  PList *pList,
+  const char *z,
+  unsigned int n,
+  unsigned int h,
+  int bText
+){
+  unsigned int mask = (unsigned int)pList->nNameAlloc - 1;
+  unsigned int i = h & mask;
+  while( pList->aName[i].z ){
+    PName *pE = &pList->aName[i];
+    if( pE->h==h && pE->bText==bText && pE->n==n && memcmp(pE->z,z,n)==0 ){
+      break;
+    }
+    i = (i+1) & mask;
+  }
+  return &pList->aName[i];
+}
+
+/* Record that object pList->a[iObj] carries key z[0..n-1].  Later
+** objects overwrite earlier ones so that the most recent object wins,
+** matching the reverse scan order of pik_find_byname().  Return zero
+** if the index could not be grown.
+*/
+static int pik_name_insert(
+  PList *pList,
+  const char *z,
+  unsigned int n,
+  int bText,
+  int iObj
+){
+  unsigned int h = pik_name_hash(z, n, bText);
+  PName *pE;
+  if( (pList->nName+1)*2 > pList->nNameAlloc ){
+    int nNew = pList->nNameAlloc ? pList->nNameAlloc*2 : 32;
+    PName *aOld = pList->aName;
+    int nOld = pList->nNameAlloc;
+    int i;
+    pList->aName = calloc(nNew, sizeof(PName));
+    if( pList->aName==0 ){
+      pList->aName = aOld;
+      return 0;
+    }
+    pList->nNameAlloc = nNew;
+    for(i=0; i<nOld; i++){
+      if( aOld[i].z ){
+        *pik_name_slot(pList, aOld[i].z, aOld[i].n, aOld[i].h,
+                       aOld[i].bText) = aOld[i];
+      }
+    }
+    free(aOld);
+  }
+  pE = pik_name_slot(pList, z, n, h, bText);
+  if( pE->z==0 ){
+    pE->z = z;
+    pE->n = n;
+    pE->h = h;
+    pE->bText = bText;
+    pList->nName++;
+  }
+  pE->iObj = iObj;
+  return 1;
+}
+
+/* Add the name and text labels of pList->a[iObj] to the name index.
+** If memory runs out, the index is dropped and pik_find_byname()
+** falls back to scanning the list.
+*/
+static void pik_elist_index(PList *pList, int iObj){
+  PObj *pObj = pList->a[iObj];
+  int j, ok = 1;
+  if( pList->nNameAlloc<0 ) return;
+  if( pObj->zName ){
+    ok = pik_name_insert(pList, pObj->zName,
+                         (unsigned int)strlen(pObj->zName), 0, iObj);
+  }
+  for(j=0; ok && j<pObj->nTxt; j++){
+    if( pObj->aTxt[j].n<2 ) continue;
+    ok = pik_name_insert(pList, pObj->aTxt[j].z+1, pObj->aTxt[j].n-2, 1, iObj);
+  }
+  if( !ok ){
+    free(pList->aName);
+    pList->aName = 0;
+    pList->nName = 0;
+    pList->nNameAlloc = -1;
+  }
+}
+
+/* Look up a key in the name index of pList.  Return the most recent
+** object carrying it, or NULL.
+*/
+static PObj *pik_name_find(
+  PList *pList,
+  const char *z,
+  unsigned int n,
+  int bText
+){
+  PName *pE;
+  if( pList->nNameAlloc<=0 ) return 0;
+  pE = pik_name_slot(pList, z, n, pik_name_hash(z, n, bText), bText);
+  return pE->z ? pList->a[pE->iObj] : 0;
+}
+
 /* Append a new object onto the end of an object list.  The
 ** object list is created if it does not already exist.  Return
 ** the new object list.
@@ -5401,6 +5751,7 @@ static PList *pik_elist_append(Pik *p, PList *pList, PObj *pObj){
     pList->a = pNew;
   }
   pList->a[pList->n++] = pObj;
+  pik_elist_index(pList, pList->n-1);
   p->list = pList;
   return pList;
 }
@@ -5446,6 +5797,7 @@ static PObj *pik_elem_new(Pik *p, PToken *pId, PToken *pStr,PList *pSublist){
   }
   memset(pNew, 0, sizeof(*pNew));
   p->cur = pNew;
+  p->nObj++;
   p->nTPath = 1;
   p->thenFlag = 0;
   if( p->list==0 || p->list->n==0 ){
@@ -6016,7 +6368,7 @@ static void pik_behind(Pik *p, PObj *pOther){
 */
 static void pik_set_at(Pik *p, PToken *pEdge, PPoint *pAt, PToken *pErrTok){
   PObj *pObj;
-  static unsigned char eDirToCp[] = { CP_E, CP_S, CP_W, CP_N };
+  static const unsigned char eDirToCp[] = { CP_E, CP_S, CP_W, CP_N };
   if( p->nErr ) return;
   pObj = p->cur;
 
@@ -6205,11 +6557,17 @@ static const unsigned char awChar[] = {
 **
 */
 static int pik_text_length(const PToken *pToken, const int isMonospace){
+  return pikchr_text_length(pToken->z+1, pToken->n-2, isMonospace);
+}
+
+/* Same as pik_text_length() for the n bytes of text at z, without the
+** enclosing quotes.  z[n] must be readable: it is the closing quote of a
+** token, or the zero terminator of a string.
+*/
+int pikchr_text_length(const char *z, int n, int isMonospace){
   const int stdAvg=100, monoAvg=82;
-  int n = pToken->n;
-  const char *z = pToken->z;
   int cnt, j;
-  for(j=1, cnt=0; j<n-1; j++){
+  for(j=0, cnt=0; j<n; j++){
     char c = z[j];
     if( c=='\\' && z[j+1]!='&' ){
       c = z[++j];
@@ -6221,7 +6579,7 @@ static int pik_text_length(const PToken *pToken, const int isMonospace){
       continue;
     }
     if( (c & 0xc0)==0xc0 ){
-      while( j+1<n-1 && (z[j+1]&0xc0)==0x80 ){ j++; }
+      while( j+1<n && (z[j+1]&0xc0)==0x80 ){ j++; }
       cnt += isMonospace ? monoAvg : stdAvg;
       continue;
     }
@@ -6518,6 +6876,7 @@ static PObj *pik_find_nth(Pik *p, PObj *pBasis, PToken *pNth){
 static PObj *pik_find_byname(Pik *p, PObj *pBasis, PToken *pName){
   PList *pList;
   int i, j;
+  p->nLookup++;
   if( pBasis==0 ){
     pList = p->list;
   }else{
@@ -6527,6 +6886,18 @@ static PObj *pik_find_byname(Pik *p, PObj *pBasis, PToken *pName){
     pik_error(p, pName, "no such object");
     return 0;
   }
+  if( pList->nNameAlloc>=0 ){
+    /* Use the name index, which is kept up to date as objects are
+    ** appended.  Tagged names take precedence over text labels. */
+    PObj *pObj = pik_name_find(pList, pName->z, pName->n, 0);
+    if( pObj==0 ) pObj = pik_name_find(pList, pName->z, pName->n, 1);
+    if( pObj ){
+      p->lastRef = pObj;
+      return pObj;
+    }
+    pik_error(p, pName, "no such object");
+    return 0;
+  }
   /* First look explicitly tagged objects */
   for(i=pList->n-1; i>=0; i--){
     PObj *pObj = pList->a[i];
@@ -6963,6 +7334,123 @@ static void pik_elem_render(Pik *p, PObj *pObj){
   pik_append(p, " -->\n", -1);
 }
 
+/* Return the PikchrObjTag for pObj, if the caller of pikchr_ext()
+** supplied one, or NULL.  Tags are matched on the offset of the
+** object's errTok, which is the class name of ordinary objects and
+** the closing "]" of a [...] sublist.
+*/
+static const PikchrObjTag *pik_find_tag(Pik *p, PObj *pObj){
+  const PikchrObjTag *aTag;
+  unsigned int iOff;
+  int lo, hi;
+  if( p->pOpts==0 || p->pOpts->nTag<=0 ) return 0;
+  if( pObj->errTok.z<p->sIn.z || pObj->errTok.z>=p->sIn.z+p->sIn.n ){
+    return 0;
+  }
+  iOff = (unsigned int)(pObj->errTok.z - p->sIn.z);
+  aTag = p->pOpts->aTag;
+  lo = 0;
+  hi = p->pOpts->nTag - 1;
+  while( lo<=hi ){
+    int mid = lo + (hi-lo)/2;
+    if( aTag[mid].iOffset==iOff ) return &aTag[mid];
+    if( aTag[mid].iOffset<iOff ){
+      lo = mid + 1;
+    }else{
+      hi = mid - 1;
+    }
+  }
+  return 0;
+}
+
+/* Open the <g> or <a> element that wraps the SVG of a tagged object
+*/
+static void pik_append_tag_open(Pik *p, const PikchrObjTag *pTag){
+  char buf[40];
+  if( pTag->zUrl ){
+    pik_append(p, "<a href=\"", -1);
+    pik_append(p, pTag->zUrl, -1);
+    pik_append(p, "\" ", 2);
+  }else{
+    pik_append(p, "<g ", 3);
+  }
+  snprintf(buf, sizeof(buf), "data-pypikchr-id=\"%ld\">\n", pTag->iId);
+  pik_append_end(p, buf);
+}
+
+/* Record the geometry of pObj, tagged by pTag, in p->pOpts->pGeom
+*/
+static void pik_add_geom(Pik *p, PObj *pObj, const PikchrObjTag *pTag){
+  PikchrGeomList *pOut = p->pOpts->pGeom;
+  PikchrGeom *pGeom;
+  int i;
+  if( pOut->bOom ) return;
+  if( pOut->nObj>=pOut->nObjAlloc ){
+    int nNew = pOut->nObjAlloc ? pOut->nObjAlloc*2 : 64;
+    PikchrGeom *aNew = realloc(pOut->aObj, nNew*sizeof(PikchrGeom));
+    if( aNew==0 ){ pOut->bOom = 1; return; }
+    pOut->aObj = aNew;
+    pOut->nObjAlloc = nNew;
+  }
+  if( pObj->type->isLine && pObj->nPath>0 ){
+    if( pOut->nPt+pObj->nPath>pOut->nPtAlloc ){
+      int nNew = pOut->nPtAlloc*2 + pObj->nPath + 64;
+      double *aNew = realloc(pOut->aPt, nNew*2*sizeof(double));
+      if( aNew==0 ){ pOut->bOom = 1; return; }
+      pOut->aPt = aNew;
+      pOut->nPtAlloc = nNew;
+    }
+  }
+  pGeom = &pOut->aObj[pOut->nObj++];
+  pGeom->iId = pTag->iId;
+  /* Same transformation as pik_append_xy() */
+  pGeom->x0 = p->rScale*(pObj->bbox.sw.x - p->bbox.sw.x);
+  pGeom->y0 = p->rScale*(p->bbox.ne.y - pObj->bbox.ne.y);
+  pGeom->x1 = p->rScale*(pObj->bbox.ne.x - p->bbox.sw.x);
+  pGeom->y1 = p->rScale*(p->bbox.ne.y - pObj->bbox.sw.y);
+  pGeom->cx = p->rScale*(pObj->ptAt.x - p->bbox.sw.x);
+  pGeom->cy = p->rScale*(p->bbox.ne.y - pObj->ptAt.y);
+  pGeom->iPath = pOut->nPt;
+  pGeom->nPath = 0;
+  if( pObj->type->isLine ){
+    for(i=0; i<pObj->nPath; i++){
+      double *pPt = &pOut->aPt[2*pOut->nPt++];
+      pPt[0] = p->rScale*(pObj->aPath[i].x - p->bbox.sw.x);
+      pPt[1] = p->rScale*(p->bbox.ne.y - pObj->aPath[i].y);
+    }
+    pGeom->nPath = pObj->nPath;
+  }
+}
+
+/* Record the geometry of the tagged objects in a list, in the same
+** order as pik_elist_render() draws them
+*/
+static void pik_elist_geom(Pik *p, PList *pList){
+  int i;
+  int iNextLayer = 0;
+  int iThisLayer;
+  int bMoreToDo;
+  const PikchrObjTag *pTag;
+  do{
+    bMoreToDo = 0;
+    iThisLayer = iNextLayer;
+    iNextLayer = 0x7fffffff;
+    for(i=0; i<pList->n; i++){
+      PObj *pObj = pList->a[i];
+      if( pObj->iLayer>iThisLayer ){
+        if( pObj->iLayer<iNextLayer ) iNextLayer = pObj->iLayer;
+        bMoreToDo = 1;
+        continue;
+      }else if( pObj->iLayer<iThisLayer ){
+        continue;
+      }
+      pTag = pik_find_tag(p, pObj);
+      if( pTag ) pik_add_geom(p, pObj, pTag);
+      if( pObj->pSublist ) pik_elist_geom(p, pObj->pSublist);
+    }
+  }while( bMoreToDo );
+}
+
 /* Render a list of objects
 */
 void pik_elist_render(Pik *p, PList *pList){
@@ -6973,6 +7461,7 @@ void pik_elist_render(Pik *p, PList *pList){
   int miss = 0;
   int mDebug = pik_value_int(p, "debug", 5, 0);
   PNum colorLabel;
+  const PikchrObjTag *pTag;
   do{
     bMoreToDo = 0;
     iThisLayer = iNextLayer;
@@ -6988,6 +7477,8 @@ void pik_elist_render(Pik *p, PList *pList){
         continue;
       }
       if( mDebug & 1 ) pik_elem_render(p, pObj);
+      pTag = pik_find_tag(p, pObj);
+      if( pTag ) pik_append_tag_open(p, pTag);
       xRender = pObj->type->xRender;
       if( xRender ){
         xRender(p, pObj);
@@ -6995,6 +7486,7 @@ void pik_elist_render(Pik *p, PList *pList){
       if( pObj->pSublist ){
         pik_elist_render(p, pObj->pSublist);
       }
+      if( pTag ) pik_append_end(p, pTag->zUrl ? "</a>\n" : "</g>\n");
     }
   }while( bMoreToDo );
 
@@ -7068,17 +7560,235 @@ static void pik_compute_layout_settings(Pik *p){
   p->bLayoutVars = 1;
 }
 
+/* Return a monotonic clock reading in seconds, for PikchrStats.
+*/
+static double pik_clock(void){
+#if defined(_WIN32)
+  struct timespec ts;
+  timespec_get(&ts, TIME_UTC);
+#else
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+#endif
+  return (double)ts.tv_sec + 1e-9*(double)ts.tv_nsec;
+}
+
+/* One style="..." attribute found by pik_merge_styles().
+*/
+typedef struct PStyleAttr PStyleAttr;
+struct PStyleAttr {
+  unsigned int iOfst;      /* Offset in zOut of the "s" of style="..." */
+  unsigned int nVal;       /* Length of the value between the quotes */
+  int iFirst;              /* Index of the first attribute with this value */
+  int nUse;                /* Uses of the value, on the first attribute */
+  int iClass;              /* Class number of the value, or -1 */
+};
+
+/* Replace the style="..." attributes of the <svg> element starting at
+** zOut[iStart] whose values occur more than once by class="..." and
+** define the classes in a <style> block at the start of the <svg>.  The
+** class names start with a hash of the merged styles, so that different
+** diagrams on the same page do not override each other's classes.
+*/
+static void pik_merge_styles(Pik *p, unsigned int iStart){
+  char *z = p->zOut;
+  unsigned int n = p->nOut;
+  unsigned int i, j;
+  int nAttr = 0, nAlloc = 0, nClass = 0;
+  int *aHash = 0;
+  int nHash;
+  PStyleAttr *aAttr = 0;
+  char inTag = 0, cQuote = 0;
+  unsigned int h;
+  char zPrefix[12];
+  char *zNew;
+  unsigned int nNew, nNewAlloc, nBlock = 0, iBody = 0;
+  int bNewline = (p->mFlags & PIKCHR_COMPACT)==0;
+
+  if( p->nErr || z==0 ) return;
+  /* Find style attributes inside of tags */
+  for(i=iStart; i<n; i++){
+    char c = z[i];
+    if( !inTag ){
+      if( c=='<' ) inTag = 1;
+    }else if( cQuote ){
+      if( c==cQuote ) cQuote = 0;
+    }else if( c=='>' ){
+      inTag = 0;
+      if( iBody==0 ) iBody = i+1;
+    }else if( c=='"' || c=='\'' ){
+      cQuote = c;
+    }else if( c=='s' && z[i-1]==' ' && strncmp(z+i, "style=\"", 7)==0 ){
+      for(j=i+7; j<n && z[j]!='"'; j++){}
+      if( j>=n ) break;
+      if( nAttr>=nAlloc ){
+        PStyleAttr *aNew;
+        nAlloc = nAlloc*2 + 64;
+        aNew = realloc(aAttr, nAlloc*sizeof(aAttr[0]));
+        if( aNew==0 ){ free(aAttr); pik_error(p, 0, 0); return; }
+        aAttr = aNew;
+      }
+      aAttr[nAttr].iOfst = i;
+      aAttr[nAttr].nVal = j - (i+7);
+      aAttr[nAttr].iFirst = nAttr;
+      aAttr[nAttr].nUse = 0;
+      aAttr[nAttr].iClass = -1;
+      nAttr++;
+      i = j;
+    }
+  }
+  if( nAttr<2 || iBody==0 ){
+    free(aAttr);
+    return;
+  }
+
+  /* Count the uses of each distinct value */
+  for(nHash=64; nHash<2*nAttr; nHash*=2){}
+  aHash = malloc(nHash*sizeof(int));
+  if( aHash==0 ){ free(aAttr); pik_error(p, 0, 0); return; }
+  memset(aHash, 0xff, nHash*sizeof(int));
+  for(i=0; i<(unsigned)nAttr; i++){
+    PStyleAttr *a = &aAttr[i];
+    const char *zVal = z + a->iOfst + 7;
+    for(h=2166136261u, j=0; j<a->nVal; j++){ h = (h ^ (unsigned char)zVal[j])*16777619u; }
+    for(j=h & (nHash-1); aHash[j]>=0; j=(j+1) & (nHash-1)){
+      PStyleAttr *b = &aAttr[aHash[j]];
+      if( b->nVal==a->nVal && memcmp(z+b->iOfst+7, zVal, a->nVal)==0 ) break;
+    }
+    if( aHash[j]<0 ) aHash[j] = (int)i;
+    a->iFirst = aHash[j];
+    aAttr[a->iFirst].nUse++;
+  }
+  free(aHash);
+
+  /* Number the repeated values and hash them into the class prefix */
+  h = 2166136261u;
+  for(i=0; i<(unsigned)nAttr; i++){
+    PStyleAttr *a = &aAttr[i];
+    if( a->iFirst!=(int)i || a->nUse<2 ) continue;
+    a->iClass = nClass++;
+    for(j=0; j<=a->nVal; j++){
+      h = (h ^ (unsigned char)z[a->iOfst+7+j])*16777619u;
+    }
+    nBlock += a->nVal + 20;
+  }
+  if( nClass==0 ){
+    free(aAttr);
+    return;
+  }
+  snprintf(zPrefix, sizeof(zPrefix), "p%06x", (h ^ (h>>24)) & 0xffffff);
+
+  /* Write the new output: the <svg> tag, the <style> block, then the body
+  ** with the merged attributes replaced */
+  nNewAlloc = n + nBlock + 16*nAttr + 40;
+  zNew = malloc(nNewAlloc);
+  if( zNew==0 ){ free(aAttr); pik_error(p, 0, 0); return; }
+  memcpy(zNew, z, iBody);
+  nNew = iBody;
+  if( bNewline ) zNew[nNew++] = '\n';
+  memcpy(zNew+nNew, "<style>", 7);
+  nNew += 7;
+  for(i=0; i<(unsigned)nAttr; i++){
+    PStyleAttr *a = &aAttr[i];
+    if( a->iClass<0 ) continue;
+    nNew += (unsigned)snprintf(zNew+nNew, nNewAlloc-nNew, ".%s%d{",
+                               zPrefix, a->iClass);
+    memcpy(zNew+nNew, z+a->iOfst+7, a->nVal);
+    nNew += a->nVal;
+    zNew[nNew++] = '}';
+  }
+  memcpy(zNew+nNew, "</style>", 8);
+  nNew += 8;
+  j = iBody;
+  for(i=0; i<(unsigned)nAttr; i++){
+    PStyleAttr *a = &aAttr[i];
+    int iClass = aAttr[a->iFirst].iClass;
+    if( iClass<0 ) continue;
+    memcpy(zNew+nNew, z+j, a->iOfst-j);
+    nNew += a->iOfst - j;
+    nNew += (unsigned)snprintf(zNew+nNew, nNewAlloc-nNew, "class=\"%s%d\"",
+                               zPrefix, iClass);
+    j = a->iOfst + 7 + a->nVal + 1;
+  }
+  memcpy(zNew+nNew, z+j, n-j);
+  nNew += n-j;
+  zNew[nNew] = 0;
+  free(aAttr);
+  free(p->zOut);
+  p->zOut = zNew;
+  p->nOut = nNew;
+  p->nOutAlloc = nNewAlloc;
+}
+
+/* Write the <svg> element for the laid out objects into p->zOut.
+*/
+static void pik_render_svg(Pik *p, PList *pList, PNum w, PNum h, int bScaled){
+  unsigned int iSvg = p->nOut;
+  pik_append(p, "<svg xmlns='http://www.w3.org/2000/svg'",-1);
+  if( p->zClass ){
+    pik_append(p, " class=\"", -1);
+    pik_append(p, p->zClass, -1);
+    pik_append(p, "\"", 1);
+  }
+  if( bScaled ){
+    pik_append_num(p, " width=\"", p->wSVG);
+    pik_append_num(p, "\" height=\"", p->hSVG);
+    pik_append(p, "\"", 1);
+  }
+  pik_append_dis(p, " viewBox=\"0 0 ",w,"");
+  pik_append_dis(p, " ",h,"\">");
+  pik_append_end(p, "\n");
+  pik_elist_render(p, pList);
+  pik_append_end(p,"</svg>\n");
+  if( (p->mFlags & PIKCHR_STYLE_CLASSES)!=0 && p->bStream==0 ){
+    pik_merge_styles(p, iSvg);
+  }
+}
+
+/* Render the already laid out objects a second time, in dark mode, into
+** p->pOpts->pDark.  Any output that preceded the SVG (from "print"
+** statements) is copied over first.  p->zOut is left as it was.
+*/
+static void pik_render_dark_copy(
+  Pik *p, PList *pList, PNum w, PNum h, int bScaled, unsigned int iStart
+){
+  char *zMain = p->zOut;
+  unsigned int nMain = p->nOut;
+  unsigned int nMainAlloc = p->nOutAlloc;
+  unsigned int mFlags = p->mFlags;
+  PikchrSvg *pDark = p->pOpts->pDark;
+
+  p->zOut = 0;
+  p->nOut = 0;
+  p->nOutAlloc = 0;
+  p->mFlags |= PIKCHR_DARK_MODE;
+  if( iStart>0 ) pik_append(p, zMain, (int)iStart);
+  pik_render_svg(p, pList, w, h, bScaled);
+  pDark->z = p->zOut;
+  pDark->n = p->nOut;
+  if( pDark->z ){
+    char *z = realloc(pDark->z, pDark->n+1);
+    if( z ) pDark->z = z;
+  }
+  p->zOut = zMain;
+  p->nOut = nMain;
+  p->nOutAlloc = nMainAlloc;
+  p->mFlags = mFlags;
+}
+
 /* Render a list of objects.  Write the SVG into p->zOut.
 ** Delete the input object_list before returnning.
 */
 static void pik_render(Pik *p, PList *pList){
   if( pList==0 ) return;
+  if( p->rStart>0.0 ) p->rLayout = pik_clock();
   if( p->nErr==0 ){
     PNum thickness;  /* Stroke width */
     PNum margin;     /* Extra bounding box margin */
     PNum w, h;       /* Drawing width and height */
     PNum wArrow;
     PNum pikScale;   /* Value of the "scale" variable */
+    int bScaled;     /* True if the "scale" variable changes the size */
     int miss = 0;
 
     /* Set up rendering parameters */
@@ -7117,31 +7827,49 @@ static void pik_render(Pik *p, PList *pList){
     p->bbox.sw.x -= margin + pik_value(p,"leftmargin",10,0);
     p->bbox.sw.y -= margin + pik_value(p,"bottommargin",12,0);
 
-    /* Output the SVG */
-    pik_append(p, "<svg xmlns='http://www.w3.org/2000/svg'",-1);
-    if( p->zClass ){
-      pik_append(p, " class=\"", -1);
-      pik_append(p, p->zClass, -1);
-      pik_append(p, "\"", 1);
-    }
     w = p->bbox.ne.x - p->bbox.sw.x;
     h = p->bbox.ne.y - p->bbox.sw.y;
     p->wSVG = pik_round(p->rScale*w);
     p->hSVG = pik_round(p->rScale*h);
     pikScale = pik_value(p,"scale",5,0);
-    if( pikScale>=0.001 && pikScale<=1000.0
-     && (pikScale<0.99 || pikScale>1.01)
-    ){
+    bScaled = pikScale>=0.001 && pikScale<=1000.0
+           && (pikScale<0.99 || pikScale>1.01);
+    if( bScaled ){
       p->wSVG = pik_round(p->wSVG*pikScale);
       p->hSVG = pik_round(p->hSVG*pikScale);
-      pik_append_num(p, " width=\"", p->wSVG);
-      pik_append_num(p, "\" height=\"", p->hSVG);
-      pik_append(p, "\"", 1);
-    }
-    pik_append_dis(p, " viewBox=\"0 0 ",w,"");
-    pik_append_dis(p, " ",h,"\">\n");
-    pik_elist_render(p, pList);
-    pik_append(p,"</svg>\n", -1);
+    }
+    if( p->pOpts && p->pOpts->pGeom ){
+      pik_elist_geom(p, pList);
+    }
+
+    /* Output the SVG, unless the caller only wants the layout */
+    if( p->rStart>0.0 ) p->rRender = pik_clock();
+    if( p->pOpts==0 || (p->pOpts->mOpts & PIKCHR_OPT_NO_SVG)==0 ){
+      unsigned int iStart = p->nOut;
+      if( p->pOpts && p->pOpts->xWrite ){
+        /* Stream the output, including anything that preceded the SVG */
+        if( p->nOutAlloc<PIKCHR_STREAM_CHUNK ){
+          char *z = realloc(p->zOut, PIKCHR_STREAM_CHUNK);
+          if( z ){
+            p->zOut = z;
+            p->nOutAlloc = PIKCHR_STREAM_CHUNK;
+          }
+        }
+        p->bStream = 1;
+        pik_render_svg(p, pList, w, h, bScaled);
+        if( p->bStream ){
+          p->bStream = 2;
+          pik_flush(p);
+        }
+        iStart = 0;
+      }else{
+        pik_render_svg(p, pList, w, h, bScaled);
+      }
+      if( p->pOpts && p->pOpts->pDark ){
+        pik_render_dark_copy(p, pList, w, h, bScaled, iStart);
+      }
+    }
+    if( p->rStart>0.0 ) p->rRenderEnd = pik_clock();
   }else{
     p->wSVG = -1;
     p->hSVG = -1;
@@ -7834,6 +8562,24 @@ char *pikchr(
   unsigned int mFlags,   /* Flags used to influence rendering behavior */
   int *pnWidth,          /* Write width of <svg> here, if not NULL */
   int *pnHeight          /* Write height here, if not NULL */
+){
+  return pikchr_ext(zText, zClass, mFlags, 0, pnWidth, pnHeight, 0);
+}
+
+/*
+** Same as pikchr() with extra settings taken from pOpts, which may
+** be NULL.  If pnOut is not NULL, also write the number of bytes in
+** the returned text (not counting the zero terminator) into *pnOut so
+** that callers do not have to scan for it again.
+*/
+char *pikchr_ext(
+  const char *zText,     /* Input PIKCHR source text.  zero-terminated */
+  const char *zClass,    /* Add class="%s" to <svg> markup */
+  unsigned int mFlags,   /* Flags used to influence rendering behavior */
+  const PikchrOpts *pOpts, /* Extra settings, or NULL */
+  int *pnWidth,          /* Write width of <svg> here, if not NULL */
+  int *pnHeight,         /* Write height here, if not NULL */
+  unsigned int *pnOut    /* Write length of the result here, if not NULL */
 ){
   Pik s;
   yyParser sParse;
@@ -7844,6 +8590,17 @@ char *pikchr(
   s.eDir = DIR_RIGHT;
   s.zClass = zClass;
   s.mFlags = mFlags;
+  s.pOpts = pOpts;
+  if( pOpts && pOpts->pStats ) s.rStart = pik_clock();
+  /* The hint is only a guess, so one too large to add the terminator to
+  ** is ignored rather than allowed to wrap */
+  if( pOpts && pOpts->nSizeHint>0 && pOpts->nSizeHint<0x7fffffff ){
+    s.zOut = malloc(pOpts->nSizeHint+1);
+    if( s.zOut ){
+      s.zOut[0] = 0;
+      s.nOutAlloc = pOpts->nSizeHint+1;
+    }
+  }
   pik_parserInit(&sParse, &s);
 #if 0
   pik_parserTrace(stdout, "parser: ");
@@ -7857,7 +8614,9 @@ char *pikchr(
     pik_parser(&sParse, 0, token);
   }
   pik_parserFinalize(&sParse);
-  if( s.zOut==0 && s.nErr==0 ){
+  if( s.nOut==0 && s.nErr==0 && s.bStream==0
+   && (pOpts==0 || (pOpts->mOpts & PIKCHR_OPT_NO_SVG)==0)
+  ){
     pik_append(&s, "<!-- empty pikchr diagram -->\n", -1);
   }
   while( s.pVar ){
@@ -7872,10 +8631,27 @@ char *pikchr(
   }
   if( pnWidth ) *pnWidth = s.nErr ? -1 : s.wSVG;
   if( pnHeight ) *pnHeight = s.nErr ? -1 : s.hSVG;
+  if( pnOut ) *pnOut = s.nOut;
   if( s.zOut ){
     s.zOut[s.nOut] = 0;
     s.zOut = realloc(s.zOut, s.nOut+1);
   }
+  if( s.rStart>0.0 ){
+    PikchrStats *pStats = pOpts->pStats;
+    double rEnd = pik_clock();
+    double rLayout = s.rLayout>0.0 ? s.rLayout : rEnd;
+    memset(pStats, 0, sizeof(*pStats));
+    pStats->rParse = rLayout - s.rStart;
+    if( s.rRender>0.0 ) pStats->rLayout = s.rRender - rLayout;
+    if( s.rRenderEnd>0.0 ) pStats->rRender = s.rRenderEnd - s.rRender;
+    pStats->rTotal = rEnd - s.rStart;
+    pStats->nToken = s.nToken;
+    pStats->nObj = s.nObj;
+    pStats->nLookup = s.nLookup;
+    pStats->nOut = s.nFlushed + s.nOut;
+    if( pOpts->pDark ) pStats->nOut += pOpts->pDark->n;
+    pStats->nRealloc = s.nRealloc;
+  }
   return s.zOut;
 }
 
@@ -28,92 +28,931 @@
 #endif
 
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <limits.h>
+#include <errno.h>
+#ifdef _WIN32
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
 
 #define MODULE_NAME "pypikchr.util.pikchr"
 #define MODULE_DOC "Thin Python wrapper around the pikchr C library."
-#define MODULE_PER_INTERPRET_SIZE -1 // Do not support sub-interpreters
 
+/*
+ * Per-module state. Nothing is shared between interpreters, so the module can
+ * be loaded in sub-interpreters with their own GIL (PEP 684). pikchr keeps all
+ * of its state in the Pik struct of each call and its tables are const, so
+ * renders can also run in parallel on free-threaded builds.
+ */
+typedef struct {
+  PyObject *PikchrError;
+  PyObject *PikchrCompileError;
+  PyTypeObject *SvgBufferType;
+} pikchr_state;
+
+static inline pikchr_state *get_state(PyObject *module)
+{
+  return (pikchr_state *)PyModule_GetState(module);
+}
 
-static PyObject *PikchrError;
 static PyObject *pikchr_create_pikchr(PyObject*, PyObject*);
+static PyObject *pikchr_create_pikchr_buffer(PyObject*, PyObject*, PyObject*);
+static PyObject *pikchr_validate(PyObject*, PyObject*, PyObject*);
+static PyObject *pikchr_create_pikchr_geometry(PyObject*, PyObject*, PyObject*);
+static PyObject *pikchr_create_pikchr_themes(PyObject*, PyObject*, PyObject*);
+static PyObject *pikchr_render_to(PyObject*, PyObject*, PyObject*);
+static PyObject *pikchr_measure_text(PyObject*, PyObject*, PyObject*);
+static PyObject *pikchr_create_pikchr_stats(PyObject*, PyObject*, PyObject*);
+#ifdef PYPIKCHR_DEBUG
 static void on_free();
+#endif
+
+/* Return a malloc()'d copy of a NUL-terminated string, or NULL. */
+static char *copy_cstr(const char *src)
+{
+  size_t n = strlen(src) + 1;
+  char *dst = malloc(n);
+  if (dst)
+    memcpy(dst, src, n);
+  return dst;
+}
+
+static int compare_obj_tags(const void *a, const void *b)
+{
+  unsigned ia = ((const PikchrObjTag *)a)->iOffset;
+  unsigned ib = ((const PikchrObjTag *)b)->iOffset;
+  return (ia > ib) - (ia < ib);
+}
+
+static void free_obj_tags(PikchrOpts *opts)
+{
+  for (int i = 0; i < opts->nTag; i++)
+    free((char *)opts->aTag[i].zUrl);
+  free((PikchrObjTag *)opts->aTag);
+  opts->aTag = NULL;
+  opts->nTag = 0;
+}
+
+/*
+ * Check a size hint from Python. The hint is allocated plus one byte for the
+ * terminator, so it is capped well below UINT_MAX.
+ *
+ * Returns 0 on success, or -1 with ValueError set.
+ */
+static int check_size_hint(Py_ssize_t size_hint)
+{
+  if (size_hint < 0 || size_hint > INT_MAX) {
+    PyErr_Format(PyExc_ValueError, "size_hint must be between 0 and %d",
+                 INT_MAX);
+    return -1;
+  }
+  return 0;
+}
+
+/*
+ * Convert a sequence of (offset, id, url) tuples into object tags. offset is
+ * the byte offset of the object's class name in the markdown, url is an
+ * attribute-escaped str or None. Copies everything so the GIL can be released.
+ *
+ * Returns 0 on success, or -1 with a Python exception set.
+ */
+static int parse_obj_tags_seq(PyObject *seq, PikchrOpts *opts);
+
+static int parse_obj_tags(PyObject *objects, PikchrOpts *opts)
+{
+  memset(opts, 0, sizeof(*opts));
+  if (objects == NULL || objects == Py_None)
+    return 0;
+
+  PyObject *seq = PySequence_Fast(objects, "objects must be a sequence");
+  if (!seq)
+    return -1;
+
+  int rc;
+#ifdef Py_GIL_DISABLED
+  // A list is used directly, so guard against concurrent mutation
+  Py_BEGIN_CRITICAL_SECTION(seq);
+  rc = parse_obj_tags_seq(seq, opts);
+  Py_END_CRITICAL_SECTION();
+#else
+  rc = parse_obj_tags_seq(seq, opts);
+#endif
+  Py_DECREF(seq);
+  if (rc == 0)
+    qsort((PikchrObjTag *)opts->aTag, (size_t)opts->nTag, sizeof(PikchrObjTag),
+          compare_obj_tags);
+  return rc;
+}
+
+static int parse_obj_tags_seq(PyObject *seq, PikchrOpts *opts)
+{
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+  if (n > INT_MAX) {
+    PyErr_SetString(PyExc_OverflowError, "too many objects");
+    return -1;
+  }
+  PikchrObjTag *tags = calloc(n ? n : 1, sizeof(PikchrObjTag));
+  if (!tags) {
+    PyErr_NoMemory();
+    return -1;
+  }
+  opts->aTag = tags;
+
+  for (Py_ssize_t i = 0; i < n; i++) {
+    PyObject *item = PySequence_Fast_GET_ITEM(seq, i);
+    unsigned long offset;
+    long id;
+    PyObject *url;
+    if (!PyArg_ParseTuple(item, "kl|O", &offset, &id, &url)) {
+      free_obj_tags(opts);
+      return -1;
+    }
+    tags[i].iOffset = (unsigned int)offset;
+    tags[i].iId = id;
+    opts->nTag = (int)(i + 1);
+    if (PyTuple_GET_SIZE(item) > 2 && url != Py_None) {
+      const char *url_str = PyUnicode_AsUTF8(url);
+      if (!url_str || !(tags[i].zUrl = copy_cstr(url_str))) {
+        if (url_str)
+          PyErr_NoMemory();
+        free_obj_tags(opts);
+        return -1;
+      }
+    }
+  }
+  return 0;
+}
+
+/*
+ * Run pikchr() on private copies of the inputs with the GIL released.
+ *
+ * Returns the malloc()'d output buffer (owned by the caller) and writes its
+ * length to *n_out. Returns NULL with a Python exception set on failure.
+ */
+static char *run_pikchr(pikchr_state *state, const char *in_str,
+                        const char *svg_class, unsigned flags,
+                        const PikchrOpts *opts, int *width, int *height,
+                        unsigned *n_out)
+{
+  // Work on private copies so the GIL can be released for the whole
+  // parse/layout/render without touching Python-owned buffers.
+  char *in_copy = copy_cstr(in_str);
+  char *class_copy = copy_cstr(svg_class);
+  if (!in_copy || !class_copy) {
+    free(in_copy);
+    free(class_copy);
+    PyErr_NoMemory();
+    return NULL;
+  }
+
+  char *pikchr_svg;
+  Py_BEGIN_ALLOW_THREADS
+  pikchr_svg = pikchr_ext(in_copy, class_copy, flags, opts, width, height, n_out);
+  Py_END_ALLOW_THREADS
+
+  free(in_copy);
+  free(class_copy);
+
+  // Without SVG output, a NULL result just means there was nothing to report
+  if (!pikchr_svg && !(opts && (opts->mOpts & PIKCHR_OPT_NO_SVG)))
+    PyErr_SetString(state->PikchrError, "Error in pikchr C call.");
+  return pikchr_svg;
+}
+
+/*
+ * SvgBuffer: read-only buffer-protocol object that owns the memory returned
+ * by pikchr(). Can be written to files/sockets or wrapped in a memoryview
+ * without copying or decoding.
+ */
+typedef struct {
+  PyObject_HEAD
+  char *data;
+  Py_ssize_t size;
+  int width;
+  int height;
+} SvgBuffer;
+
+static void svgbuffer_dealloc(SvgBuffer *self)
+{
+  PyTypeObject *tp = Py_TYPE(self);
+  free(self->data);
+  tp->tp_free((PyObject *)self);
+#if PY_VERSION_HEX >= 0x03090000
+  // Instances of heap types hold a reference to their type
+  Py_DECREF(tp);
+#endif
+}
+
+static int svgbuffer_getbuffer(SvgBuffer *self, Py_buffer *view, int flags)
+{
+  return PyBuffer_FillInfo(view, (PyObject *)self, self->data, self->size,
+                           1, flags);
+}
+
+static Py_ssize_t svgbuffer_length(SvgBuffer *self)
+{
+  return self->size;
+}
+
+static PyObject *svgbuffer_str(SvgBuffer *self)
+{
+  return PyUnicode_DecodeUTF8(self->data, self->size, "strict");
+}
+
+static PyObject *svgbuffer_tobytes(SvgBuffer *self, PyObject *Py_UNUSED(ignored))
+{
+  return PyBytes_FromStringAndSize(self->data, self->size);
+}
+
+static PyObject *svgbuffer_get_width(SvgBuffer *self, void *closure)
+{
+  return PyLong_FromLong(self->width);
+}
+
+static PyObject *svgbuffer_get_height(SvgBuffer *self, void *closure)
+{
+  return PyLong_FromLong(self->height);
+}
+
+static PyMethodDef svgbuffer_methods[] = {
+  {"tobytes", (PyCFunction)svgbuffer_tobytes, METH_NOARGS,
+   "Return a copy of the SVG as bytes."},
+  {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef svgbuffer_getset[] = {
+  {"width", (getter)svgbuffer_get_width, NULL,
+   "Width of the <svg> in pixels, or -1 on error.", NULL},
+  {"height", (getter)svgbuffer_get_height, NULL,
+   "Height of the <svg> in pixels, or -1 on error.", NULL},
+  {NULL, NULL, NULL, NULL, NULL}
+};
+
+#if PY_VERSION_HEX >= 0x03090000
+/* A heap type, created per module, so interpreters don't share it. */
+static PyType_Slot svgbuffer_slots[] = {
+  {Py_tp_doc, "UTF-8 encoded SVG output owned by the pikchr C library."},
+  {Py_tp_dealloc, svgbuffer_dealloc},
+  {Py_tp_str, svgbuffer_str},
+  {Py_bf_getbuffer, svgbuffer_getbuffer},
+  {Py_sq_length, svgbuffer_length},
+  {Py_tp_methods, svgbuffer_methods},
+  {Py_tp_getset, svgbuffer_getset},
+  {0, NULL}
+};
+
+static PyType_Spec svgbuffer_spec = {
+  .name = MODULE_NAME".SvgBuffer",
+  .basicsize = sizeof(SvgBuffer),
+  .itemsize = 0,
+#if PY_VERSION_HEX >= 0x030A0000
+  .flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_IMMUTABLETYPE
+           | Py_TPFLAGS_DISALLOW_INSTANTIATION,
+#else
+  .flags = Py_TPFLAGS_DEFAULT,
+#endif
+  .slots = svgbuffer_slots,
+};
+#else
+static PyBufferProcs svgbuffer_as_buffer = {
+  (getbufferproc)svgbuffer_getbuffer,
+  NULL, // bf_releasebuffer
+};
+
+static PySequenceMethods svgbuffer_as_sequence = {
+  (lenfunc)svgbuffer_length,
+};
+
+static PyTypeObject SvgBufferType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = MODULE_NAME".SvgBuffer",
+  .tp_doc = "UTF-8 encoded SVG output owned by the pikchr C library.",
+  .tp_basicsize = sizeof(SvgBuffer),
+  .tp_itemsize = 0,
+  .tp_flags = Py_TPFLAGS_DEFAULT,
+  .tp_dealloc = (destructor)svgbuffer_dealloc,
+  .tp_str = (reprfunc)svgbuffer_str,
+  .tp_as_buffer = &svgbuffer_as_buffer,
+  .tp_as_sequence = &svgbuffer_as_sequence,
+  .tp_methods = svgbuffer_methods,
+  .tp_getset = svgbuffer_getset,
+};
+#endif
 
 static PyMethodDef pikchr_methods[] = {
-  {"create_pikchr", pikchr_create_pikchr, METH_VARARGS, "Compile pikchr markdown."},
+  {"create_pikchr", pikchr_create_pikchr, METH_VARARGS,
+   "Compile pikchr markdown. An optional sequence of (offset, id, url) tuples "
+   "wraps the matching objects in <g>/<a> elements carrying data-pypikchr-id."},
+  {"create_pikchr_buffer", (PyCFunction)(void(*)(void))pikchr_create_pikchr_buffer,
+   METH_VARARGS | METH_KEYWORDS,
+   "Compile pikchr markdown into an SvgBuffer that owns the C output."},
+  {"validate", (PyCFunction)(void(*)(void))pikchr_validate,
+   METH_VARARGS | METH_KEYWORDS,
+   "Parse and lay out pikchr markdown without generating SVG. Returns the "
+   "(width, height) in pixels, or raises PikchrCompileError."},
+  {"create_pikchr_geometry",
+   (PyCFunction)(void(*)(void))pikchr_create_pikchr_geometry,
+   METH_VARARGS | METH_KEYWORDS,
+   "Compile pikchr markdown and return (svg, geometry). geometry holds an "
+   "(id, x0, y0, x1, y1, cx, cy, path) tuple per tagged object, in drawing "
+   "order and SVG viewBox coordinates. svg is None if svg=False."},
+  {"create_pikchr_themes",
+   (PyCFunction)(void(*)(void))pikchr_create_pikchr_themes,
+   METH_VARARGS | METH_KEYWORDS,
+   "Compile pikchr markdown once and return (light, dark) SVGs rendered from "
+   "the same layout. Errors are returned as the text of both."},
+  {"render_to", (PyCFunction)(void(*)(void))pikchr_render_to,
+   METH_VARARGS | METH_KEYWORDS,
+   "Compile pikchr markdown and stream the SVG to a file descriptor or an "
+   "object with a write(bytes) method as it is generated. Returns "
+   "(width, height, size), or raises PikchrCompileError."},
+  {"create_pikchr_stats",
+   (PyCFunction)(void(*)(void))pikchr_create_pikchr_stats,
+   METH_VARARGS | METH_KEYWORDS,
+   "Compile pikchr markdown and return (svg, stats), where stats is a dict "
+   "of the seconds spent parsing, laying out and rendering, and counters of "
+   "tokens, objects, name lookups, output bytes and buffer reallocations."},
+  {"measure_text", (PyCFunction)(void(*)(void))pikchr_measure_text,
+   METH_VARARGS | METH_KEYWORDS,
+   "Return the width in inches pikchr estimates for each string in a "
+   "sequence, as the text of a string literal in the given font."},
   {NULL,NULL,0,NULL}
 };
 
+/* PyModule_AddObjectRef() for all supported versions. */
+static int add_object_ref(PyObject *m, const char *name, PyObject *value)
+{
+#if PY_VERSION_HEX < 0x030A0000
+  Py_INCREF(value);
+  if (PyModule_AddObject(m, name, value) < 0) {
+    Py_DECREF(value);
+    return -1;
+  }
+  return 0;
+#else
+  return PyModule_AddObjectRef(m, name, value);
+#endif
+}
+
+static int pikchr_exec(PyObject *m)
+{
+  pikchr_state *state = get_state(m);
+
+  state->PikchrError = PyErr_NewException(MODULE_NAME".PikchrException", NULL,
+                                          NULL);
+  if (!state->PikchrError)
+    return -1;
+  if (add_object_ref(m, "PikchrException", state->PikchrError) < 0)
+    return -1;
+
+  state->PikchrCompileError = PyErr_NewExceptionWithDoc(
+      MODULE_NAME".PikchrCompileError",
+      "Pikchr markdown failed to compile. The line and column (1-based, or "
+      "None if unknown) and message attributes describe the first error.",
+      state->PikchrError, NULL);
+  if (!state->PikchrCompileError)
+    return -1;
+  if (add_object_ref(m, "PikchrCompileError", state->PikchrCompileError) < 0)
+    return -1;
+
+#if PY_VERSION_HEX >= 0x03090000
+  state->SvgBufferType = (PyTypeObject *)PyType_FromModuleAndSpec(
+      m, &svgbuffer_spec, NULL);
+  if (!state->SvgBufferType)
+    return -1;
+#else
+  if (PyType_Ready(&SvgBufferType) < 0)
+    return -1;
+  Py_INCREF(&SvgBufferType);
+  state->SvgBufferType = &SvgBufferType;
+#endif
+  if (add_object_ref(m, "SvgBuffer", (PyObject *)state->SvgBufferType) < 0)
+    return -1;
+
+  return 0;
+}
+
+static int pikchr_traverse(PyObject *m, visitproc visit, void *arg)
+{
+  pikchr_state *state = get_state(m);
+  Py_VISIT(state->PikchrError);
+  Py_VISIT(state->PikchrCompileError);
+  Py_VISIT(state->SvgBufferType);
+  return 0;
+}
+
+static int pikchr_clear(PyObject *m)
+{
+  pikchr_state *state = get_state(m);
+  Py_CLEAR(state->PikchrError);
+  Py_CLEAR(state->PikchrCompileError);
+  Py_CLEAR(state->SvgBufferType);
+  return 0;
+}
+
+static void pikchr_free(void *m)
+{
+  pikchr_clear((PyObject *)m);
+#ifdef PYPIKCHR_DEBUG
+  on_free();
+#endif
+}
+
+static PyModuleDef_Slot pikchr_slots[] = {
+  {Py_mod_exec, pikchr_exec},
+#if PY_VERSION_HEX >= 0x030C0000
+  {Py_mod_multiple_interpreters, Py_MOD_PER_INTERPRETER_GIL_SUPPORTED},
+#endif
+#if PY_VERSION_HEX >= 0x030D0000
+  {Py_mod_gil, Py_MOD_GIL_NOT_USED},
+#endif
+  {0, NULL}
+};
+
 static struct PyModuleDef pikchr_module = {
     PyModuleDef_HEAD_INIT,
     MODULE_NAME,
     MODULE_DOC,
-    MODULE_PER_INTERPRET_SIZE,
+    sizeof(pikchr_state),
     pikchr_methods,
-    NULL, // m_slots
-    NULL, // m_traverse
-    NULL, // m_clear
-#ifdef PYPIKCHR_DEBUG
-    on_free
-#else
-    NULL
-#endif
+    pikchr_slots,
+    pikchr_traverse,
+    pikchr_clear,
+    pikchr_free
 };
 
 PyMODINIT_FUNC PyInit_pikchr(void)
 {
-  PyObject *m;
+  return PyModuleDef_Init(&pikchr_module);
+}
 
-  m = PyModule_Create(&pikchr_module);
-  if (m == NULL)
+static PyObject *pikchr_create_pikchr(PyObject *self, PyObject *args)
+{
+  const char *in_str;
+  const char *svg_class;
+  unsigned flags;
+  int width;
+  int height;
+  unsigned n_out = 0;
+  PyObject *objects = NULL;
+  Py_ssize_t size_hint = 0;
+  PikchrOpts opts;
+
+  if (!PyArg_ParseTuple(args, "ssIii|On", &in_str, &svg_class, &flags, &width,
+                        &height, &objects, &size_hint)) {
+    PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+    return NULL;
+  }
+  if (check_size_hint(size_hint) < 0 || parse_obj_tags(objects, &opts) < 0)
     return NULL;
+  opts.nSizeHint = (unsigned)size_hint;
 
-  PikchrError = PyErr_NewException(MODULE_NAME".PikchrException", NULL, NULL);
+  pikchr_state *state = get_state(self);
+  char *pikchr_svg = run_pikchr(state, in_str, svg_class, flags, &opts, &width,
+                                &height, &n_out);
+  free_obj_tags(&opts);
+  if (!pikchr_svg)
+    return NULL;
 
-#if PY_VERSION_HEX < 0x030A0000
-  Py_INCREF(PikchrError);
-  if (PyModule_AddObject(m, "PikchrException", PikchrError) < 0) {
-    Py_DECREF(PikchrError);
-    Py_CLEAR(PikchrError);
-    Py_DECREF(m);
+  PyObject *str = PyUnicode_DecodeUTF8(pikchr_svg, (Py_ssize_t)n_out, "strict");
+  free(pikchr_svg);
+  if (!str) {
+    PyErr_SetString(state->PikchrError, "Cannot convert to Python string.");
     return NULL;
   }
-#else
-  if (PyModule_AddObjectRef(m, "PikchrException", PikchrError) < 0) {
-    Py_CLEAR(PikchrError);
-    Py_DECREF(m);
+
+  return str;
+}
+
+static PyObject *pikchr_create_pikchr_buffer(PyObject *self, PyObject *args,
+                                             PyObject *kwargs)
+{
+  static char *kwlist[] = {"md", "svg_class", "flags", "objects", "size_hint",
+                           NULL};
+  const char *in_str;
+  const char *svg_class = "";
+  unsigned flags = 0;
+  int width = 0;
+  int height = 0;
+  unsigned n_out = 0;
+  PyObject *objects = NULL;
+  Py_ssize_t size_hint = 0;
+  PikchrOpts opts;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|sIOn", kwlist, &in_str,
+                                   &svg_class, &flags, &objects, &size_hint))
+    return NULL;
+  if (check_size_hint(size_hint) < 0 || parse_obj_tags(objects, &opts) < 0)
+    return NULL;
+  opts.nSizeHint = (unsigned)size_hint;
+
+  pikchr_state *state = get_state(self);
+  char *pikchr_svg = run_pikchr(state, in_str, svg_class, flags, &opts, &width,
+                                &height, &n_out);
+  free_obj_tags(&opts);
+  if (!pikchr_svg)
+    return NULL;
+
+  SvgBuffer *buf = PyObject_New(SvgBuffer, state->SvgBufferType);
+  if (!buf) {
+    free(pikchr_svg);
     return NULL;
   }
-#endif
+  buf->data = pikchr_svg;
+  buf->size = (Py_ssize_t)n_out;
+  buf->width = width;
+  buf->height = height;
+  return (PyObject *)buf;
+}
+
+/*
+ * Set a PikchrCompileError for the error described by err. The line and
+ * column are 1-based, with the column counted in characters.
+ */
+static void set_compile_error(pikchr_state *state, const char *in_str,
+                              const PikchrErrInfo *err)
+{
+  PyObject *message = NULL;
+  PyObject *text = NULL;
+  PyObject *exc = NULL;
+  PyObject *line = Py_None;
+  PyObject *column = Py_None;
+  long n_line = 1;
+  long n_col = 1;
+
+  Py_INCREF(line);
+  Py_INCREF(column);
+  message = PyUnicode_DecodeUTF8(err->zMsg, strlen(err->zMsg), "replace");
+  if (!message)
+    goto done;
+
+  if (err->iOffset >= 0) {
+    for (int i = 0; i < err->iOffset && in_str[i]; i++) {
+      if (in_str[i] == '\n') {
+        n_line++;
+        n_col = 1;
+      } else if (((unsigned char)in_str[i] & 0xC0) != 0x80) {
+        // Count characters, not UTF-8 continuation bytes
+        n_col++;
+      }
+    }
+    Py_SETREF(line, PyLong_FromLong(n_line));
+    Py_SETREF(column, PyLong_FromLong(n_col));
+    text = PyUnicode_FromFormat("line %ld, column %ld: %U", n_line, n_col,
+                                message);
+  } else {
+    Py_INCREF(message);
+    text = message;
+  }
+  if (!line || !column || !text)
+    goto done;
 
-  return m;
+  exc = PyObject_CallFunctionObjArgs(state->PikchrCompileError, text, NULL);
+  if (!exc)
+    goto done;
+  if (PyObject_SetAttrString(exc, "line", line) < 0
+      || PyObject_SetAttrString(exc, "column", column) < 0
+      || PyObject_SetAttrString(exc, "message", message) < 0)
+    goto done;
+  PyErr_SetObject(state->PikchrCompileError, exc);
+
+done:
+  Py_XDECREF(exc);
+  Py_XDECREF(text);
+  Py_XDECREF(line);
+  Py_XDECREF(column);
+  Py_XDECREF(message);
 }
 
-static PyObject *pikchr_create_pikchr(PyObject *self, PyObject *args)
+static PyObject *pikchr_validate(PyObject *self, PyObject *args,
+                                 PyObject *kwargs)
 {
+  static char *kwlist[] = {"md", "flags", NULL};
   const char *in_str;
-  const char *svg_class;
-  unsigned flags;
-  int width;
-  int height;
+  unsigned flags = 0;
+  int width = 0;
+  int height = 0;
+  unsigned n_out = 0;
+  PikchrOpts opts;
+  PikchrErrInfo err;
 
-  if (!PyArg_ParseTuple(args, "ssIii", &in_str, &svg_class, &flags, &width, &height)) {
-    PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|I", kwlist, &in_str,
+                                   &flags))
+    return NULL;
+
+  memset(&opts, 0, sizeof(opts));
+  memset(&err, 0, sizeof(err));
+  opts.mOpts = PIKCHR_OPT_NO_SVG;
+  opts.pErr = &err;
+
+  pikchr_state *state = get_state(self);
+  char *out = run_pikchr(state, in_str, "", flags, &opts, &width, &height,
+                         &n_out);
+  if (!out && PyErr_Occurred())
+    return NULL;
+  free(out);
+
+  if (err.nErr || width < 0) {
+    if (!err.nErr) {
+      err.iOffset = -1;
+      snprintf(err.zMsg, sizeof(err.zMsg), "unknown error");
+    }
+    set_compile_error(state, in_str, &err);
     return NULL;
   }
+  return Py_BuildValue("(ii)", width, height);
+}
+
+/* Convert the geometry collected by pikchr_ext() into a list of tuples. */
+static PyObject *geometry_to_list(const PikchrGeomList *geom)
+{
+  PyObject *list = PyList_New(geom->nObj);
+  if (!list)
+    return NULL;
+  for (int i = 0; i < geom->nObj; i++) {
+    const PikchrGeom *g = &geom->aObj[i];
+    PyObject *path = PyTuple_New(g->nPath);
+    if (!path) {
+      Py_DECREF(list);
+      return NULL;
+    }
+    for (int j = 0; j < g->nPath; j++) {
+      const double *pt = &geom->aPt[2 * (g->iPath + j)];
+      PyObject *xy = Py_BuildValue("(dd)", pt[0], pt[1]);
+      if (!xy) {
+        Py_DECREF(path);
+        Py_DECREF(list);
+        return NULL;
+      }
+      PyTuple_SET_ITEM(path, j, xy);
+    }
+    PyObject *item = Py_BuildValue("(lddddddN)", g->iId, g->x0, g->y0, g->x1,
+                                   g->y1, g->cx, g->cy, path);
+    if (!item) {
+      Py_DECREF(list);
+      return NULL;
+    }
+    PyList_SET_ITEM(list, i, item);
+  }
+  return list;
+}
+
+static PyObject *pikchr_create_pikchr_geometry(PyObject *self, PyObject *args,
+                                               PyObject *kwargs)
+{
+  static char *kwlist[] = {"md", "svg_class", "flags", "objects", "svg", NULL};
+  const char *in_str;
+  const char *svg_class = "";
+  unsigned flags = 0;
+  int want_svg = 1;
+  int width = 0;
+  int height = 0;
+  unsigned n_out = 0;
+  PyObject *objects = NULL;
+  PikchrOpts opts;
+  PikchrGeomList geom;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|sIOp", kwlist, &in_str,
+                                   &svg_class, &flags, &objects, &want_svg))
+    return NULL;
+  if (parse_obj_tags(objects, &opts) < 0)
+    return NULL;
+  memset(&geom, 0, sizeof(geom));
+  opts.pGeom = &geom;
+  if (!want_svg)
+    opts.mOpts |= PIKCHR_OPT_NO_SVG;
 
-  char *pikchr_svg = pikchr(in_str, svg_class, flags, &width, &height);
+  pikchr_state *state = get_state(self);
+  char *pikchr_svg = run_pikchr(state, in_str, svg_class, flags, &opts, &width,
+                                &height, &n_out);
+  free_obj_tags(&opts);
+  PyObject *svg = NULL;
+  PyObject *list = NULL;
+  if (!pikchr_svg && PyErr_Occurred())
+    goto done;
+  if (geom.bOom) {
+    PyErr_NoMemory();
+    goto done;
+  }
+  if (want_svg || width < 0) {
+    // Errors always come back as text
+    svg = PyUnicode_DecodeUTF8(pikchr_svg ? pikchr_svg : "", (Py_ssize_t)n_out,
+                               "strict");
+  } else {
+    svg = Py_None;
+    Py_INCREF(svg);
+  }
+  if (!svg)
+    goto done;
+  list = geometry_to_list(&geom);
+
+done:
+  free(pikchr_svg);
+  free(geom.aObj);
+  free(geom.aPt);
+  if (!list) {
+    Py_XDECREF(svg);
+    return NULL;
+  }
+  return Py_BuildValue("(NN)", svg, list);
+}
+
+static PyObject *pikchr_create_pikchr_themes(PyObject *self, PyObject *args,
+                                             PyObject *kwargs)
+{
+  static char *kwlist[] = {"md", "svg_class", "flags", "objects", NULL};
+  const char *in_str;
+  const char *svg_class = "";
+  unsigned flags = 0;
+  int width = 0;
+  int height = 0;
+  unsigned n_out = 0;
+  PyObject *objects = NULL;
+  PikchrOpts opts;
+  PikchrSvg dark;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|sIO", kwlist, &in_str,
+                                   &svg_class, &flags, &objects))
+    return NULL;
+  if (parse_obj_tags(objects, &opts) < 0)
+    return NULL;
+  memset(&dark, 0, sizeof(dark));
+  opts.pDark = &dark;
+
+  // The main output is the light variant
+  pikchr_state *state = get_state(self);
+  char *pikchr_svg = run_pikchr(state, in_str, svg_class,
+                                flags & ~PIKCHR_DARK_MODE, &opts, &width,
+                                &height, &n_out);
+  free_obj_tags(&opts);
   if (!pikchr_svg) {
-    PyErr_SetString(PikchrError, "Error in pikchr C call.");
+    free(dark.z);
     return NULL;
   }
 
-  PyObject *str = PyUnicode_FromString(pikchr_svg);
-  if (!str) {
-    PyErr_SetString(PikchrError, "Cannot convert to Python string.");
+  PyObject *light = PyUnicode_DecodeUTF8(pikchr_svg, (Py_ssize_t)n_out,
+                                         "strict");
+  PyObject *dark_str = NULL;
+  if (light) {
+    if (dark.z) {
+      dark_str = PyUnicode_DecodeUTF8(dark.z, (Py_ssize_t)dark.n, "strict");
+    } else {
+      // Errors are reported the same way for both themes
+      dark_str = light;
+      Py_INCREF(dark_str);
+    }
+  }
+  free(pikchr_svg);
+  free(dark.z);
+  if (!light || !dark_str) {
+    Py_XDECREF(light);
+    Py_XDECREF(dark_str);
+    PyErr_SetString(state->PikchrError, "Cannot convert to Python string.");
     return NULL;
   }
+  return Py_BuildValue("(NN)", light, dark_str);
+}
 
-  return str;
+/*
+ * Destination of render_to(). Chunks are written to fd if it is not -1, or
+ * else passed to write(), re-acquiring the GIL through tstate while it is
+ * released.
+ */
+typedef struct {
+  int fd;
+  PyObject *write;
+  PyThreadState *tstate;
+  Py_ssize_t size;
+  int err_no;
+  int failed;
+} write_target;
+
+static int write_chunk(void *arg, const char *z, unsigned int n)
+{
+  write_target *target = (write_target *)arg;
+  if (target->failed)
+    return 1;
+  if (target->fd >= 0) {
+    while (n > 0) {
+#ifdef _WIN32
+      int w = _write(target->fd, z, n > INT_MAX ? INT_MAX : n);
+#else
+      ssize_t w = write(target->fd, z, n);
+#endif
+      if (w < 0) {
+        if (errno == EINTR)
+          continue;
+        target->err_no = errno;
+        target->failed = 1;
+        return 1;
+      }
+      z += w;
+      n -= (unsigned int)w;
+      target->size += w;
+    }
+    return 0;
+  }
+
+  if (target->tstate)
+    PyEval_RestoreThread(target->tstate);
+  PyObject *res = PyObject_CallFunction(target->write, "y#", z, (Py_ssize_t)n);
+  if (res) {
+    target->size += n;
+    Py_DECREF(res);
+  } else {
+    target->failed = 1;
+  }
+  if (target->tstate)
+    target->tstate = PyEval_SaveThread();
+  return target->failed;
+}
+
+static PyObject *pikchr_render_to(PyObject *self, PyObject *args,
+                                  PyObject *kwargs)
+{
+  static char *kwlist[] = {"target", "md", "svg_class", "flags", "objects",
+                           NULL};
+  PyObject *dest;
+  const char *in_str;
+  const char *svg_class = "";
+  unsigned flags = 0;
+  int width = 0;
+  int height = 0;
+  unsigned n_out = 0;
+  PyObject *objects = NULL;
+  PikchrOpts opts;
+  PikchrErrInfo err;
+  write_target target;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Os|sIO", kwlist, &dest,
+                                   &in_str, &svg_class, &flags, &objects))
+    return NULL;
+
+  memset(&target, 0, sizeof(target));
+  target.fd = -1;
+  if (PyLong_Check(dest)) {
+    long fd = PyLong_AsLong(dest);
+    if (fd == -1 && PyErr_Occurred())
+      return NULL;
+    if (fd < 0 || fd > INT_MAX) {
+      PyErr_SetString(PyExc_ValueError, "Invalid file descriptor.");
+      return NULL;
+    }
+    target.fd = (int)fd;
+  } else {
+    target.write = PyObject_GetAttrString(dest, "write");
+    if (!target.write)
+      return NULL;
+  }
+
+  pikchr_state *state = get_state(self);
+  char *in_copy = copy_cstr(in_str);
+  char *class_copy = copy_cstr(svg_class);
+  if (!in_copy || !class_copy || parse_obj_tags(objects, &opts) < 0) {
+    free(in_copy);
+    free(class_copy);
+    Py_XDECREF(target.write);
+    return PyErr_Occurred() ? NULL : PyErr_NoMemory();
+  }
+  memset(&err, 0, sizeof(err));
+  opts.pErr = &err;
+  opts.xWrite = write_chunk;
+  opts.pWriteArg = &target;
+
+  target.tstate = PyEval_SaveThread();
+  char *out = pikchr_ext(in_copy, class_copy, flags, &opts, &width, &height,
+                         &n_out);
+  PyEval_RestoreThread(target.tstate);
+  target.tstate = NULL;
+  free(in_copy);
+  free(class_copy);
+  free_obj_tags(&opts);
+
+  // Anything left over, e.g. the comment for an empty diagram
+  if (!err.nErr && width >= 0 && out && n_out > 0)
+    write_chunk(&target, out, n_out);
+  free(out);
+  Py_XDECREF(target.write);
+
+  if (target.failed) {
+    if (target.err_no) {
+      errno = target.err_no;
+      PyErr_SetFromErrno(PyExc_OSError);
+    }
+    return NULL;
+  }
+  if (err.nErr || width < 0) {
+    if (!err.nErr) {
+      err.iOffset = -1;
+      snprintf(err.zMsg, sizeof(err.zMsg), "unknown error");
+    }
+    set_compile_error(state, in_str, &err);
+    return NULL;
+  }
+  return Py_BuildValue("(iin)", width, height, target.size);
 }
 
 #ifdef PYPIKCHR_DEBUG
@@ -121,3 +960,108 @@ static void on_free() {
   printf("Pikchr resources released.\n");
 }
 #endif
+
+static PyObject *measure_text_seq(PyObject *seq, int mono, double charwid)
+{
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+  PyObject **items = PySequence_Fast_ITEMS(seq);
+  PyObject *widths = PyList_New(n);
+  if (!widths)
+    return NULL;
+  for (Py_ssize_t i = 0; i < n; i++) {
+    Py_ssize_t len;
+    const char *z = PyUnicode_AsUTF8AndSize(items[i], &len);
+    if (!z || len > INT_MAX) {
+      if (z)
+        PyErr_SetString(PyExc_OverflowError, "string is too long");
+      Py_DECREF(widths);
+      return NULL;
+    }
+    /* The UTF-8 buffer is zero terminated, as pikchr_text_length() needs */
+    int cnt = pikchr_text_length(z, (int)len, mono);
+    PyObject *width = PyFloat_FromDouble(cnt * charwid * 0.01);
+    if (!width) {
+      Py_DECREF(widths);
+      return NULL;
+    }
+    PyList_SET_ITEM(widths, i, width);
+  }
+  return widths;
+}
+
+static PyObject *pikchr_measure_text(PyObject *self, PyObject *args,
+                                     PyObject *kwargs)
+{
+  static char *kwlist[] = {"strings", "mono", "charwid", NULL};
+  PyObject *strings;
+  int mono = 0;
+  double charwid = 0.08;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|pd", kwlist, &strings,
+                                   &mono, &charwid))
+    return NULL;
+  if (PyUnicode_Check(strings)) {
+    PyErr_SetString(PyExc_TypeError,
+                    "measure_text() expects a sequence of strings, not str");
+    return NULL;
+  }
+
+  PyObject *seq = PySequence_Fast(strings, "measure_text() expects a sequence "
+                                           "of strings");
+  if (!seq)
+    return NULL;
+  PyObject *widths;
+#ifdef Py_GIL_DISABLED
+  // A list is used directly, so guard against concurrent mutation
+  Py_BEGIN_CRITICAL_SECTION(seq);
+  widths = measure_text_seq(seq, mono, charwid);
+  Py_END_CRITICAL_SECTION();
+#else
+  widths = measure_text_seq(seq, mono, charwid);
+#endif
+  Py_DECREF(seq);
+  return widths;
+}
+
+static PyObject *pikchr_create_pikchr_stats(PyObject *self, PyObject *args,
+                                            PyObject *kwargs)
+{
+  static char *kwlist[] = {"md", "svg_class", "flags", "objects", "size_hint",
+                           NULL};
+  const char *in_str;
+  const char *svg_class = "";
+  unsigned flags = 0;
+  Py_ssize_t size_hint = 0;
+  int width = 0;
+  int height = 0;
+  unsigned n_out = 0;
+  PyObject *objects = NULL;
+  PikchrOpts opts;
+  PikchrStats stats;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|sIOn", kwlist, &in_str,
+                                   &svg_class, &flags, &objects, &size_hint))
+    return NULL;
+  if (check_size_hint(size_hint) < 0 || parse_obj_tags(objects, &opts) < 0)
+    return NULL;
+  memset(&stats, 0, sizeof(stats));
+  opts.nSizeHint = (unsigned)size_hint;
+  opts.pStats = &stats;
+
+  pikchr_state *state = get_state(self);
+  char *pikchr_svg = run_pikchr(state, in_str, svg_class, flags, &opts, &width,
+                                &height, &n_out);
+  free_obj_tags(&opts);
+  if (!pikchr_svg && PyErr_Occurred())
+    return NULL;
+  PyObject *svg = PyUnicode_DecodeUTF8(pikchr_svg ? pikchr_svg : "",
+                                       (Py_ssize_t)n_out, "strict");
+  free(pikchr_svg);
+  if (!svg)
+    return NULL;
+  return Py_BuildValue(
+      "(N{sdsdsdsdsIsIsIsIsI})", svg, "parse", stats.rParse, "layout",
+      stats.rLayout, "render", stats.rRender, "total", stats.rTotal, "tokens",
+      stats.nToken, "objects", stats.nObj, "lookups", stats.nLookup,
+      "output_bytes", stats.nOut, "reallocs", stats.nRealloc);
+}
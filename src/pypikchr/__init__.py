@@ -18,3 +18,24 @@
 # along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
 
 __version__ = "0.2.0"
+
+from pypikchr.cache import (
+    CacheStats,
+    RenderCache,
+    get_render_cache,
+    set_render_cache,
+)
+from pypikchr.geometry import Layout, ShapeGeometry, SpatialIndex
+from pypikchr.stats import (
+    RenderStats,
+    get_render_hook,
+    render_with_stats,
+    set_render_hook,
+)
+from pypikchr.render import (
+    render,
+    render_async,
+    render_many,
+    render_many_async,
+    render_to,
+)
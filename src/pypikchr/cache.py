@@ -0,0 +1,292 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""Content-addressed cache for rendered SVG output."""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pypikchr
+from pypikchr.util.pikchr import create_pikchr, create_pikchr_themes
+
+# PikchrFlags.DARK_MODE
+_DARK_MODE: int = 0x0002
+
+
+@dataclass
+class CacheStats:
+    """Counters describing how a RenderCache has been used."""
+
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+_ID_ATTR = re.compile(r'data-pypikchr-id="(-?\d+)"')
+
+
+def _ordinals(objects: Optional[Sequence[tuple]]) -> Dict[int, int]:
+    """Number the distinct shape ids of the object tags by first appearance."""
+    ordinals: Dict[int, int] = {}
+    for tag in objects or ():
+        ordinals.setdefault(tag[1], len(ordinals) + 1)
+    return ordinals
+
+
+def _renumber(svg: str, mapping: Dict[int, int]) -> str:
+    """Replace the shape ids of the wrapper elements of an SVG."""
+    if all(old == new for old, new in mapping.items()):
+        return svg
+    return _ID_ATTR.sub(
+        lambda m: f'data-pypikchr-id="{mapping.get(int(m[1]), m[1])}"', svg
+    )
+
+
+def _to_cached(svg: str, objects: Optional[Sequence[tuple]]) -> str:
+    """Number the shape ids of a rendered SVG by position, for storage.
+
+    Shape ids are global to the process, so identical diagrams built twice
+    have different ids. Cached SVGs use the ordinal of each id instead.
+    """
+    return _renumber(svg, _ordinals(objects))
+
+
+def _from_cached(svg: str, objects: Optional[Sequence[tuple]]) -> str:
+    """Restore the shape ids of the object tags in a cached SVG."""
+    return _renumber(svg, {n: id_ for id_, n in _ordinals(objects).items()})
+
+
+def _svg_size(svg: str) -> int:
+    return len(svg) if svg.isascii() else len(svg.encode())
+
+
+class RenderCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        directory: Optional[str] = None,
+    ) -> None:
+        """Cache of rendered SVG keyed by a hash of everything pikchr sees.
+
+        Entries are kept in memory in least-recently-used order, bounded both by
+        count and by total size. If a directory is given, entries are also
+        written there and read back on a memory miss, so the cache survives
+        across processes.
+
+        Args:
+            max_entries (int): Maximum number of in-memory entries.
+
+            max_bytes (int): Maximum total size, in bytes, of in-memory entries.
+
+            directory (Optional[str]): Directory for the persistent tier.
+                Created if it does not exist.
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    @staticmethod
+    def key(
+        md: str,
+        svg_class: str = "",
+        flags: int = 0,
+        objects: Optional[Sequence[tuple]] = None,
+    ) -> str:
+        """Return the cache key for a set of create_pikchr arguments.
+
+        Shape ids are replaced by their ordinals, so diagrams built the same
+        way share entries. The version is included since renderer changes
+        alter the output.
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(md.encode())
+        h.update(b"\0")
+        h.update(svg_class.encode())
+        h.update(f"\0{int(flags)}\0{pypikchr.__version__}\0".encode())
+        if objects:
+            ordinals: Dict[int, int] = _ordinals(objects)
+            tags: List[tuple] = [
+                (tag[0], ordinals[tag[1]], *tag[2:]) for tag in objects
+            ]
+            h.update(repr(tags).encode())
+        return h.hexdigest()
+
+    @property
+    def stats(self) -> CacheStats:
+        """A snapshot of the cache counters."""
+        with self._lock:
+            return CacheStats(**vars(self._stats))
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached SVG for `key`, or None."""
+        with self._lock:
+            svg = self._entries.get(key)
+            if svg is not None:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return svg
+
+        svg = self._read_disk(key)
+        with self._lock:
+            if svg is None:
+                self._stats.misses += 1
+                return None
+            self._stats.disk_hits += 1
+            self._store(key, svg)
+        return svg
+
+    def put(self, key: str, svg: str) -> None:
+        """Store the SVG for `key` in memory and, if configured, on disk."""
+        with self._lock:
+            self._store(key, svg)
+        self._write_disk(key, svg)
+
+    def render(
+        self,
+        md: str,
+        svg_class: str = "",
+        flags: int = 0,
+        objects: Optional[Sequence[tuple]] = None,
+    ) -> str:
+        """Return the SVG for the given arguments, rendering it on a miss."""
+        key = self.key(md, svg_class, flags, objects)
+        svg = self.get(key)
+        if svg is not None:
+            return _from_cached(svg, objects)
+        if objects is None:
+            svg = create_pikchr(md, svg_class, flags, 0, 0)
+        else:
+            svg = create_pikchr(md, svg_class, flags, 0, 0, objects)
+        self.put(key, _to_cached(svg, objects))
+        return svg
+
+    def render_themes(
+        self,
+        md: str,
+        svg_class: str = "",
+        flags: int = 0,
+        objects: Optional[Sequence[tuple]] = None,
+    ) -> Tuple[str, str]:
+        """Return the light and dark SVGs, laying the diagram out once on a miss.
+
+        The entries are shared with `render` called with and without the
+        dark mode flag.
+        """
+        light_key = self.key(md, svg_class, flags & ~_DARK_MODE, objects)
+        dark_key = self.key(md, svg_class, flags | _DARK_MODE, objects)
+        light = self.get(light_key)
+        dark = self.get(dark_key)
+        if light is not None and dark is not None:
+            return _from_cached(light, objects), _from_cached(dark, objects)
+        light, dark = create_pikchr_themes(md, svg_class, flags, objects)
+        self.put(light_key, _to_cached(light, objects))
+        self.put(dark_key, _to_cached(dark, objects))
+        return light, dark
+
+    def clear(self) -> None:
+        """Drop all in-memory entries. The persistent tier is left untouched."""
+        with self._lock:
+            self._entries.clear()
+            self._stats.entries = 0
+            self._stats.bytes = 0
+
+    def _store(self, key: str, svg: str) -> None:
+        # Caller holds the lock
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._stats.bytes -= _svg_size(old)
+        size = _svg_size(svg)
+        if size > self._max_bytes or self._max_entries <= 0:
+            self._stats.entries = len(self._entries)
+            return
+        self._entries[key] = svg
+        self._stats.bytes += size
+        while (
+            len(self._entries) > self._max_entries
+            or self._stats.bytes > self._max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._stats.bytes -= _svg_size(evicted)
+            self._stats.evictions += 1
+        self._stats.entries = len(self._entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key[:2], f"{key}.svg")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if self._directory is None:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, svg: str) -> None:
+        if self._directory is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(svg)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+_render_cache: Optional[RenderCache] = None
+
+
+def set_render_cache(cache: Optional[RenderCache]) -> None:
+    """Set the cache consulted by `Diagram.__str__` and `render`.
+
+    Args:
+        cache (Optional[RenderCache]): The cache to use, or None to disable
+            caching.
+    """
+    global _render_cache
+    _render_cache = cache
+
+
+def get_render_cache() -> Optional[RenderCache]:
+    """Return the configured render cache, if any."""
+    return _render_cache
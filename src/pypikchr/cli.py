@@ -0,0 +1,413 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""Command line interface for batch rendering pikchr sources to SVG.
+
+Usage:
+    python -m pypikchr [options] PATH [PATH ...]
+
+Each PATH may be a file, a directory (searched recursively for *.pikchr files)
+or a glob pattern.
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import pypikchr
+from pypikchr.diagram.diagram import PikchrFlags
+from pypikchr.util.pikchr import (
+    PikchrCompileError,
+    create_pikchr_buffer,
+    render_to,
+    validate,
+)
+
+MANIFEST_NAME: str = ".pypikchr-manifest.json"
+
+
+class Job(NamedTuple):
+    source: str
+    output: str
+    key: str
+
+
+class Result(NamedTuple):
+    job: Job
+    seconds: float
+    error: Optional[str]
+
+
+@contextlib.contextmanager
+def atomic_file(path: str) -> Iterator[BinaryIO]:
+    """Open a temporary file which replaces `path` once the block succeeds.
+
+    Readers never see a partial file. If the block raises, the temporary file
+    is removed and `path` is left untouched.
+
+    Args:
+        path (str): Destination path. Parent directories are created.
+
+    Yields:
+        f (BinaryIO): The temporary file, opened for binary writing.
+    """
+    directory: str = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write `data` to `path` so that readers never see a partial file.
+
+    Args:
+        path (str): Destination path. Parent directories are created.
+
+        data (bytes): Content to write. Anything supporting the buffer protocol
+            is accepted.
+    """
+    with atomic_file(path) as f:
+        f.write(data)
+
+
+def source_key(source: bytes, svg_class: str, flags: int) -> str:
+    """Return the manifest key for a source rendered with the given options."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(source)
+    h.update(f"\0{svg_class}\0{int(flags)}\0{pypikchr.__version__}".encode())
+    return h.hexdigest()
+
+
+def _glob_base(pattern: str) -> str:
+    """Return the leading directories of a glob pattern without wildcards."""
+    fixed: List[str] = []
+    for part in pathlib.PurePath(pattern).parts:
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    return os.path.join(*fixed) if fixed else os.curdir
+
+
+def find_sources(paths: Sequence[str]) -> Iterator[Tuple[str, str]]:
+    """Expand files, directories and globs into pikchr sources.
+
+    Args:
+        paths (Sequence[str]): Files, directories or glob patterns.
+
+    Yields:
+        source (Tuple[str, str]): The source path and the path of its output
+            relative to the output directory. Outputs keep the directories of
+            sources below a directory or the fixed prefix of a glob.
+    """
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(
+                glob.glob(os.path.join(path, "**", "*.pikchr"), recursive=True)
+            )
+            base: Optional[str] = path
+        elif glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+            # Outputs keep their directories below the pattern's fixed prefix
+            base = _glob_base(path)
+        else:
+            matches = [path]
+            base = None
+        for match in matches:
+            if os.path.isdir(match):
+                continue
+            real: str = os.path.realpath(match)
+            if real in seen:
+                continue
+            seen.add(real)
+            rel: str = os.path.relpath(match, base) if base else os.path.basename(match)
+            yield match, os.path.splitext(rel)[0] + ".svg"
+
+
+def load_manifest(path: str) -> Dict[str, str]:
+    """Read a manifest mapping output paths to source keys."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _manifest_entry(manifest_path: str, output: str) -> str:
+    # Entries are relative to the manifest so output trees can be moved
+    base: str = os.path.dirname(os.path.abspath(manifest_path))
+    return os.path.relpath(os.path.abspath(output), base)
+
+
+def _render_job(job: Job, text: str, svg_class: str, flags: int) -> Result:
+    start: float = time.perf_counter()
+    try:
+        # Stream straight into the output file
+        with atomic_file(job.output) as f:
+            render_to(f.fileno(), text, svg_class, flags)
+    except PikchrCompileError:
+        # Render again for pikchr's full error report, with its context
+        svg = create_pikchr_buffer(text, svg_class, flags)
+        return Result(job, time.perf_counter() - start, str(svg).strip())
+    except Exception as err:
+        return Result(job, time.perf_counter() - start, str(err))
+    return Result(job, time.perf_counter() - start, None)
+
+
+def _check_job(job: Job, text: str, svg_class: str, flags: int) -> Result:
+    start: float = time.perf_counter()
+    try:
+        validate(text, flags)
+    except PikchrCompileError as err:
+        location: str = "" if err.line is None else f"{err.line}:{err.column}: "
+        return Result(job, time.perf_counter() - start, f"{location}{err.message}")
+    return Result(job, time.perf_counter() - start, None)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m pypikchr",
+        description="Render pikchr sources to SVG.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="Source files, directories (searched for *.pikchr) or glob patterns.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Directory for the SVG files. Defaults to next to each source.",
+    )
+    parser.add_argument(
+        "-c", "--class", dest="svg_class", default="", help="Class for the <svg>."
+    )
+    parser.add_argument("--dark", action="store_true", help="Use dark mode.")
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write the SVG without optional whitespace.",
+    )
+    parser.add_argument(
+        "--precision",
+        type=int,
+        choices=range(7),
+        metavar="{0-6}",
+        help="Number of decimals written for coordinates.",
+    )
+    parser.add_argument(
+        "--style-classes",
+        action="store_true",
+        help="Merge repeated inline styles into a <style> block.",
+    )
+    parser.add_argument(
+        "--plaintext-errors",
+        action="store_true",
+        help="Report errors as plain text instead of HTML.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--manifest",
+        help=(
+            "Manifest used to skip unchanged sources. Defaults to "
+            f"{MANIFEST_NAME} in the output directory, or the current directory."
+        ),
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only check that the sources compile. No files are written.",
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Render unchanged sources too."
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Only report errors."
+    )
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the command line interface.
+
+    Args:
+        argv (Optional[Sequence[str]]): Arguments, excluding the program name.
+            Defaults to `sys.argv[1:]`.
+
+    Returns:
+        status (int): 0 on success, 1 if any source could not be read, would
+            overwrite the output of another, or failed to render (or
+            compile, with --check), 2 if no sources were found.
+    """
+    args = build_parser().parse_args(argv)
+    flags: int = 0
+    if args.dark:
+        flags |= PikchrFlags.DARK_MODE
+    if args.plaintext_errors:
+        flags |= PikchrFlags.PLAINTEXT_ERRORS
+    if args.compact:
+        flags |= PikchrFlags.COMPACT
+    if args.precision is not None:
+        flags |= PikchrFlags.precision(args.precision)
+    if args.style_classes:
+        flags |= PikchrFlags.STYLE_CLASSES
+
+    manifest_path: str = args.manifest or os.path.join(
+        args.output_dir or os.curdir, MANIFEST_NAME
+    )
+    manifest: Dict[str, str] = load_manifest(manifest_path)
+
+    jobs: List[Tuple[Job, str]] = []
+    skipped: int = 0
+    found: int = 0
+    # Sources which could not be read or would overwrite another's output
+    unusable: int = 0
+    outputs: Dict[str, str] = {}
+    for source, rel in find_sources(args.paths):
+        found += 1
+        if args.output_dir:
+            output: str = os.path.join(args.output_dir, rel)
+        else:
+            output = os.path.splitext(source)[0] + ".svg"
+        real: str = os.path.normcase(os.path.abspath(output))
+        if real in outputs:
+            unusable += 1
+            print(
+                f"error: {source}: output {output} is also the output of "
+                f"{outputs[real]}",
+                file=sys.stderr,
+            )
+            continue
+        outputs[real] = source
+        try:
+            with open(source, "rb") as f:
+                data: bytes = f.read()
+        except OSError as err:
+            unusable += 1
+            print(f"error: {source}: {err.strerror}", file=sys.stderr)
+            continue
+        key: str = source_key(data, args.svg_class, flags)
+        entry: str = _manifest_entry(manifest_path, output)
+        if (
+            not args.check
+            and not args.force
+            and manifest.get(entry) == key
+            and os.path.exists(output)
+        ):
+            skipped += 1
+            if not args.quiet:
+                print(f"unchanged  {source}")
+            continue
+        jobs.append((Job(source, output, key), data.decode("utf-8", "replace")))
+
+    if not found:
+        print("error: no pikchr sources found", file=sys.stderr)
+        return 2
+
+    worker = _check_job if args.check else _render_job
+    start: float = time.perf_counter()
+    results: List[Result] = []
+    if len(jobs) <= 1 or args.jobs == 1:
+        results = [worker(job, text, args.svg_class, flags) for job, text in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [
+                pool.submit(worker, job, text, args.svg_class, flags)
+                for job, text in jobs
+            ]
+            results = [future.result() for future in futures]
+    elapsed: float = time.perf_counter() - start
+
+    failed: int = 0
+    if args.check:
+        for result in results:
+            if result.error is None:
+                if not args.quiet:
+                    print(f"ok  {result.job.source} ({result.seconds * 1000:.1f} ms)")
+            else:
+                failed += 1
+                print(f"{result.job.source}:{result.error}", file=sys.stderr)
+        if not args.quiet:
+            print(
+                f"{len(results) - failed} ok, {failed + unusable} failed "
+                f"in {elapsed:.2f} s"
+            )
+        return 1 if failed or unusable else 0
+
+    for result in results:
+        entry = _manifest_entry(manifest_path, result.job.output)
+        if result.error is None:
+            manifest[entry] = result.job.key
+            if not args.quiet:
+                print(
+                    f"rendered   {result.job.source} -> {result.job.output} "
+                    f"({result.seconds * 1000:.1f} ms)"
+                )
+        else:
+            failed += 1
+            manifest.pop(entry, None)
+            print(f"error: {result.job.source}:\n{result.error}", file=sys.stderr)
+
+    if results:
+        atomic_write(
+            manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode()
+        )
+    if not args.quiet:
+        print(
+            f"{len(results) - failed} rendered, {skipped} unchanged, "
+            f"{failed + unusable} failed in {elapsed:.2f} s"
+        )
+    return 1 if failed or unusable else 0
@@ -1,3 +1,6 @@
 from pypikchr.diagram.diagram import *
 from pypikchr.diagram.layout import *
 from pypikchr.diagram.shapes import *
+from pypikchr.diagram.table import *
+from pypikchr.diagram.graph import *
+from pypikchr.diagram.template import *
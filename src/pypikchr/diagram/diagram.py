@@ -21,17 +21,76 @@ from __future__ import annotations
 
 """Classes and utilities for holding a full pikchr diagram."""
 
-import re
+import codecs
+import io
+import queue
+import threading
+import time
 from enum import Enum
-from typing import Iterable, List, Optional, Union
-
-from pypikchr.diagram.shapes import Box, Shape
-from pypikchr.util.pikchr import PikchrException, create_pikchr
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from pypikchr.cache import RenderCache, get_render_cache
+from pypikchr.geometry import Layout, ShapeGeometry
+from pypikchr.stats import (
+    RenderHook_T,
+    RenderStats,
+    _observed_render,
+    get_render_hook,
+    render_with_stats,
+)
+from pypikchr.diagram.layout import Group
+from pypikchr.diagram.shapes import Box, ObjectTag_T, Shape, _byte_len
+from pypikchr.diagram.template import _SLOT, Template
+from pypikchr.util.pikchr import (
+    PikchrCompileError,
+    PikchrException,
+    create_pikchr,
+    create_pikchr_geometry,
+    create_pikchr_themes,
+    measure_text,
+    render_to,
+    validate,
+)
 
 
 class PikchrFlags(int, Enum):
     PLAINTEXT_ERRORS = 0x0001
     DARK_MODE = 0x0002
+    COMPACT = 0x0004
+    STYLE_CLASSES = 0x0008
+
+    @staticmethod
+    def precision(digits: int) -> int:
+        """Flag limiting coordinates and lengths to a number of decimals.
+
+        Combine it with the other flags, e.g.
+        `PikchrFlags.COMPACT | PikchrFlags.precision(2)`.
+
+        Args:
+            digits (int): Decimals written after the point, from 0 to 6.
+
+        Returns:
+            flag (int): The precision bits of the flags.
+        """
+        if not 0 <= digits <= 6:
+            raise ValueError(f"precision must be between 0 and 6, not {digits}")
+        return (digits + 1) << 4
+
+
+# Every PikchrFlags bit, including the precision field
+_VALID_FLAGS: int = 0x007F
 
 
 class Direction(str, Enum):
@@ -41,6 +100,75 @@ class Direction(str, Enum):
     up = "up"
 
 
+# Number of statements joined together as one cached block of markdown
+_MD_BLOCK: int = 256
+
+# Approximate size, in characters, of the chunks yielded by Diagram.iter_md
+_MD_CHUNK: int = 64 * 1024
+
+
+def _is_binary(fp: IO) -> bool:
+    """Whether a file-like object expects bytes rather than str."""
+    return isinstance(fp, (io.RawIOBase, io.BufferedIOBase)) or "b" in getattr(
+        fp, "mode", ""
+    )
+
+
+class _TextWriter:
+    """Adapt a text stream to receive UTF-8 chunks from render_to.
+
+    Chunks may split multi-byte characters, so they are decoded incrementally.
+    """
+
+    def __init__(self, fp: IO) -> None:
+        self._fp = fp
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def write(self, data: bytes) -> None:
+        self._fp.write(self._decoder.decode(data))
+
+
+class _Cancelled(Exception):
+    """Raised into the renderer when the consumer of iter_svg stops early."""
+
+
+class _ChunkQueue:
+    """Bounded queue of decoded chunks between render_to and iter_svg."""
+
+    def __init__(self, max_chunks: int = 4) -> None:
+        self._queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._closed = threading.Event()
+
+    def write(self, data: bytes) -> None:
+        text: str = self._decoder.decode(data)
+        if text:
+            self.put(text)
+
+    def put(self, item: Union[str, BaseException, None]) -> None:
+        # Poll so the producer notices when the consumer has gone away
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.05)
+                return
+            except queue.Full:
+                pass
+        raise _Cancelled()
+
+    def get(self) -> Union[str, BaseException, None]:
+        return self._queue.get()
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+def _svg_target(target: Union[int, IO]) -> Any:
+    """Return what render_to should write to for a file descriptor or stream."""
+    if isinstance(target, int) or _is_binary(target):
+        return target
+    return _TextWriter(target)
+
+
 class Diagram:
     def __init__(
         self,
@@ -60,18 +188,40 @@ class Diagram:
                 flags are:
                     - 0x0001 = Plain-text errors instead of HTML-formatted errors.
                     - 0x0002 = Use dark-mode.
+                    - 0x0004 = Compact output without optional whitespace.
+                    - 0x0008 = Merge repeated inline styles into classes.
+                    - 0x0010 to 0x0070 = Decimals written for coordinates, as
+                      returned by `PikchrFlags.precision(digits)`.
                 Multiple flag bits can be passed together (bitwise OR).
         """
         self._direction = direction
         self._shapes: List[Union[Shape, str]] = []
+
+        # Assembled markdown. Fragments are joined in blocks of _MD_BLOCK
+        # entries so that a change only re-joins the blocks it touches.
+        self._parts: List[str] = []
+        self._part_lens: List[int] = []
+        self._part_tags: List[Optional[List[ObjectTag_T]]] = []
+        self._blocks: List[Optional[str]] = []
+        self._positions: Dict[int, List[int]] = {}
+        self._dirty: Set[int] = set()
+        self._md_cache: Optional[str] = None
+        self._tags_cache: Optional[List[ObjectTag_T]] = None
+        # Whether a URL in the tags cache contains a Param
+        self._url_params: bool = False
+        # Length of the last SVG, used to size the output buffer of the next
+        self._size_hint: int = 0
         if shape:
-            self._shapes.append(shape)
+            self.add(shape)
 
-        if flags > (PikchrFlags.PLAINTEXT_ERRORS | PikchrFlags.DARK_MODE):
+        if flags < 0 or flags & ~_VALID_FLAGS:
             raise PikchrException(
                 "Valid flag bits are:\n"
                 "- PLAINTEXT_ERRORS: 0x0001\n"
-                "- DARK_MODE: 0x0002"
+                "- DARK_MODE: 0x0002\n"
+                "- COMPACT: 0x0004\n"
+                "- STYLE_CLASSES: 0x0008\n"
+                "- PikchrFlags.precision(digits): 0x0010 to 0x0070"
             )
         self._flags: int = flags
 
@@ -81,34 +231,84 @@ class Diagram:
         Args:
             item (Shape | str): A pypikchr shape object, or pikchr string.
         """
+        idx: int = len(self._shapes)
         self._shapes.append(item)
+        if idx % _MD_BLOCK == 0:
+            self._blocks.append(None)
+        else:
+            self._blocks[idx // _MD_BLOCK] = None
+        if isinstance(item, Shape):
+            item._add_owner(self)
+            self._positions.setdefault(id(item), []).append(idx)
+            self._parts.append("")
+            self._part_lens.append(0)
+            self._part_tags.append(None)
+            self._dirty.add(idx)
+        else:
+            self._parts.append(item)
+            self._part_lens.append(_byte_len(item))
+            self._part_tags.append(None)
+        self._md_cache = None
+        self._tags_cache = None
         return self
 
+    def _child_changed(self, shape: Shape) -> None:
+        """Mark the entries holding `shape` as needing a new fragment."""
+        self._dirty.update(self._positions.get(id(shape), ()))
+        self._md_cache = None
+        self._tags_cache = None
+
+    def _refresh(self) -> None:
+        """Rebuild dirty fragments and re-join the blocks containing them."""
+        if self._md_cache is not None:
+            return
+        for idx in self._dirty:
+            shape = self._shapes[idx]
+            part, part_len, part_tags = shape._fragment()
+            self._parts[idx] = part
+            self._part_lens[idx] = part_len
+            self._part_tags[idx] = part_tags
+            self._blocks[idx // _MD_BLOCK] = None
+        self._dirty.clear()
+
+        for b, block in enumerate(self._blocks):
+            if block is None:
+                start: int = b * _MD_BLOCK
+                self._blocks[b] = ";\n".join(self._parts[start : start + _MD_BLOCK])
+
+        blocks: List[str] = self._blocks
+        if self._direction != Direction.right:
+            blocks = [self._direction.value] + blocks
+        self._md_cache = ";\n".join(blocks)
+
     def auto_size_boxes(self, padding: float = 0.2) -> "Diagram":
         """Scale all boxes in the diagram to the width of the longest label.
 
+        Boxes inside groups and stacks are included. Text widths are measured
+        with pikchr's own character width table, as used by `fit`, so no
+        trial render is needed.
+
         Args:
-            padding (float): Extra width to add to the calculated maximum.
+            padding (float): Extra width to add to the widest text, in inches.
 
         Returns:
             self (Diagram): Scaled version of self.
         """
-        max_len = 0
         boxes: List[Box] = []
-        for s in self._shapes:
-            if isinstance(s, Box) and s._text:
-                boxes.append(s)
-                max_len = max(max_len, len(s._text))
+        pending: List[Iterable[Union[Shape, str]]] = [self._shapes]
+        while pending:
+            for s in pending.pop():
+                if isinstance(s, Box) and s._text:
+                    boxes.append(s)
+                elif isinstance(s, Group):
+                    pending.append(s._shapes)
 
         if not boxes:
             return self
 
-        # Heuristic for width: ~0.1 inches per character
-        # Standard pikchr box width is often 0.75 or 1.0 depending on text
-        # If we use fit, it does it automatically, but this provides some bit of
-        # normalization.
+        width = max(measure_text([b._text for b in boxes])) + padding
         for b in boxes:
-            b.width(max_len * 0.1 + padding)
+            b.width(round(width, 4))
 
         return self
 
@@ -119,91 +319,331 @@ class Diagram:
         Returns:
             md (str): Pikchr markdown for the diagram.
         """
-        return self._get_md(include_markers=False)
+        return self._get_md()
 
-    def _get_md(self, include_markers: bool = False) -> str:
-        md_parts = []
-        if self._direction != Direction.right:
-            md_parts.append(self._direction.value)
+    def _get_md(self, objects: Optional[List[ObjectTag_T]] = None) -> str:
+        """Build the markdown, optionally recording the shapes' object offsets.
+
+        Only shapes changed since the last call are regenerated.
 
-        for shape in self._shapes:
-            if isinstance(shape, Shape):
-                md_parts.append(shape.get_md(include_markers=include_markers))
+        Args:
+            objects (Optional[List[ObjectTag_T]]): If provided, receives an
+                entry per shape for the renderer to wrap its SVG elements.
+        """
+        self._refresh()
+        if objects is not None:
+            if self._tags_cache is None:
+                tags: List[ObjectTag_T] = []
+                pos: int = 0
+                if self._direction != Direction.right:
+                    pos += len(self._direction.value) + 2
+                for part_len, part_tags in zip(self._part_lens, self._part_tags):
+                    if part_tags:
+                        tags.extend(
+                            (pos + off, sid, url) for off, sid, url in part_tags
+                        )
+                    # Statements are separated by ";\n"
+                    pos += part_len + 2
+                self._tags_cache = tags
+                self._url_params = any(url and "\x00" in url for _, _, url in tags)
+            objects.extend(self._tags_cache)
+        return self._md_cache
+
+    def _render_md(self, objects: List[ObjectTag_T]) -> str:
+        """`_get_md` for rendering, which rejects params left in the diagram.
+
+        Raises:
+            PikchrException: If the diagram contains a `Param`.
+        """
+        md: str = self._get_md(objects)
+        if "\x00" in md or self._url_params:
+            names: Dict[str, None] = dict.fromkeys(_SLOT.findall(md))
+            for _, _, url in objects:
+                if url:
+                    names.update(dict.fromkeys(_SLOT.findall(url)))
+            raise PikchrException(
+                f"Unbound parameters: {', '.join(names)}! "
+                "Compile the diagram with Diagram.compile() to render it."
+            )
+        return md
+
+    def iter_md(self) -> Iterator[str]:
+        """Yield the pikchr markdown for the diagram chunk by chunk.
+
+        Unlike `md`, the full markdown is never assembled in memory. Groups and
+        stacks stream their contents rather than building their [...] blocks.
+        Concatenating the chunks gives the same result as `md`.
+
+        Yields:
+            chunk (str): The next piece of the markdown.
+        """
+        if self._md_cache is not None:
+            yield self._md_cache
+            return
+
+        pending: List[str] = []
+        size: int = 0
+        sep: str = ""
+        if self._direction != Direction.right:
+            pending.append(self._direction.value)
+            size = len(self._direction.value)
+            sep = ";\n"
+        for idx, item in enumerate(self._shapes):
+            pending.append(sep)
+            sep = ";\n"
+            if isinstance(item, Shape) and idx in self._dirty:
+                pieces: Iterable[str] = item._iter_md()
             else:
-                md_parts.append(shape)
+                pieces = (self._parts[idx],)
+            for piece in pieces:
+                pending.append(piece)
+                size += len(piece)
+                if size >= _MD_CHUNK:
+                    yield "".join(pending)
+                    pending.clear()
+                    size = 0
+        if pending:
+            yield "".join(pending)
+
+    def write_md(self, fp: IO) -> None:
+        """Stream the pikchr markdown for the diagram to a file-like object.
 
-        return ";\n".join(md_parts)
+        Args:
+            fp (IO): A text or binary file-like object, e.g. an open file or
+                `socket.makefile("wb")`. Binary streams receive UTF-8.
+        """
+        binary: bool = _is_binary(fp)
+        for chunk in self.iter_md():
+            fp.write(chunk.encode() if binary else chunk)
 
     def __str__(self) -> str:
         """Return the generated SVG HTML from the pikchr markdown for the diagram.
 
+        The configured render cache, if any, is consulted first. Each shape's
+        SVG elements are wrapped in a <g data-pypikchr-id="...">,
+        or an <a href="..."> if the shape has a URL.
+
         Returns:
             html (str): Generated HTML for the markdown for the diagram.
         """
         if not self._shapes:
             return ""
-        svg: str = create_pikchr(
-            self._get_md(include_markers=True), "", self._flags, 0, 0
+        hook: Optional[RenderHook_T] = get_render_hook()
+        if hook is not None:
+            return self._observed_str(hook)
+        objects: List[ObjectTag_T] = []
+        md: str = self._render_md(objects)
+        cache: Optional[RenderCache] = get_render_cache()
+        if cache is not None:
+            return cache.render(md, "", self._flags, objects)
+        svg: str = create_pikchr(md, "", self._flags, 0, 0, objects, self._size_hint)
+        # Pre-size the output buffer of the next render
+        self._size_hint = len(svg)
+        return svg
+
+    def _observed_str(self, hook: RenderHook_T) -> str:
+        """`__str__` while a render hook is set, timing the markdown too."""
+        start = time.perf_counter()
+        objects: List[ObjectTag_T] = []
+        md: str = self._render_md(objects)
+        markdown = time.perf_counter() - start
+        svg = _observed_render(
+            hook, md, "", self._flags, objects, self._size_hint, markdown
         )
+        self._size_hint = len(svg)
+        return svg
 
-        # Post-process for URLs and grouping
-        if "[[pypikchr-id:" in svg:
-            lines: List[str] = svg.splitlines()
-            processed_lines: List[str] = []
-
-            i: int = 0
-            while i < len(lines):
-                line: str = lines[i]
-                marker_match: Optional[re.Match] = re.search(
-                    r"\[\[pypikchr-id:(\d+)(?::url:(.*?))?\]\]", line
-                )
-                if marker_match:
-                    # id_num = marker_match.group(1)
-                    url = marker_match.group(2)
-
-                    # Remove the marker from the text
-                    line = re.sub(r"\s*\[\[pypikchr-id:.*?\]\]", "", line)
-
-                    # Look back for associated shape elements
-                    back_idx: int = len(processed_lines) - 1
-                    elements_to_wrap: List[str] = []
-                    while back_idx >= 0:
-                        prev_line = processed_lines[back_idx]
-                        # Stop if we hit a previous wrapper or the start
-                        if any(stop in prev_line for stop in ["</a>", "</g>", "<svg"]):
-                            break
-                        # Collect SVG elements that belong to this shape
-                        if any(
-                            tag in prev_line
-                            for tag in [
-                                "<path",
-                                "<polygon",
-                                "<rect",
-                                "<circle",
-                                "<ellipse",
-                                "<text",
-                            ]
-                        ):
-                            elements_to_wrap.insert(0, processed_lines.pop(back_idx))
-                        back_idx -= 1
-
-                    if url:
-                        processed_lines.append(f'<a href="{url}">')
-                    else:
-                        processed_lines.append("<g>")
-
-                    processed_lines.extend(elements_to_wrap)
-                    # Don't add empty text lines (if marker was the only content)
-                    if not re.match(r"^\s*<text[^>]*>\s*</text>\s*$", line):
-                        processed_lines.append(line)
-
-                    if url:
-                        processed_lines.append("</a>")
-                    else:
-                        processed_lines.append("</g>")
-                else:
-                    processed_lines.append(line)
-                i += 1
-            svg = "\n".join(processed_lines)
+    def profile(self) -> Tuple[str, RenderStats]:
+        """Render the diagram once, measuring each phase.
 
-        return svg
+        The render cache and render hook are not used.
+
+        Returns:
+            svg (str): Generated SVG HTML, or the error text.
+
+            stats (RenderStats): Time spent generating the markdown and in
+                each phase of pikchr, with counters of the work done.
+        """
+        if not self._shapes:
+            return "", RenderStats()
+        start = time.perf_counter()
+        objects: List[ObjectTag_T] = []
+        md: str = self._render_md(objects)
+        markdown = time.perf_counter() - start
+        svg, stats = render_with_stats(md, "", self._flags, objects, self._size_hint)
+        stats.markdown = markdown
+        stats.total += markdown
+        return svg, stats
+
+    def render_to(self, target: Union[int, IO]) -> int:
+        """Stream the generated SVG HTML to a file as pikchr produces it.
+
+        The SVG is never held in memory as a whole, which keeps the peak
+        memory of very large diagrams down. Nothing is written if the
+        diagram does not compile.
+
+        Args:
+            target (int | IO): A file descriptor, or a binary or text
+                file-like object. Binary targets receive UTF-8.
+
+        Returns:
+            size (int): Number of bytes written.
+
+        Raises:
+            PikchrCompileError: If the markdown does not compile.
+        """
+        if not self._shapes:
+            return 0
+        objects: List[ObjectTag_T] = []
+        md: str = self._render_md(objects)
+        _, _, size = render_to(_svg_target(target), md, "", self._flags, objects)
+        return size
+
+    def render_themes(self) -> Tuple[str, str]:
+        """Return the generated SVG HTML in both light and dark mode.
+
+        Pikchr parses and lays out the diagram once and renders the objects
+        twice, which is cheaper than calling `str()` with each flag. The
+        DARK_MODE flag of the diagram is ignored. Errors are returned as the
+        text of both.
+
+        Returns:
+            svgs (Tuple[str, str]): The light and the dark SVG HTML.
+        """
+        if not self._shapes:
+            return "", ""
+        objects: List[ObjectTag_T] = []
+        md: str = self._render_md(objects)
+        cache: Optional[RenderCache] = get_render_cache()
+        if cache is not None:
+            return cache.render_themes(md, "", self._flags, objects)
+        return create_pikchr_themes(md, "", self._flags, objects)
+
+    def _shapes_by_id(self) -> Dict[int, Shape]:
+        """Map the ids of all shapes, including those in groups, to shapes."""
+        shapes: Dict[int, Shape] = {}
+        pending: List[Union[Shape, str]] = list(self._shapes)
+        while pending:
+            item = pending.pop()
+            if isinstance(item, Shape):
+                shapes[item._id] = item
+                if isinstance(item, Group):
+                    pending.extend(item._shapes)
+        return shapes
+
+    def layout(self, svg: bool = True) -> Layout:
+        """Lay out the diagram and return the geometry of every shape.
+
+        The geometry is in the coordinates of the SVG viewBox, so clicks on
+        the rendered SVG can be mapped back to shapes with `Layout.index`.
+
+        Args:
+            svg (bool): Also generate the SVG. If False, the diagram is only
+                laid out, which is cheaper, and `Layout.svg` is None.
+
+        Returns:
+            layout (Layout): The SVG (or error text) and per-shape geometry.
+        """
+        if not self._shapes:
+            return Layout("" if svg else None, [])
+        objects: List[ObjectTag_T] = []
+        md: str = self._render_md(objects)
+        svg_text, records = create_pikchr_geometry(md, "", self._flags, objects, svg)
+        shapes: Dict[int, Shape] = self._shapes_by_id()
+        return Layout(
+            svg_text,
+            [
+                ShapeGeometry(shapes[sid], (x0, y0, x1, y1), (cx, cy), path)
+                for sid, x0, y0, x1, y1, cx, cy, path in records
+            ],
+        )
+
+    def compile(
+        self,
+        defaults: Optional[Mapping[str, object]] = None,
+        cache_entries: int = 256,
+    ) -> Template:
+        """Compile the diagram into a template rendered with values for its params.
+
+        The markdown is generated once, with a placeholder for each `Param`
+        used as the text, attributes or URL of a shape. Later changes to the
+        diagram do not affect the template.
+
+        Args:
+            defaults (Optional[Mapping[str, object]]): Values used for params
+                which are not given when rendering.
+
+            cache_entries (int): Number of SVGs, keyed by the bound values, to
+                keep in the template's cache. 0 disables the cache.
+
+        Returns:
+            template (Template): The compiled template.
+        """
+        objects: List[ObjectTag_T] = []
+        md: str = self._get_md(objects)
+        cache: Optional[RenderCache] = None
+        if cache_entries > 0:
+            cache = RenderCache(max_entries=cache_entries)
+        return Template(md, objects, self._flags, defaults, cache)
+
+    def validate(self) -> Tuple[int, int]:
+        """Check that the diagram compiles, without generating any SVG.
+
+        The markdown is parsed and laid out as for `str(diagram)`, which makes
+        this much cheaper than rendering when only errors matter.
+
+        Returns:
+            size (Tuple[int, int]): Width and height of the diagram in pixels.
+
+        Raises:
+            PikchrCompileError: If the markdown does not compile. Its `line`,
+                `column` and `message` attributes describe the first error.
+        """
+        return validate(self._render_md([]), self._flags)
+
+    def iter_svg(self) -> Iterator[str]:
+        """Yield the generated SVG HTML for the diagram chunk by chunk.
+
+        Pikchr renders on a background thread and hands over the SVG in
+        chunks of about 64 KiB as it produces them, so only a few chunks are
+        held in memory at a time. Concatenating the chunks gives the same
+        result as `str(diagram)`, including the error text of a diagram
+        which does not compile. The render cache is not used.
+
+        Yields:
+            chunk (str): The next piece of the generated HTML.
+        """
+        if not self._shapes:
+            return
+        objects: List[ObjectTag_T] = []
+        md: str = self._render_md(objects)
+        writer = _ChunkQueue()
+
+        def produce() -> None:
+            try:
+                try:
+                    render_to(writer, md, "", self._flags, objects)
+                except PikchrCompileError:
+                    # Nothing was written, render again for pikchr's error text
+                    writer.put(create_pikchr(md, "", self._flags, 0, 0, objects))
+                except _Cancelled:
+                    raise
+                except BaseException as err:
+                    writer.put(err)
+                writer.put(None)
+            except _Cancelled:
+                pass
+
+        thread = threading.Thread(target=produce, name="pypikchr-iter-svg")
+        thread.start()
+        try:
+            while True:
+                chunk: Union[str, BaseException, None] = writer.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            writer.close()
+            thread.join()
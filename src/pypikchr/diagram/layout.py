@@ -1,33 +1,87 @@
 from __future__ import annotations
 
-from typing import List, Union, Optional
+from typing import Iterator, List, Union, Optional
 
-from pypikchr.diagram.shapes import Shape, Shape_T
+from pypikchr.diagram.shapes import (
+    Fragment_T,
+    MdPiece_T,
+    ObjectTag_T,
+    Shape,
+    Shape_T,
+    _byte_len,
+)
 
 
 class Group(Shape):
+    __slots__ = ("_shapes", "__weakref__")
+
     def __init__(self) -> None:
         super().__init__("group")
         self._shapes: List[Union[Shape, str]] = []
 
     def add(self, item: Union[Shape, str]) -> Group:
         self._shapes.append(item)
+        if isinstance(item, Shape):
+            item._add_owner(self)
+        self._touch()
         return self
 
-    @property
-    def md(self) -> str:
-        content = []
+    def _child_changed(self, child: Shape) -> None:
+        self._touch()
+
+    def _header(self) -> List[str]:
+        """Statements placed before the contents of the [...] block."""
+        return []
+
+    def _iter_md(self) -> Iterator[str]:
+        if self._fragment_cache is not None:
+            yield self._fragment_cache[0]
+            return
+        # Stream the contents rather than building the [...] block
+        yield "[\n  "
+        sep: str = ""
+        for s in self._header():
+            yield sep
+            yield s
+            sep = ";\n  "
+        for s in self._shapes:
+            yield sep
+            if isinstance(s, Shape):
+                yield from s._iter_md()
+            else:
+                yield s
+            sep = ";\n  "
+        yield "\n]"
+
+    def _chained_md(self) -> MdPiece_T:
+        # The contents are the [...] block, not a single statement
+        return self._fragment()[0] + "; "
+
+    def _build_fragment(self) -> Fragment_T:
+        content = self._header()
+        tags: List[ObjectTag_T] = []
+        # Contents start after "[\n  " and are separated by ";\n  "
+        pos: int = 4 + sum(_byte_len(s) + 4 for s in content)
         for s in self._shapes:
             if isinstance(s, Shape):
-                content.append(s.md)
+                s_md, s_len, s_tags = s._fragment()
+                tags.extend((pos + off, sid, url) for off, sid, url in s_tags)
             else:
-                content.append(s)
+                s_md, s_len = s, _byte_len(s)
+            content.append(s_md)
+            pos += s_len + 4
 
         inner_md = ";\n  ".join(content)
-        return f"[\n  {inner_md}\n]"
+        md = f"[\n  {inner_md}\n]"
+        md_len = _byte_len(md)
+        # The [...] object is identified by its closing bracket
+        tags.append((md_len - 1, self._id, self._escaped_url()))
+        return md, md_len, tags
 
 
 class Stack(Group):
+    __slots__ = ("_direction", "_spacing")
+
     def __init__(
         self, direction: str = "down", spacing: Optional[float] = None
     ) -> None:
@@ -43,17 +97,8 @@ class Stack(Group):
         super().add(item)
         return self
 
-    @property
-    def md(self) -> str:
+    def _header(self) -> List[str]:
         content = [self._direction]
         if self._spacing:
             content.append(f"dist {self._spacing}")
-
-        for s in self._shapes:
-            if isinstance(s, Shape):
-                content.append(s.md)
-            else:
-                content.append(s)
-
-        inner_md = ";\n  ".join(content)
-        return f"[\n  {inner_md}\n]"
+        return content
@@ -23,14 +23,20 @@ from __future__ import annotations
 
 __author__ = "Gabriel Dorlhiac"
 
+import html
 import sys
 import warnings
+import weakref
 from typing import (
     TYPE_CHECKING,
     Any,
     ClassVar,
+    Iterator,
+    List,
     Literal,
+    NamedTuple,
     Optional,
+    Tuple,
     TypedDict,
     Union,
     overload,
@@ -42,10 +48,81 @@ else:
     TypeAlias = Any
 
 Shape_T: TypeAlias = "Shape"
+# (byte offset of the object's class name in the markdown, shape id, url)
+ObjectTag_T: TypeAlias = Tuple[int, int, Optional[str]]
+# (markdown, UTF-8 length of the markdown, object tags relative to its start)
+Fragment_T: TypeAlias = Tuple[str, int, List[ObjectTag_T]]
+
+
+def _byte_len(text: str) -> int:
+    """Length of `text` once UTF-8 encoded for pikchr."""
+    return len(text) if text.isascii() else len(text.encode())
+
+
+class _Rope(NamedTuple):
+    """Immutable concatenation of markdown pieces.
+
+    Chaining shapes with >> and << links the pieces of the chain together
+    instead of copying the markdown accumulated so far, so a chain of n shapes
+    is built in O(n) and only joined once its markdown is generated.
+    """
+
+    left: MdPiece_T
+    right: MdPiece_T
+    nbytes: int  # UTF-8 length of the joined text
+
+
+MdPiece_T: TypeAlias = Union[str, _Rope]
+
+
+def _piece_len(piece: MdPiece_T) -> int:
+    return piece.nbytes if isinstance(piece, _Rope) else _byte_len(piece)
+
+
+def _concat(left: MdPiece_T, right: MdPiece_T) -> MdPiece_T:
+    if not left:
+        return right
+    if not right:
+        return left
+    return _Rope(left, right, _piece_len(left) + _piece_len(right))
+
+
+def _join(piece: MdPiece_T) -> str:
+    """Join a rope into a string without recursing."""
+    if isinstance(piece, str):
+        return piece
+    parts: List[str] = []
+    stack: List[MdPiece_T] = [piece]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        else:
+            stack.append(item.right)
+            stack.append(item.left)
+    return "".join(parts)
 
 
 class Shape:
-    """Base class for all Pikchr shapes."""
+    """Base class for all Pikchr shapes.
+
+    Shapes use __slots__ to keep very large diagrams compact. Pikchr attributes
+    are kept in a flat (key, value, key, value, ...) tuple since their order
+    is significant to pikchr (e.g. `right 1 up 1` vs `up 1 right 1`).
+    """
+
+    __slots__ = (
+        "_shape_type",
+        "_text",
+        "_url",
+        "_label",
+        "_attrs",
+        "_md_prefix",
+        "_md_suffix",
+        "_fragment_cache",
+        "_owners",
+        "_id",
+    )
 
     anchor_points: ClassVar[set[str]] = {
         "nw",
@@ -66,12 +143,74 @@ class Shape:
         self._text = text
         self._url: Optional[str] = None
         self._label: Optional[str] = None
-        self._attributes: dict[str, Any] = {}
-        self._md_prefix: str = ""
-        self._md_suffix: str = ""
+        self._attrs: Tuple[Any, ...] = ()
+        self._md_prefix: MdPiece_T = ""
+        self._md_suffix: MdPiece_T = ""
+        self._fragment_cache: Optional[Fragment_T] = None
+        # Weak reference(s) to the diagrams/groups holding this shape. A single
+        # owner is stored directly rather than in a list.
+        self._owners: Union[None, weakref.ref, List[weakref.ref]] = None
         Shape._id_counter += 1
         self._id = Shape._id_counter
 
+    def _touch(self) -> None:
+        """Drop the cached markdown and notify the containers holding the shape.
+
+        Called by every builder method that changes the generated markdown.
+        """
+        self._fragment_cache = None
+        owners = self._owners
+        if owners is None:
+            return
+        if isinstance(owners, weakref.ref):
+            owner = owners()
+            if owner is None:
+                self._owners = None
+            else:
+                owner._child_changed(self)
+            return
+        live: List[weakref.ref] = []
+        for ref in owners:
+            owner = ref()
+            if owner is not None:
+                owner._child_changed(self)
+                live.append(ref)
+        self._owners = live
+
+    def _add_owner(self, owner: Any) -> None:
+        """Register a container to be notified when this shape changes."""
+        ref = weakref.ref(owner)
+        owners = self._owners
+        if owners is None or (isinstance(owners, weakref.ref) and owners() is None):
+            self._owners = ref
+        elif isinstance(owners, weakref.ref):
+            if owners is not ref:
+                self._owners = [owners, ref]
+        elif not any(r is ref for r in owners):
+            owners.append(ref)
+
+    def _set(self, key: str, val: Any) -> None:
+        """Set a pikchr attribute and invalidate the cached markdown.
+
+        An attribute that is already set keeps its position.
+        """
+        attrs = self._attrs
+        for i in range(0, len(attrs), 2):
+            if attrs[i] == key:
+                self._attrs = attrs[: i + 1] + (val,) + attrs[i + 2 :]
+                break
+        else:
+            self._attrs = attrs + (key, val)
+        self._touch()
+
+    def _get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a pikchr attribute, or `default` if unset."""
+        attrs = self._attrs
+        for i in range(0, len(attrs), 2):
+            if attrs[i] == key:
+                return attrs[i + 1]
+        return default
+
     @property
     def name(self) -> str:
         return self._label if self._label else self._shape_type
@@ -94,6 +233,7 @@ class Shape:
                 )
                 break  # Only need to warn once
         self._label = upper_case
+        self._touch()
         return self
 
     def url(self, link: str) -> Shape_T:
@@ -103,45 +243,50 @@ class Shape:
         the shape and its text.
         """
         self._url = link
+        self._touch()
         return self
 
+    def _escaped_url(self) -> Optional[str]:
+        """The URL escaped for use in an SVG attribute, if one is set."""
+        return html.escape(self._url) if self._url else None
+
     def width(self, val: Union[float, str]) -> Shape_T:
-        self._attributes["width"] = val
+        self._set("width", val)
         return self
 
     def height(self, val: Union[float, str]) -> Shape_T:
-        self._attributes["height"] = val
+        self._set("height", val)
         return self
 
     def radius(self, val: Union[float, str]) -> Shape_T:
-        self._attributes["radius"] = val
+        self._set("radius", val)
         return self
 
     def diameter(self, val: Union[float, str]) -> Shape_T:
-        self._attributes["diameter"] = val
+        self._set("diameter", val)
         return self
 
     def thick(self) -> Shape_T:
-        self._attributes["thick"] = True
+        self._set("thick", True)
         return self
 
     def thin(self) -> Shape_T:
-        self._attributes["thin"] = True
+        self._set("thin", True)
         return self
 
     def fill(self, color: str) -> Shape_T:
-        self._attributes["fill"] = color
+        self._set("fill", color)
         return self
 
     def color(self, color: str) -> Shape_T:
-        self._attributes["color"] = color
+        self._set("color", color)
         return self
 
     def at(self, pos: Union[str, Shape_T]) -> Shape_T:
         if isinstance(pos, Shape):
-            self._attributes["at"] = pos.name
+            self._set("at", pos.name)
         else:
-            self._attributes["at"] = pos
+            self._set("at", pos)
         return self
 
     def right_of(self, other: Shape_T, offset: Optional[float] = None) -> Shape_T:
@@ -149,7 +294,7 @@ class Shape:
         pos = f"{other.name}.e"
         if offset is not None:
             pos += f" + ({offset}, 0)"
-        self._attributes["at"] = pos
+        self._set("at", pos)
         return self
 
     def left_of(self, other: Shape_T, offset: Optional[float] = None) -> Shape_T:
@@ -157,7 +302,7 @@ class Shape:
         pos = f"{other.name}.w"
         if offset is not None:
             pos += f" - ({offset}, 0)"
-        self._attributes["at"] = pos
+        self._set("at", pos)
         return self
 
     def above(self, other: Shape_T, offset: Optional[float] = None) -> Shape_T:
@@ -165,7 +310,7 @@ class Shape:
         pos = f"{other.name}.n"
         if offset is not None:
             pos += f" + (0, {offset})"
-        self._attributes["at"] = pos
+        self._set("at", pos)
         return self
 
     def below(self, other: Shape_T, offset: Optional[float] = None) -> Shape_T:
@@ -173,56 +318,56 @@ class Shape:
         pos = f"{other.name}.s"
         if offset is not None:
             pos += f" - (0, {offset})"
-        self._attributes["at"] = pos
+        self._set("at", pos)
         return self
 
     def align_to(self, other: Shape_T, anchor: str = "c") -> Shape_T:
         """Align this shape's center to an anchor of another shape."""
         if anchor not in self.anchor_points:
             raise ValueError(f"Invalid anchor: {anchor}")
-        self._attributes["at"] = f"{other.name}.{anchor}"
+        self._set("at", f"{other.name}.{anchor}")
         return self
 
     def from_pos(self, pos: Union[str, Shape_T]) -> Shape_T:
         if isinstance(pos, Shape):
-            self._attributes["from"] = pos.name
+            self._set("from", pos.name)
         else:
-            self._attributes["from"] = pos
+            self._set("from", pos)
         return self
 
     def to_pos(self, pos: Union[str, Shape_T]) -> Shape_T:
         if isinstance(pos, Shape):
-            self._attributes["to"] = pos.name
+            self._set("to", pos.name)
         else:
-            self._attributes["to"] = pos
+            self._set("to", pos)
         return self
 
     def dotted(self) -> Shape_T:
-        self._attributes["dotted"] = True
+        self._set("dotted", True)
         return self
 
     def dashed(self) -> Shape_T:
-        self._attributes["dashed"] = True
+        self._set("dashed", True)
         return self
 
     def up(self, val: Optional[float] = None) -> Shape_T:
-        self._attributes["up"] = val if val is not None else True
+        self._set("up", val if val is not None else True)
         return self
 
     def down(self, val: Optional[float] = None) -> Shape_T:
-        self._attributes["down"] = val if val is not None else True
+        self._set("down", val if val is not None else True)
         return self
 
     def left(self, val: Optional[float] = None) -> Shape_T:
-        self._attributes["left"] = val if val is not None else True
+        self._set("left", val if val is not None else True)
         return self
 
     def right(self, val: Optional[float] = None) -> Shape_T:
-        self._attributes["right"] = val if val is not None else True
+        self._set("right", val if val is not None else True)
         return self
 
     def fit(self) -> Shape_T:
-        self._attributes["fit"] = True
+        self._set("fit", True)
         return self
 
     @property
@@ -263,113 +408,190 @@ class Shape:
 
     @property
     def md(self) -> str:
-        return self.get_md(include_markers=False)
+        return self._fragment()[0]
 
     def get_md(self, include_markers: bool = False) -> str:
+        """Return the markdown for the shape.
+
+        Deprecated: use the `md` property instead. Shapes no longer embed
+        markers in their markdown, so `include_markers` is ignored.
+
+        Args:
+            include_markers (bool): Ignored.
+
+        Returns:
+            md (str): The same as `md`.
+        """
+        warnings.warn(
+            "Shape.get_md is deprecated, use the md property instead.",
+            category=DeprecationWarning,
+            stacklevel=2,
+        )
+        return self.md
+
+    def _fragment(self) -> Fragment_T:
+        """Return the cached markdown fragment, rebuilding it if stale."""
+        if self._fragment_cache is None:
+            self._fragment_cache = self._build_fragment()
+        return self._fragment_cache
+
+    def _iter_md(self) -> Iterator[str]:
+        """Yield the markdown in pieces which concatenate to `md`.
+
+        A stale fragment is built for the caller but not cached, so streaming a
+        large diagram does not retain a copy of every shape's markdown.
+        """
+        fragment = self._fragment_cache or self._build_fragment()
+        yield fragment[0]
+
+    def _build_fragment(self) -> Fragment_T:
+        """Build the markdown along with the object tags the renderer needs.
+
+        The tags let the renderer wrap this shape's SVG elements in a <g>, or
+        an <a> if a URL is set. Their offsets are relative to the fragment.
+        """
+        prefix_len: int = _piece_len(self._md_prefix)
+        pos: int = prefix_len
+        if self._label:
+            pos += _byte_len(self._label) + 2
+        tags: List[ObjectTag_T] = [(pos, self._id, self._escaped_url())]
+
+        content: str = self._content()
+        md = f"{_join(self._md_prefix)}{content}{_join(self._md_suffix)}"
+        nbytes: int = prefix_len + _byte_len(content) + _piece_len(self._md_suffix)
+        return md, nbytes, tags
+
+    def _content(self) -> str:
+        """The statement for this shape alone, without chained markdown."""
         parts = []
         if self._label:
             parts.append(f"{self._label}:")
         parts.append(self._shape_type)
 
-        if include_markers:
-            # We add a marker to identify where this shape's elements end in the SVG
-            marker = f"[[pypikchr-id:{self._id}"
-            if self._url:
-                marker += f":url:{self._url}"
-            marker += "]]"
-
-            if self._text:
-                parts.append(f'"{self._text} {marker}"')
-            else:
-                parts.append(f'"{marker}"')
-        elif self._text:
+        if self._text:
             parts.append(f'"{self._text}"')
 
-        for k, v in self._attributes.items():
+        attrs = iter(self._attrs)
+        for k, v in zip(attrs, attrs):
             if v is True:
                 parts.append(k)
             else:
                 parts.append(f"{k} {v}")
 
-        content = " ".join(parts)
-        return f"{self._md_prefix}{content}{self._md_suffix}"
+        return " ".join(parts)
+
+    def _chained_md(self) -> MdPiece_T:
+        """The markdown of this shape as a rope, for chaining onto another."""
+        return _concat(
+            _concat(self._md_prefix, self._content()),
+            _concat(self._md_suffix, "; "),
+        )
 
     def __rshift__(self, other: Union[Shape_T, str]) -> Shape_T:
         """The >> operator can be used to chain shapes."""
         if isinstance(other, Shape):
-            other._md_prefix = self.md + "; "
+            other._md_prefix = self._chained_md()
+            other._touch()
             return other
-        self._md_suffix += f"; {other}"
+        self._md_suffix = _concat(self._md_suffix, f"; {other}")
+        self._touch()
         return self
 
     def __lshift__(self, other: Union[Shape_T, str]) -> Shape_T:
         if isinstance(other, Shape):
-            self._md_prefix = other.md + "; "
-            return self
-        self._md_prefix = f"{other}; " + self._md_prefix
+            self._md_prefix = other._chained_md()
+        else:
+            self._md_prefix = _concat(f"{other}; ", self._md_prefix)
+        self._touch()
         return self
 
 
 class Box(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("box", text)
 
 
 class Circle(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("circle", text)
 
 
 class Ellipse(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("ellipse", text)
 
 
 class Oval(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("oval", text)
 
 
 class Cylinder(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("cylinder", text)
 
 
 class File(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("file", text)
 
 
 class Diamond(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("diamond", text)
 
 
 class Line(Shape):
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__("line")
 
 
 class Arrow(Shape):
+    __slots__ = ()
+
     def __init__(self, text: Optional[str] = None) -> None:
         super().__init__("arrow", text)
 
 
 class Spline(Shape):
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__("spline")
 
 
 class Dot(Shape):
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__("dot")
 
 
 class Arc(Shape):
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__("arc")
 
 
 class Text(Shape):
+    __slots__ = ()
+
     def __init__(self, text: str) -> None:
         super().__init__("text", text)
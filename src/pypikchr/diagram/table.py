@@ -0,0 +1,226 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""Columnar builder for diagrams with very many shapes."""
+
+import itertools
+import warnings
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
+
+from pypikchr.diagram.shapes import Fragment_T, Shape, Shape_T
+
+# A column is either one value for every row or a sequence with one per row
+Column_T = Union[None, str, float, Sequence[Any]]
+
+
+def _is_scalar(values: Any) -> bool:
+    return isinstance(values, str) or not hasattr(values, "__len__")
+
+
+# Columns in the order their attributes are emitted, after the shape type,
+# with the format of each attribute
+_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("texts", ' "{}"'),
+    ("widths", " width {}"),
+    ("heights", " height {}"),
+    ("fills", " fill {}"),
+    ("colors", " color {}"),
+    ("positions", " at {}"),
+    ("attrs", " {}"),
+)
+
+
+def _format_column(values: Sequence[Any], fmt: str) -> List[str]:
+    """Format a column, leaving rows whose value is None empty."""
+    pre, post = fmt.split("{}")
+    if None in values:
+        return ["" if v is None else f"{pre}{v}{post}" for v in values]
+    return [f"{pre}{v}{post}" for v in values]
+
+
+class ShapeTable(Shape):
+    """Many shapes described column by column and emitted in one pass.
+
+    Building very large diagrams one `Box(...)` at a time spends most of its
+    time creating and styling Python objects. A table instead takes one
+    sequence (a list, range, array, ...) per attribute and generates the
+    statements for all of its rows together. It can be added to a `Diagram`
+    or `Group` like any other shape.
+
+    Rows are not shapes themselves, so they are not wrapped in
+    `<g data-pypikchr-id="...">` elements and do not appear in
+    `Diagram.layout()`. Builder methods called on the table, e.g.
+    `table.thick()`, add attributes shared by every row.
+    """
+
+    __slots__ = ("_columns", "_rows")
+
+    def __init__(
+        self,
+        shapes: Column_T = "box",
+        texts: Column_T = None,
+        labels: Column_T = None,
+        widths: Column_T = None,
+        heights: Column_T = None,
+        fills: Column_T = None,
+        colors: Column_T = None,
+        positions: Column_T = None,
+        attrs: Column_T = None,
+    ) -> None:
+        """Describe a table of shapes.
+
+        Each argument is either a single value used for every row, or a
+        sequence with one value per row. All sequences must have the same
+        length, and at least one argument must be a sequence. A None entry in
+        a sequence leaves that attribute unset for the row.
+
+        Args:
+            shapes (Column_T): Pikchr class of each shape, e.g. "box" or
+                "circle". Default: "box".
+
+            texts (Column_T): Text displayed in each shape.
+
+            labels (Column_T): Labels used to refer to the shapes, as with
+                `Shape.label`.
+
+            widths (Column_T): Widths of the shapes.
+
+            heights (Column_T): Heights of the shapes.
+
+            fills (Column_T): Fill colors.
+
+            colors (Column_T): Line and text colors.
+
+            positions (Column_T): Positions of the shape centers. Each is a
+                pikchr position such as "A.e", or an (x, y) pair in a sequence.
+
+            attrs (Column_T): Any further pikchr attributes, e.g. "thick".
+        """
+        super().__init__("table")
+        columns = {
+            "shapes": shapes,
+            "labels": labels,
+            "texts": texts,
+            "widths": widths,
+            "heights": heights,
+            "fills": fills,
+            "colors": colors,
+            "positions": positions,
+            "attrs": attrs,
+        }
+        rows: Optional[int] = None
+        for name, values in columns.items():
+            if values is None or _is_scalar(values):
+                continue
+            if not isinstance(values, (list, tuple, range)):
+                values = list(values)
+                columns[name] = values
+            if rows is None:
+                rows = len(values)
+            elif len(values) != rows:
+                raise ValueError(
+                    f"Column {name} has {len(values)} rows, expected {rows}!"
+                )
+        if rows is None:
+            raise ValueError("At least one column must be a sequence!")
+
+        labels = columns["labels"]
+        if labels is not None:
+            if _is_scalar(labels):
+                raise ValueError("Labels must be a sequence, one per row!")
+            if any(label and not label.isupper() for label in labels):
+                warnings.warn(
+                    "Lower case letters cannot be used in labels!\n"
+                    "Labels will be converted to upper case!",
+                    category=RuntimeWarning,
+                )
+                columns["labels"] = [
+                    label.upper() if label else label for label in labels
+                ]
+
+        self._rows: int = rows
+        self._columns: Tuple[Tuple[str, Any], ...] = tuple(
+            (name, values) for name, values in columns.items() if values is not None
+        )
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def label(self, label: str) -> Shape_T:
+        raise TypeError("Label the rows of a ShapeTable with its labels column.")
+
+    def url(self, link: str) -> Shape_T:
+        raise TypeError("ShapeTable rows cannot have URLs.")
+
+    def _content(self) -> str:
+        """The statements for every row, separated by ";\\n"."""
+        columns = dict(self._columns)
+        cols: List[Iterable[str]] = []
+
+        labels = columns.get("labels")
+        shapes = columns["shapes"]
+        if labels is not None:
+            if _is_scalar(shapes):
+                cols.append(
+                    [f"{label}: {shapes}" if label else shapes for label in labels]
+                )
+            else:
+                cols.append(
+                    [
+                        f"{label}: {shape}" if label else shape
+                        for label, shape in zip(labels, shapes)
+                    ]
+                )
+        elif _is_scalar(shapes):
+            cols.append(itertools.repeat(shapes, self._rows))
+        else:
+            cols.append(shapes)
+
+        for name, fmt in _COLUMNS:
+            values = columns.get(name)
+            if values is None:
+                continue
+            if name == "positions" and not _is_scalar(values):
+                if None not in values and str not in map(type, values):
+                    cols.append([f" at ({x}, {y})" for x, y in values])
+                    continue
+                # (x, y) pairs become absolute positions
+                values = [
+                    v if v is None or isinstance(v, str) else "({}, {})".format(*v)
+                    for v in values
+                ]
+            if _is_scalar(values):
+                cols.append(itertools.repeat(fmt.format(values), self._rows))
+            else:
+                cols.append(_format_column(values, fmt))
+
+        if self._attrs:
+            attrs = iter(self._attrs)
+            shared = "".join(
+                f" {k}" if v is True else f" {k} {v}" for k, v in zip(attrs, attrs)
+            )
+            cols.append(itertools.repeat(shared, self._rows))
+
+        return ";\n".join(map("".join, zip(*cols)))
+
+    def _build_fragment(self) -> Fragment_T:
+        md, md_len, _ = super()._build_fragment()
+        return md, md_len, []
@@ -0,0 +1,234 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""Diagrams compiled into templates with named slots for fast re-rendering."""
+
+import bisect
+import html
+import re
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from pypikchr.cache import RenderCache
+from pypikchr.diagram.shapes import ObjectTag_T, _byte_len
+from pypikchr.util.pikchr import create_pikchr
+
+# Params are emitted into the markdown as \x00name\x00, which cannot occur in
+# pikchr markdown otherwise.
+_SLOT = re.compile(r"\x00([A-Za-z_][A-Za-z0-9_]*)\x00")
+
+# A template string split into literal text and parameter names. Literals are
+# at the even indices and names at the odd ones.
+_Skeleton_T = Tuple[str, ...]
+
+
+class Param(str):
+    """A named slot in a diagram, filled in when its template is rendered.
+
+    Params can be used wherever a shape takes a string: as its text, or as
+    the value of an attribute such as `fill`, `color` or `width`, or its
+    `url`. Rendering a diagram which still contains params directly raises a
+    `PikchrException`; compile it with `Diagram.compile()` first.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, name: str) -> Param:
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+            raise ValueError(f"Invalid parameter name {name!r}!")
+        return super().__new__(cls, f"\x00{name}\x00")
+
+    @property
+    def name(self) -> str:
+        return self[1:-1]
+
+    def __repr__(self) -> str:
+        return f"Param({self.name!r})"
+
+
+def _split(text: str) -> _Skeleton_T:
+    return tuple(_SLOT.split(text))
+
+
+class Template:
+    def __init__(
+        self,
+        md: str,
+        objects: Sequence[ObjectTag_T] = (),
+        flags: int = 0,
+        defaults: Optional[Mapping[str, object]] = None,
+        cache: Optional[RenderCache] = None,
+    ) -> None:
+        """Pikchr markdown split around its params, ready to be rendered.
+
+        Templates are usually created with `Diagram.compile()`. Rendering one
+        only joins the pre-split markdown with the bound values and shifts
+        the object tags by the lengths of those values, so no shapes are
+        rebuilt and no markdown is regenerated.
+
+        Args:
+            md (str): Markdown containing `Param` placeholders.
+
+            objects (Sequence[ObjectTag_T]): (offset, id, url) object tags of
+                the markdown, as recorded by `Diagram._get_md`.
+
+            flags (int): PikchrFlags bits to render with.
+
+            defaults (Optional[Mapping[str, object]]): Values used for params
+                which are not given when rendering.
+
+            cache (Optional[RenderCache]): Cache of SVGs keyed by the
+                template and the bound values, or None to always render. It
+                may be shared between templates.
+        """
+        self._skeleton: _Skeleton_T = _split(md)
+        self._flags: int = flags
+        self._cache: Optional[RenderCache] = cache
+        self._size_hint: int = 0
+
+        names: Dict[str, None] = dict.fromkeys(self._skeleton[1::2])
+
+        # Byte offset in `md` of the start of each literal
+        starts: List[int] = []
+        pos: int = 0
+        for i, part in enumerate(self._skeleton):
+            if i % 2 == 0:
+                starts.append(pos)
+                pos += _byte_len(part)
+            else:
+                pos += _byte_len(part) + 2
+
+        # Each tag is kept as (literal index, offset in literal, id, url)
+        self._tags: List[Tuple[int, int, int, Optional[_Skeleton_T]]] = []
+        for offset, shape_id, url in objects:
+            idx = bisect.bisect_right(starts, offset) - 1
+            split_url = _split(url) if url is not None else None
+            if split_url is not None:
+                names.update(dict.fromkeys(split_url[1::2]))
+            self._tags.append((idx, offset - starts[idx], shape_id, split_url))
+
+        # Identifies this template in the keys of a shared cache
+        self._digest: str = RenderCache.key(
+            repr((self._skeleton, self._tags)), "", flags
+        )
+        self._names: Tuple[str, ...] = tuple(names)
+        self._name_set: frozenset = frozenset(names)
+        self._defaults: Dict[str, object] = dict(defaults or {})
+        unknown = set(self._defaults).difference(names)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}!")
+
+    @property
+    def params(self) -> Tuple[str, ...]:
+        """Names of the params, in the order they first appear."""
+        return self._names
+
+    @property
+    def cache(self) -> Optional[RenderCache]:
+        """The cache of rendered SVGs, if any."""
+        return self._cache
+
+    def _values(
+        self, values: Optional[Mapping[str, object]], kwargs: Dict[str, object]
+    ) -> Dict[str, str]:
+        bound: Dict[str, object] = dict(self._defaults)
+        if values:
+            bound.update(values)
+        bound.update(kwargs)
+        if bound.keys() != self._name_set:
+            unknown = set(bound).difference(self._names)
+            if unknown:
+                raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}!")
+            missing = [name for name in self._names if name not in bound]
+            raise ValueError(f"No value given for parameters: {', '.join(missing)}!")
+        return {name: str(bound[name]) for name in self._names}
+
+    def _build(self, values: Dict[str, str]) -> Tuple[str, List[ObjectTag_T]]:
+        skeleton = self._skeleton
+        parts: List[str] = list(skeleton)
+        # New byte offset of the start of each literal
+        starts: List[int] = []
+        pos: int = 0
+        for i in range(0, len(parts), 2):
+            starts.append(pos)
+            pos += _byte_len(parts[i])
+            if i + 1 < len(parts):
+                value = values[parts[i + 1]]
+                parts[i + 1] = value
+                pos += _byte_len(value)
+
+        objects: List[ObjectTag_T] = []
+        for idx, offset, shape_id, url in self._tags:
+            if url is not None:
+                url = "".join(
+                    html.escape(values[p]) if i % 2 else p for i, p in enumerate(url)
+                )
+            objects.append((starts[idx] + offset, shape_id, url))
+        return "".join(parts), objects
+
+    def markdown(
+        self, values: Optional[Mapping[str, object]] = None, **kwargs: object
+    ) -> str:
+        """Return the markdown with the params replaced by their values.
+
+        Args:
+            values (Optional[Mapping[str, object]]): Values by param name.
+                Keyword arguments are merged in. Params which are not given
+                use their default.
+
+        Returns:
+            md (str): Pikchr markdown.
+
+        Raises:
+            ValueError: If a param is unknown, or has no value or default.
+        """
+        return self._build(self._values(values, kwargs))[0]
+
+    def render(
+        self, values: Optional[Mapping[str, object]] = None, **kwargs: object
+    ) -> str:
+        """Return the SVG HTML with the params replaced by their values.
+
+        Args:
+            values (Optional[Mapping[str, object]]): Values by param name.
+                Keyword arguments are merged in. Params which are not given
+                use their default.
+
+        Returns:
+            html (str): Generated SVG HTML, or the error text.
+
+        Raises:
+            ValueError: If a param is unknown, or has no value or default.
+        """
+        bound = self._values(values, kwargs)
+        key: Optional[str] = None
+        if self._cache is not None:
+            key = RenderCache.key(
+                f"{self._digest}\0{tuple(bound.values())!r}", "", self._flags
+            )
+            svg = self._cache.get(key)
+            if svg is not None:
+                return svg
+        md, objects = self._build(bound)
+        svg = create_pikchr(md, "", self._flags, 0, 0, objects, self._size_hint)
+        self._size_hint = len(svg)
+        if self._cache is not None:
+            self._cache.put(key, svg)
+        return svg
@@ -0,0 +1,255 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""Laid-out geometry of diagram shapes and a spatial index for hit-testing."""
+
+import math
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    from pypikchr.diagram.shapes import Shape
+
+Point_T = Tuple[float, float]
+BBox_T = Tuple[float, float, float, float]
+
+# Objects spanning more grid cells than this are checked on every query
+# rather than being inserted into each cell.
+_MAX_CELLS: int = 64
+
+
+class ShapeGeometry(NamedTuple):
+    """Where a shape was placed, in the coordinates of the SVG viewBox.
+
+    x grows to the right and y grows downward, as in the SVG itself.
+    """
+
+    shape: Shape
+    bbox: BBox_T  # (x0, y0, x1, y1) with x0 <= x1 and y0 <= y1
+    center: Point_T
+    path: Tuple[Point_T, ...]  # Vertices of lines and arrows, else empty
+
+    @property
+    def shape_id(self) -> int:
+        return self.shape._id
+
+    @property
+    def label(self) -> Optional[str]:
+        return self.shape._label
+
+
+def _segment_distance(px: float, py: float, a: Point_T, b: Point_T) -> float:
+    """Distance from (px, py) to the segment a-b."""
+    ax, ay = a
+    dx: float = b[0] - ax
+    dy: float = b[1] - ay
+    length2: float = dx * dx + dy * dy
+    t: float = 0.0
+    if length2 > 0:
+        t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+class SpatialIndex:
+    def __init__(
+        self,
+        items: Iterable[ShapeGeometry],
+        cell_size: Optional[float] = None,
+        tolerance: float = 3.0,
+    ) -> None:
+        """Uniform grid over shape bounding boxes for point and rect queries.
+
+        Args:
+            items (Iterable[ShapeGeometry]): Shapes in drawing order.
+
+            cell_size (Optional[float]): Size of a grid cell. Defaults to the
+                median size of the shapes.
+
+            tolerance (float): How far a point may be from a line or arrow
+                and still hit it.
+        """
+        self._items: List[ShapeGeometry] = list(items)
+        self._tolerance: float = tolerance
+        self._boxes: List[BBox_T] = []
+        for item in self._items:
+            x0, y0, x1, y1 = item.bbox
+            if item.path:
+                x0, y0 = x0 - tolerance, y0 - tolerance
+                x1, y1 = x1 + tolerance, y1 + tolerance
+            self._boxes.append((x0, y0, x1, y1))
+
+        if cell_size is None:
+            sizes = sorted(max(b[2] - b[0], b[3] - b[1]) for b in self._boxes)
+            cell_size = sizes[len(sizes) // 2] if sizes else 1.0
+        self._cell: float = max(cell_size, 1e-6)
+
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        self._large: List[int] = []
+        for idx, box in enumerate(self._boxes):
+            i0, j0, i1, j1 = self._cells(box)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > _MAX_CELLS:
+                self._large.append(idx)
+                continue
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    self._grid.setdefault((i, j), []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _cells(self, box: BBox_T) -> Tuple[int, int, int, int]:
+        cell: float = self._cell
+        return (
+            math.floor(box[0] / cell),
+            math.floor(box[1] / cell),
+            math.floor(box[2] / cell),
+            math.floor(box[3] / cell),
+        )
+
+    def _hits_point(self, idx: int, x: float, y: float) -> bool:
+        x0, y0, x1, y1 = self._boxes[idx]
+        if not (x0 <= x <= x1 and y0 <= y <= y1):
+            return False
+        path = self._items[idx].path
+        if not path:
+            return True
+        return any(
+            _segment_distance(x, y, a, b) <= self._tolerance
+            for a, b in zip(path, path[1:])
+        )
+
+    def at_point(self, x: float, y: float) -> List[ShapeGeometry]:
+        """Return the shapes under a point, topmost first.
+
+        Block shapes are hit anywhere inside their bounding box. Lines and
+        arrows are hit within `tolerance` of their path.
+
+        Args:
+            x (float): Horizontal position in viewBox coordinates.
+
+            y (float): Vertical position in viewBox coordinates.
+
+        Returns:
+            hits (List[ShapeGeometry]): Shapes drawn later come first.
+        """
+        cell: float = self._cell
+        candidates = self._grid.get((math.floor(x / cell), math.floor(y / cell)), [])
+        hits = [i for i in candidates if self._hits_point(i, x, y)]
+        hits.extend(i for i in self._large if self._hits_point(i, x, y))
+        hits.sort(reverse=True)
+        return [self._items[i] for i in hits]
+
+    def in_rect(
+        self,
+        x0: float,
+        y0: float,
+        x1: float,
+        y1: float,
+        contained: bool = False,
+    ) -> List[ShapeGeometry]:
+        """Return the shapes whose bounding boxes overlap a rectangle.
+
+        Args:
+            x0, y0, x1, y1 (float): Corners of the rectangle in viewBox
+                coordinates.
+
+            contained (bool): Only return shapes lying entirely inside the
+                rectangle.
+
+        Returns:
+            hits (List[ShapeGeometry]): Matching shapes in drawing order.
+        """
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        i0, j0, i1, j1 = self._cells((x0, y0, x1, y1))
+        found = set(self._large)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._grid):
+            for (i, j), indices in self._grid.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    found.update(indices)
+        else:
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    found.update(self._grid.get((i, j), ()))
+
+        hits: List[int] = []
+        for idx in found:
+            bx0, by0, bx1, by1 = self._items[idx].bbox
+            if contained:
+                match = x0 <= bx0 and bx1 <= x1 and y0 <= by0 and by1 <= y1
+            else:
+                match = bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1
+            if match:
+                hits.append(idx)
+        hits.sort()
+        return [self._items[i] for i in hits]
+
+
+class Layout:
+    def __init__(self, svg: Optional[str], shapes: List[ShapeGeometry]) -> None:
+        """The result of laying out a diagram.
+
+        Args:
+            svg (Optional[str]): Generated SVG HTML, or None if it was not
+                requested.
+
+            shapes (List[ShapeGeometry]): Geometry of each shape, in drawing
+                order.
+        """
+        self.svg: Optional[str] = svg
+        self.shapes: List[ShapeGeometry] = shapes
+        self._by_key: Optional[Dict[Union[int, str], ShapeGeometry]] = None
+        self._index: Optional[SpatialIndex] = None
+
+    @property
+    def index(self) -> SpatialIndex:
+        """A spatial index over the shapes, built on first use."""
+        if self._index is None:
+            self._index = SpatialIndex(self.shapes)
+        return self._index
+
+    def get(self, key: Union[Shape, int, str]) -> Optional[ShapeGeometry]:
+        """Return the geometry of a shape.
+
+        Args:
+            key (Shape | int | str): The shape, its id, or its label.
+
+        Returns:
+            geometry (Optional[ShapeGeometry]): The geometry, or None if the
+                shape is not part of the diagram.
+        """
+        if self._by_key is None:
+            self._by_key = {}
+            for geom in self.shapes:
+                self._by_key[geom.shape_id] = geom
+                if geom.label:
+                    self._by_key[geom.label] = geom
+        if not isinstance(key, (int, str)):
+            key = key._id
+        return self._by_key.get(key)
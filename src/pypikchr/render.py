@@ -0,0 +1,246 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""Helpers for rendering many diagrams at once, or from asyncio code."""
+
+import asyncio
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import IO, Iterable, List, Optional, Union
+
+from pypikchr.cache import RenderCache, get_render_cache
+from pypikchr.diagram.diagram import Diagram, _svg_target
+from pypikchr.stats import RenderHook_T, _observed_render, get_render_hook
+from pypikchr.util import pikchr
+from pypikchr.util.pikchr import create_pikchr
+
+Renderable_T = Union[Diagram, str]
+
+
+def render(item: Renderable_T, svg_class: str = "", flags: int = 0) -> str:
+    """Render a single diagram or raw pikchr source to SVG.
+
+    The configured render cache, if any, is consulted first.
+
+    Args:
+        item (Diagram | str): A pypikchr diagram, or pikchr markdown.
+
+        svg_class (str): Class added to the <svg> element of raw sources.
+            Diagrams are rendered exactly as `str(diagram)` would.
+
+        flags (int): PikchrFlags bits used for raw sources.
+
+    Returns:
+        svg (str): Generated SVG HTML.
+    """
+    if isinstance(item, Diagram):
+        return str(item)
+    hook: Optional[RenderHook_T] = get_render_hook()
+    if hook is not None:
+        return _observed_render(hook, item, svg_class, flags)
+    cache: Optional[RenderCache] = get_render_cache()
+    if cache is not None:
+        return cache.render(item, svg_class, flags)
+    return create_pikchr(item, svg_class, flags, 0, 0)
+
+
+def render_to(
+    item: Renderable_T,
+    target: Union[int, IO],
+    svg_class: str = "",
+    flags: int = 0,
+) -> int:
+    """Stream the SVG of a diagram or raw pikchr source to a file.
+
+    The SVG is written in chunks as pikchr generates it rather than being
+    built up in memory first. The render cache is not used.
+
+    Args:
+        item (Diagram | str): A pypikchr diagram, or pikchr markdown.
+
+        target (int | IO): A file descriptor, or a binary or text file-like
+            object. Binary targets receive UTF-8.
+
+        svg_class (str): Class added to the <svg> element of raw sources.
+
+        flags (int): PikchrFlags bits used for raw sources.
+
+    Returns:
+        size (int): Number of bytes written.
+
+    Raises:
+        PikchrCompileError: If the markdown does not compile. Nothing is
+            written.
+    """
+    if isinstance(item, Diagram):
+        return item.render_to(target)
+    _, _, size = pikchr.render_to(_svg_target(target), item, svg_class, flags)
+    return size
+
+
+def render_many(
+    items: Iterable[Renderable_T],
+    max_workers: Optional[int] = None,
+    svg_class: str = "",
+    flags: int = 0,
+) -> List[str]:
+    """Render diagrams or pikchr sources concurrently on a thread pool.
+
+    The C extension releases the GIL while pikchr parses, lays out and renders,
+    so renders on separate threads run in parallel.
+
+    Args:
+        items (Iterable[Diagram | str]): Diagrams and/or pikchr markdown.
+
+        max_workers (Optional[int]): Size of the thread pool. Defaults to the
+            `ThreadPoolExecutor` default.
+
+        svg_class (str): Class added to the <svg> element of raw sources.
+
+        flags (int): PikchrFlags bits used for raw sources.
+
+    Returns:
+        svgs (List[str]): Generated SVG HTML, in the same order as `items`.
+    """
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda item: render(item, svg_class, flags), items))
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix="pypikchr")
+        return _executor
+
+
+async def render_async(
+    item: Renderable_T,
+    svg_class: str = "",
+    flags: int = 0,
+    executor: Optional[Executor] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> str:
+    """Render a diagram or pikchr source without blocking the event loop.
+
+    Markdown generation and rendering both run on the executor. A diagram
+    should not be modified until the render completes.
+
+    If the awaiting task is cancelled, a render that has not started is
+    dropped. One already running cannot be interrupted, so it finishes in the
+    background and its result is discarded. The semaphore is only released
+    once the render is no longer running, so it bounds the number of renders
+    actually in progress.
+
+    Args:
+        item (Diagram | str): A pypikchr diagram, or pikchr markdown.
+
+        svg_class (str): Class added to the <svg> element of raw sources.
+
+        flags (int): PikchrFlags bits used for raw sources.
+
+        executor (Optional[Executor]): Executor to render on. Defaults to a
+            thread pool shared by pypikchr. Process pools only accept str
+            sources.
+
+        semaphore (Optional[asyncio.Semaphore]): Acquired for the duration of
+            the render to bound concurrency.
+
+    Returns:
+        svg (str): Generated SVG HTML.
+    """
+    loop = asyncio.get_running_loop()
+    if executor is None:
+        executor = _default_executor()
+    if semaphore is None:
+        return await asyncio.wrap_future(
+            executor.submit(render, item, svg_class, flags)
+        )
+
+    await semaphore.acquire()
+    try:
+        future: Future = executor.submit(render, item, svg_class, flags)
+    except BaseException:
+        semaphore.release()
+        raise
+
+    def release(_: Future) -> None:
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            # The loop has been closed; nothing is waiting on the semaphore
+            pass
+
+    future.add_done_callback(release)
+    return await asyncio.wrap_future(future)
+
+
+async def render_many_async(
+    items: Iterable[Renderable_T],
+    max_concurrency: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    svg_class: str = "",
+    flags: int = 0,
+) -> List[str]:
+    """Render diagrams or pikchr sources concurrently from asyncio code.
+
+    If any render fails, or the call is cancelled, the remaining renders are
+    cancelled before the exception propagates.
+
+    Args:
+        items (Iterable[Diagram | str]): Diagrams and/or pikchr markdown.
+
+        max_concurrency (Optional[int]): Maximum number of renders in progress
+            at once. Defaults to no limit beyond the executor's own.
+
+        executor (Optional[Executor]): Executor to render on. Defaults to a
+            thread pool shared by pypikchr.
+
+        svg_class (str): Class added to the <svg> element of raw sources.
+
+        flags (int): PikchrFlags bits used for raw sources.
+
+    Returns:
+        svgs (List[str]): Generated SVG HTML, in the same order as `items`.
+    """
+    semaphore: Optional[asyncio.Semaphore] = None
+    if max_concurrency is not None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        semaphore = asyncio.Semaphore(max_concurrency)
+    tasks = [
+        asyncio.ensure_future(render_async(item, svg_class, flags, executor, semaphore))
+        for item in items
+    ]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
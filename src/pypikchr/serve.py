@@ -0,0 +1,610 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""ASGI and WSGI apps serving rendered diagrams over HTTP."""
+
+import asyncio
+import gzip
+import hashlib
+import html
+import json
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pypikchr
+from pypikchr.diagram.diagram import _VALID_FLAGS, Diagram, PikchrFlags
+from pypikchr.render import _default_executor
+from pypikchr.util.pikchr import SvgBuffer, create_pikchr_buffer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+Header_T = Tuple[str, str]
+Request_T = Tuple[str, str, int, Optional[List[tuple]]]
+
+# Content codings in order of preference when a client accepts several
+_ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+_SVG_TYPE: str = "image/svg+xml; charset=utf-8"
+
+# Classes are written into the <svg> unescaped, so only these are accepted
+_CLASS = re.compile(r"[A-Za-z0-9_ -]*")
+
+# Schemes accepted for object URLs, besides relative URLs
+_URL_SCHEMES: Tuple[str, ...] = ("http", "https")
+
+
+@dataclass
+class Response:
+    """Status, headers and body of a response from a DiagramService."""
+
+    status: int
+    headers: List[Header_T] = field(default_factory=list)
+    body: bytes = b""
+
+
+@dataclass
+class ServeStats:
+    """Counters describing the requests a DiagramService has answered."""
+
+    requests: int = 0
+    renders: int = 0
+    hits: int = 0
+    not_modified: int = 0
+    rejected: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class _RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def encode_diagram(diagram: Diagram, svg_class: str = "") -> bytes:
+    """Serialize a diagram as the JSON body of a request to a DiagramService.
+
+    The body carries the diagram's markdown, flags and object tags, so the
+    response is the same SVG as `str(diagram)`. Object URLs are sent
+    unescaped; the service escapes them, and only accepts http, https and
+    relative URLs.
+
+    Args:
+        diagram (Diagram): The diagram to send.
+
+        svg_class (str): Class added to the <svg> element.
+
+    Returns:
+        body (bytes): UTF-8 encoded JSON.
+
+    Raises:
+        PikchrException: If the diagram contains a `Param`.
+    """
+    objects: List[tuple] = []
+    md: str = diagram._render_md(objects)
+    payload: Dict[str, object] = {
+        "source": md,
+        "class": svg_class,
+        "flags": int(diagram._flags),
+        "objects": [
+            [offset, id_, html.unescape(url) if url else url]
+            for offset, id_, url in objects
+        ],
+    }
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def _accepted(accept_encoding: str) -> str:
+    """Pick the preferred content coding from an Accept-Encoding header."""
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        name, _, value = params.strip().partition("=")
+        try:
+            q: float = float(value) if name.strip() == "q" else 1.0
+        except ValueError:
+            continue
+        weights[coding.strip().lower()] = q
+    best: str = "identity"
+    best_q: float = 0.0
+    for coding in _ENCODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _media_type(headers: Mapping[str, str]) -> str:
+    return headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    if encoding == "gzip":
+        # A fixed mtime keeps the output, and so the cached variant, stable
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    return body
+
+
+class DiagramService:
+    def __init__(
+        self,
+        svg_class: str = "",
+        flags: int = 0,
+        max_body: int = 1024 * 1024,
+        max_query: int = 8 * 1024,
+        max_entries: int = 512,
+        max_bytes: int = 32 * 1024 * 1024,
+        min_compress: int = 256,
+        cache_control: Optional[str] = "no-cache",
+    ) -> None:
+        """Framework independent core of the ASGI and WSGI apps.
+
+        Diagrams are requested either with `GET ?source=...` or by POSTing
+        pikchr source as the body, or a diagram serialized by
+        `encode_diagram` as `application/json`. The `class` and `flags`
+        query parameters (or JSON keys) override the defaults. Classes may
+        only contain letters, digits, underscores, hyphens and spaces.
+
+        Every response carries an ETag hashed from the request and these
+        defaults, so conditional requests are answered with 304 Not Modified
+        without parsing or rendering anything. Rendered SVGs, and their
+        gzip (and, if the `brotli` package is installed, brotli) encodings,
+        are kept in a bounded least-recently-used cache.
+
+        Args:
+            svg_class (str): Default class added to the <svg> element.
+
+            flags (int): Default PikchrFlags bits.
+
+            max_body (int): Largest accepted request body, in bytes. Larger
+                bodies are rejected with 413.
+
+            max_query (int): Largest accepted query string, in bytes. Longer
+                queries are rejected with 414.
+
+            max_entries (int): Maximum number of cached responses, counting
+                each encoding separately.
+
+            max_bytes (int): Maximum total size of the cached responses.
+
+            min_compress (int): SVGs smaller than this are always sent
+                uncompressed.
+
+            cache_control (Optional[str]): Cache-Control header of rendered
+                responses. None leaves it out.
+
+        Raises:
+            ValueError: If `svg_class` contains other characters than those
+                accepted from requests.
+        """
+        if not _CLASS.fullmatch(svg_class):
+            raise ValueError(f"Invalid svg_class {svg_class!r}.")
+        self.svg_class = svg_class
+        self.flags = flags
+        self.max_body = max_body
+        self.max_query = max_query
+        self.min_compress = min_compress
+        self.cache_control = cache_control
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[Tuple[str, str], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = ServeStats()
+
+    @property
+    def stats(self) -> ServeStats:
+        """A snapshot of the service counters."""
+        with self._lock:
+            return ServeStats(**vars(self._stats))
+
+    def handle(
+        self,
+        method: str,
+        query: str = "",
+        headers: Optional[Mapping[str, str]] = None,
+        body: bytes = b"",
+    ) -> Response:
+        """Answer a request.
+
+        Rendering releases the GIL, so this may be called from several
+        threads at once.
+
+        Args:
+            method (str): HTTP method. GET, HEAD and POST are supported.
+
+            query (str): Query string, without the leading "?".
+
+            headers (Optional[Mapping[str, str]]): Request headers, with
+                lowercase names.
+
+            body (bytes): Request body.
+
+        Returns:
+            response (Response): The status, headers and body to send.
+        """
+        headers = headers or {}
+        with self._lock:
+            self._stats.requests += 1
+        if method not in ("GET", "HEAD", "POST"):
+            return self._error(
+                HTTPStatus.METHOD_NOT_ALLOWED,
+                "Only GET, HEAD and POST are supported.",
+                [("Allow", "GET, HEAD, POST")],
+            )
+        if len(query) > self.max_query:
+            return self._error(HTTPStatus.REQUEST_URI_TOO_LONG, "Query too long.")
+        if len(body) > self.max_body:
+            return self._too_large()
+
+        # Requests are only parsed to render them, so cached responses and
+        # conditional requests cost a hash of the request
+        is_json: bool = _media_type(headers) == "application/json"
+        etag: str = self._etag(method == "POST", is_json, query, body)
+        common: List[Header_T] = [("Vary", "Accept-Encoding")]
+        if self.cache_control is not None:
+            common.append(("Cache-Control", self.cache_control))
+        matched: Optional[str] = self._match(headers.get("if-none-match", ""), etag)
+        if matched is not None:
+            with self._lock:
+                self._stats.not_modified += 1
+            return Response(HTTPStatus.NOT_MODIFIED, [("ETag", matched)] + common)
+
+        encoding: str = _accepted(headers.get("accept-encoding", ""))
+        content: Optional[bytes] = self._get((etag, encoding))
+        if content is None:
+            svg: Optional[bytes] = self._get((etag, "identity"))
+            if svg is None:
+                try:
+                    md, svg_class, flags, objects = self._parse(
+                        method, query, is_json, body
+                    )
+                    buffer: SvgBuffer = create_pikchr_buffer(
+                        md, svg_class, flags, objects
+                    )
+                except _RequestError as err:
+                    return self._error(err.status, str(err))
+                except (TypeError, ValueError, OverflowError):
+                    # Raised by the extension for malformed object tags
+                    return self._error(HTTPStatus.BAD_REQUEST, "Invalid objects.")
+                with self._lock:
+                    self._stats.renders += 1
+                if buffer.width < 0:
+                    # Errors are not cached, and carry no ETag
+                    return self._compile_error(method, flags, buffer, common)
+                svg = buffer.tobytes()
+                self._put((etag, "identity"), svg)
+            if len(svg) < self.min_compress:
+                encoding = "identity"
+            if encoding == "identity":
+                content = svg
+            else:
+                content = _compress(svg, encoding)
+                self._put((etag, encoding), content)
+
+        response_headers: List[Header_T] = [
+            ("Content-Type", _SVG_TYPE),
+            ("Content-Length", str(len(content))),
+        ]
+        if encoding == "identity":
+            response_headers.append(("ETag", f'"{etag}"'))
+        else:
+            response_headers.append(("Content-Encoding", encoding))
+            response_headers.append(("ETag", f'"{etag}-{encoding}"'))
+        return Response(
+            HTTPStatus.OK,
+            response_headers + common,
+            b"" if method == "HEAD" else content,
+        )
+
+    def clear(self) -> None:
+        """Drop all cached responses."""
+        with self._lock:
+            self._entries.clear()
+            self._stats.entries = 0
+            self._stats.bytes = 0
+
+    def _parse(self, method: str, query: str, is_json: bool, body: bytes) -> Request_T:
+        params: Dict[str, List[str]] = parse_qs(query, keep_blank_values=True)
+        svg_class: str = params.get("class", [self.svg_class])[0]
+        flags: object = params.get("flags", [self.flags])[0]
+        objects: Optional[List[tuple]] = None
+
+        if method == "POST":
+            try:
+                text: str = body.decode()
+            except UnicodeDecodeError:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, "Body is not UTF-8.")
+            if is_json:
+                try:
+                    payload = json.loads(text)
+                except ValueError:
+                    raise _RequestError(HTTPStatus.BAD_REQUEST, "Invalid JSON body.")
+                if not isinstance(payload, dict):
+                    raise _RequestError(HTTPStatus.BAD_REQUEST, "Expected an object.")
+                md = payload.get("source")
+                svg_class = payload.get("class", svg_class)
+                flags = payload.get("flags", flags)
+                objects = self._objects(payload.get("objects"))
+            else:
+                md = text
+        elif "source" in params:
+            md = params["source"][0]
+        else:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Missing source parameter.")
+
+        if not isinstance(md, str) or not isinstance(svg_class, str):
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Invalid source or class.")
+        try:
+            flags = int(flags)
+        except (TypeError, ValueError):
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Invalid flags.")
+        if flags < 0 or flags & ~_VALID_FLAGS:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Invalid flags.")
+        if not _CLASS.fullmatch(svg_class):
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Invalid class.")
+        if "\0" in md:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Unexpected NUL character.")
+        return md, svg_class, flags, objects
+
+    @staticmethod
+    def _objects(value: object) -> Optional[List[tuple]]:
+        if value is None:
+            return None
+        # The extension checks the contents of each tag
+        if not isinstance(value, list) or not all(
+            isinstance(tag, list) for tag in value
+        ):
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Invalid objects.")
+        tags: List[tuple] = []
+        for tag in value:
+            if len(tag) == 3 and isinstance(tag[2], str):
+                url: str = tag[2]
+                if urlsplit(url).scheme.lower() not in ("",) + _URL_SCHEMES:
+                    raise _RequestError(HTTPStatus.BAD_REQUEST, "Invalid URL.")
+                # The extension expects URLs escaped for the href attribute
+                tag = [tag[0], tag[1], html.escape(url)]
+            tags.append(tuple(tag))
+        return tags
+
+    def _etag(self, post: bool, is_json: bool, query: str, body: bytes) -> str:
+        # The version is included since renderer changes alter the output
+        h = hashlib.blake2b(digest_size=20)
+        h.update(
+            f"{post:d}{is_json:d}\0{self.svg_class}\0{self.flags}\0"
+            f"{pypikchr.__version__}\0{query}\0".encode()
+        )
+        h.update(body)
+        return h.hexdigest()
+
+    @staticmethod
+    def _match(if_none_match: str, etag: str) -> Optional[str]:
+        """Return the entity tag in If-None-Match matching `etag`, if any."""
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate == "*":
+                return f'"{etag}"'
+            tag: str = candidate[2:] if candidate.startswith("W/") else candidate
+            # Any encoding of the same content matches
+            if tag.strip('"').split("-")[0] == etag:
+                return tag
+        return None
+
+    def _error(
+        self, status: HTTPStatus, message: str, headers: Iterable[Header_T] = ()
+    ) -> Response:
+        with self._lock:
+            self._stats.rejected += 1
+        body: bytes = f"{message}\n".encode()
+        return Response(
+            status,
+            [
+                ("Content-Type", "text/plain; charset=utf-8"),
+                ("Content-Length", str(len(body))),
+                *headers,
+            ],
+            body,
+        )
+
+    @staticmethod
+    def _compile_error(
+        method: str, flags: int, buffer: SvgBuffer, common: List[Header_T]
+    ) -> Response:
+        kind: str = "plain" if flags & PikchrFlags.PLAINTEXT_ERRORS else "html"
+        return Response(
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+            [
+                ("Content-Type", f"text/{kind}; charset=utf-8"),
+                ("Content-Length", str(len(buffer))),
+            ]
+            + common,
+            b"" if method == "HEAD" else buffer.tobytes(),
+        )
+
+    @property
+    def _limit(self) -> str:
+        return f"Request bodies are limited to {self.max_body} bytes."
+
+    def _too_large(self) -> Response:
+        return self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, self._limit)
+
+    def _get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+            return content
+
+    def _put(self, key: Tuple[str, str], content: bytes) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._stats.bytes -= len(old)
+            if len(content) <= self._max_bytes and self._max_entries > 0:
+                self._entries[key] = content
+                self._stats.bytes += len(content)
+            while (
+                len(self._entries) > self._max_entries
+                or self._stats.bytes > self._max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._stats.bytes -= len(evicted)
+                self._stats.evictions += 1
+            self._stats.entries = len(self._entries)
+
+
+class WSGIApp:
+    def __init__(self, service: Optional[DiagramService] = None) -> None:
+        """WSGI application rendering diagrams with a DiagramService.
+
+        Args:
+            service (Optional[DiagramService]): The service answering
+                requests. Defaults to one with the default limits.
+        """
+        self.service = service or DiagramService()
+
+    def __call__(
+        self, environ: Dict[str, object], start_response: Callable
+    ) -> List[bytes]:
+        headers: Dict[str, str] = {
+            key[5:].replace("_", "-").lower(): value
+            for key, value in environ.items()
+            if key.startswith("HTTP_")
+        }
+        if environ.get("CONTENT_TYPE"):
+            headers["content-type"] = environ["CONTENT_TYPE"]
+        try:
+            length: int = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            response = self.service._error(
+                HTTPStatus.BAD_REQUEST, "Invalid Content-Length."
+            )
+        elif length > self.service.max_body:
+            # Reject without reading the body
+            response = self.service._too_large()
+        else:
+            body: bytes = environ["wsgi.input"].read(length) if length else b""
+            response = self.service.handle(
+                environ["REQUEST_METHOD"],
+                environ.get("QUERY_STRING", ""),
+                headers,
+                body,
+            )
+        status = HTTPStatus(response.status)
+        start_response(f"{status.value} {status.phrase}", response.headers)
+        return [response.body]
+
+
+class ASGIApp:
+    def __init__(
+        self,
+        service: Optional[DiagramService] = None,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        """ASGI application rendering diagrams with a DiagramService.
+
+        Requests are answered on an executor so rendering never blocks the
+        event loop.
+
+        Args:
+            service (Optional[DiagramService]): The service answering
+                requests. Defaults to one with the default limits.
+
+            executor (Optional[Executor]): Executor the requests are answered
+                on. Defaults to the thread pool shared with `render_async`.
+        """
+        self.service = service or DiagramService()
+        self.executor = executor
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        headers: Dict[str, str] = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+        response: Optional[Response] = None
+        try:
+            length: int = int(headers.get("content-length") or 0)
+        except ValueError:
+            length = 0
+        if length > self.service.max_body:
+            response = self.service._too_large()
+        else:
+            chunks: List[bytes] = []
+            size: int = 0
+            more: bool = True
+            while more:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunk: bytes = message.get("body", b"")
+                size += len(chunk)
+                if size > self.service.max_body:
+                    response = self.service._too_large()
+                    break
+                chunks.append(chunk)
+                more = message.get("more_body", False)
+        if response is None:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self.executor or _default_executor(),
+                self.service.handle,
+                scope["method"],
+                scope.get("query_string", b"").decode("latin-1"),
+                headers,
+                b"".join(chunks),
+            )
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": int(response.status),
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in response.headers
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": response.body})
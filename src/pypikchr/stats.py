@@ -0,0 +1,154 @@
+# pypikchr - Small Python wrapper for the Pikchr diagramming language.
+#
+# Copyright (C) 2026 Gabriel Dorlhiac gabriel@dorlhiac.com
+#
+# This file is part of pypikchr.
+#
+# pypikchr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pypikchr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with pypikchr. If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+
+"""Opt-in per-phase timings and counters for diagram renders."""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple
+
+from pypikchr.cache import RenderCache, _from_cached, _to_cached, get_render_cache
+from pypikchr.util.pikchr import create_pikchr_stats
+
+
+@dataclass
+class RenderStats:
+    """Where the time of one render went, and how much work it did.
+
+    Times are in seconds. pikchr places each object as its statement is
+    parsed, so `parse` includes that placement, while `layout` only covers
+    sizing the canvas. `finish` is the time spent in the extension outside of
+    pikchr itself, mostly decoding the SVG into a `str`. If the SVG came from
+    the render cache, `cached` is True and only `markdown` and `total` are
+    measured.
+    """
+
+    markdown: float = 0.0
+    parse: float = 0.0
+    layout: float = 0.0
+    render: float = 0.0
+    finish: float = 0.0
+    total: float = 0.0
+    tokens: int = 0
+    objects: int = 0
+    lookups: int = 0
+    output_bytes: int = 0
+    reallocs: int = 0
+    cached: bool = False
+
+    def phases(self) -> Tuple[Tuple[str, float], ...]:
+        """Return (name, seconds) for each phase, in the order they run."""
+        return (
+            ("markdown", self.markdown),
+            ("parse", self.parse),
+            ("layout", self.layout),
+            ("render", self.render),
+            ("finish", self.finish),
+        )
+
+
+RenderHook_T = Callable[[RenderStats], None]
+
+_render_hook: Optional[RenderHook_T] = None
+
+
+def set_render_hook(hook: Optional[RenderHook_T]) -> None:
+    """Set a function called with the `RenderStats` of every diagram render.
+
+    While a hook is set, `Diagram.__str__` and `render` collect per-phase
+    timings and counters, e.g. to export them as histograms. The hook runs
+    in the rendering thread and its exceptions propagate to the caller.
+
+    Args:
+        hook (Optional[RenderHook_T]): The function to call, or None to stop
+            collecting statistics.
+    """
+    global _render_hook
+    _render_hook = hook
+
+
+def get_render_hook() -> Optional[RenderHook_T]:
+    """Return the configured render hook, if any."""
+    return _render_hook
+
+
+def render_with_stats(
+    md: str,
+    svg_class: str = "",
+    flags: int = 0,
+    objects: Optional[Sequence[tuple]] = None,
+    size_hint: int = 0,
+) -> Tuple[str, RenderStats]:
+    """Render pikchr markdown, measuring each phase inside the extension.
+
+    Args:
+        md (str): Pikchr markdown.
+
+        svg_class (str): Class added to the <svg> element.
+
+        flags (int): PikchrFlags bits.
+
+        objects (Optional[Sequence[tuple]]): (offset, id, url) object tags,
+            as for `create_pikchr`.
+
+        size_hint (int): Initial size of the output buffer.
+
+    Returns:
+        svg (str): The generated SVG, or the error text.
+
+        stats (RenderStats): Timings and counters. `markdown` is left at 0.
+    """
+    start = time.perf_counter()
+    svg, counters = create_pikchr_stats(md, svg_class, flags, objects, size_hint)
+    elapsed = time.perf_counter() - start
+    stats = RenderStats(**counters)
+    stats.finish = max(elapsed - stats.total, 0.0)
+    stats.total = elapsed
+    return svg, stats
+
+
+def _observed_render(
+    hook: RenderHook_T,
+    md: str,
+    svg_class: str = "",
+    flags: int = 0,
+    objects: Optional[Sequence[tuple]] = None,
+    size_hint: int = 0,
+    markdown: float = 0.0,
+) -> str:
+    """Render through the configured cache, if any, and report to `hook`."""
+    start = time.perf_counter()
+    cache: Optional[RenderCache] = get_render_cache()
+    svg: Optional[str] = None
+    if cache is not None:
+        key = cache.key(md, svg_class, flags, objects)
+        svg = cache.get(key)
+    if svg is None:
+        svg, stats = render_with_stats(md, svg_class, flags, objects, size_hint)
+        if cache is not None:
+            cache.put(key, _to_cached(svg, objects))
+    else:
+        svg = _from_cached(svg, objects)
+        stats = RenderStats(cached=True)
+    stats.markdown = markdown
+    stats.total = markdown + time.perf_counter() - start
+    hook(stats)
+    return svg
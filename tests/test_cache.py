@@ -0,0 +1,122 @@
+import re
+import tempfile
+import unittest
+
+import pypikchr
+from pypikchr import RenderCache, get_render_cache, set_render_cache
+from pypikchr.diagram import Box, Diagram
+from pypikchr.render import render
+from pypikchr.util.pikchr import create_pikchr
+
+
+class TestCache(unittest.TestCase):
+    def tearDown(self):
+        set_render_cache(None)
+
+    def test_hit_and_miss(self):
+        """Verify repeated renders are served from memory."""
+        cache = RenderCache()
+        svg = cache.render('box "A"')
+        self.assertEqual(svg, create_pikchr('box "A"', "", 0, 0, 0))
+        self.assertEqual(cache.render('box "A"'), svg)
+        stats = cache.stats
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (1, 1, 1))
+
+    def test_key_includes_flags_and_class(self):
+        """Verify flags and SVG class are part of the key."""
+        keys = {
+            RenderCache.key('box "A"'),
+            RenderCache.key('box "A"', "diag"),
+            RenderCache.key('box "A"', "", 0x0002),
+            RenderCache.key('box "A"', "", 0, [(0, 1, None)]),
+        }
+        self.assertEqual(len(keys), 4)
+
+    def test_lru_eviction_by_count(self):
+        """Verify the least recently used entry is evicted first."""
+        cache = RenderCache(max_entries=2)
+        cache.render('box "A"')
+        cache.render('box "B"')
+        cache.render('box "A"')
+        cache.render('box "C"')
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertIsNotNone(cache.get(RenderCache.key('box "A"')))
+        self.assertIsNone(cache.get(RenderCache.key('box "B"')))
+
+    def test_eviction_by_bytes(self):
+        """Verify the byte bound is enforced."""
+        size = len(create_pikchr('box "A"', "", 0, 0, 0))
+        cache = RenderCache(max_bytes=size + 10)
+        cache.render('box "A"')
+        cache.render('box "B"')
+        stats = cache.stats
+        self.assertEqual(stats.entries, 1)
+        self.assertLessEqual(stats.bytes, size + 10)
+
+    def test_disk_tier(self):
+        """Verify entries survive in the directory tier across caches."""
+        with tempfile.TemporaryDirectory() as tmp:
+            svg = RenderCache(directory=tmp).render('box "A"')
+            cache = RenderCache(directory=tmp)
+            self.assertEqual(cache.render('box "A"'), svg)
+            self.assertEqual(cache.stats.disk_hits, 1)
+            self.assertEqual(cache.stats.misses, 0)
+
+    def test_diagram_uses_configured_cache(self):
+        """Verify Diagram.__str__ and render consult the global cache."""
+        cache = RenderCache()
+        set_render_cache(cache)
+        self.assertIs(get_render_cache(), cache)
+        d = Diagram().add(Box("A").url("urlA"))
+        svg = str(d)
+        self.assertEqual(str(d), svg)
+        render('circle "C"')
+        stats = cache.stats
+        self.assertEqual((stats.hits, stats.misses), (1, 2))
+        self.assertIn('href="urlA"', svg)
+
+    def test_identical_diagrams_share_entries(self):
+        """Verify rebuilt diagrams hit the cache and keep their own ids."""
+        cache = RenderCache()
+        set_render_cache(cache)
+        svgs = []
+        for _ in range(3):
+            a, b = Box("A").url("urlA"), Box("B")
+            d = Diagram().add(a).add(b)
+            svg = str(d)
+            self.assertIn(f'<a href="urlA" data-pypikchr-id="{a._id}">', svg)
+            self.assertIn(f'<g data-pypikchr-id="{b._id}">', svg)
+            svgs.append(re.sub(r'data-pypikchr-id="\d+"', "", svg))
+        stats = cache.stats
+        self.assertEqual((stats.hits, stats.misses), (2, 1))
+        self.assertEqual(len(set(svgs)), 1)
+
+        light, dark = d.render_themes()
+        self.assertIn(f'data-pypikchr-id="{b._id}"', dark)
+        self.assertEqual(light, str(d))
+
+    def test_key_includes_version(self):
+        """Verify renderer upgrades do not reuse persisted entries."""
+        key = RenderCache.key('box "A"')
+        version = pypikchr.__version__
+        try:
+            pypikchr.__version__ = "0.0.0"
+            self.assertNotEqual(RenderCache.key('box "A"'), key)
+        finally:
+            pypikchr.__version__ = version
+
+    def test_themes_share_entries(self):
+        """Verify both themes are cached under the keys of a single render."""
+        cache = RenderCache()
+        set_render_cache(cache)
+        box = Box("A").fill("red")
+        d = Diagram().add(box)
+        light, dark = d.render_themes()
+        self.assertEqual(d.render_themes(), (light, dark))
+        self.assertEqual(str(d), light)
+        self.assertEqual(str(Diagram(flags=2).add(box)), dark)
+        self.assertEqual(cache.stats.entries, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
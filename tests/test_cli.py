@@ -0,0 +1,110 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from pypikchr.cli import MANIFEST_NAME, main
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        self.src = os.path.join(self.root, "src")
+        self.out = os.path.join(self.root, "out")
+        os.makedirs(os.path.join(self.src, "sub"))
+        self._write("a.pikchr", 'box "A"; arrow; circle "B"')
+        self._write(os.path.join("sub", "c.pikchr"), 'box "C"')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, name, text):
+        with open(os.path.join(self.src, name), "w") as f:
+            f.write(text)
+
+    def _main(self, *argv):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            status = main(list(argv))
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def _run(self, *args):
+        return self._main(self.src, "-o", self.out, *args)
+
+    def test_render_directory(self):
+        """Verify sources are rendered into the output tree with a manifest."""
+        status, stdout, _ = self._run("-j", "2", "--class", "diag")
+        self.assertEqual(status, 0)
+        self.assertIn("2 rendered", stdout)
+        with open(os.path.join(self.out, "sub", "c.svg")) as f:
+            self.assertIn('class="diag"', f.read())
+        with open(os.path.join(self.out, MANIFEST_NAME)) as f:
+            self.assertEqual(
+                sorted(json.load(f)), ["a.svg", os.path.join("sub", "c.svg")]
+            )
+
+    def test_skip_unchanged(self):
+        """Verify only changed sources or options trigger a new render."""
+        self._run()
+        self._write("a.pikchr", 'box "A2"')
+        status, stdout, _ = self._run()
+        self.assertEqual(status, 0)
+        self.assertIn("1 rendered, 1 unchanged", stdout)
+        status, stdout, _ = self._run("--dark")
+        self.assertIn("2 rendered, 0 unchanged", stdout)
+
+    def test_errors(self):
+        """Verify a failing source is reported and left out of the manifest."""
+        self._write("bad.pikchr", 'box "bad" fill')
+        status, stdout, stderr = self._run("--plaintext-errors")
+        self.assertEqual(status, 1)
+        self.assertIn("bad.pikchr", stderr)
+        self.assertIn("syntax error", stderr)
+        self.assertFalse(os.path.exists(os.path.join(self.out, "bad.svg")))
+        self.assertIn("2 rendered, 0 unchanged, 1 failed", stdout)
+        # Failures are retried on the next run
+        status, stdout, _ = self._run("--plaintext-errors")
+        self.assertIn("0 rendered, 2 unchanged, 1 failed", stdout)
+
+    def test_check(self):
+        """Verify --check reports compile errors without writing files."""
+        self._write("bad.pikchr", 'box\nbox "bad" wibble')
+        status, stdout, stderr = self._run("--check")
+        self.assertEqual(status, 1)
+        self.assertIn("bad.pikchr:2:11: syntax error", stderr)
+        self.assertIn("2 ok, 1 failed", stdout)
+        self.assertFalse(os.path.exists(self.out))
+
+    def test_unreadable(self):
+        """Verify a source which cannot be read fails the run."""
+        missing = os.path.join(self.src, "missing.pikchr")
+        a = os.path.join(self.src, "a.pikchr")
+        status, stdout, stderr = self._main(missing, a, "-o", self.out)
+        self.assertEqual(status, 1)
+        self.assertIn("missing.pikchr", stderr)
+        self.assertIn("1 rendered, 0 unchanged, 1 failed", stdout)
+        status, _, _ = self._main(missing, "-o", self.out, "--check")
+        self.assertEqual(status, 1)
+
+    def test_output_conflict(self):
+        """Verify sources sharing an output path fail instead of overwriting."""
+        self._write("c.pikchr", 'box "top"')
+        c = os.path.join(self.src, "c.pikchr")
+        sub_c = os.path.join(self.src, "sub", "c.pikchr")
+        status, _, stderr = self._main(c, sub_c, "-o", self.out)
+        self.assertEqual(status, 1)
+        self.assertIn("is also the output of", stderr)
+        with open(os.path.join(self.out, "c.svg")) as f:
+            self.assertIn("top", f.read())
+        # Globs keep the directories below their fixed prefix
+        pattern = os.path.join(self.src, "**", "c.pikchr")
+        status, _, _ = self._main(pattern, "-o", self.out, "-f")
+        self.assertEqual(status, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.out, "sub", "c.svg")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import io
+import re
+import unittest
+
+from pypikchr.diagram import Arrow, Box, Diagram, PikchrFlags
+from pypikchr.render import render_to
+from pypikchr.util.pikchr import PikchrException, create_pikchr, create_pikchr_themes
+
+MD = 'A: box "A" fill red; arrow; B: box "B" fill red; circle "C" fill red'
+
+
+def numbers(svg: str):
+    """Numbers in the geometry of an SVG, excluding its namespace and colors."""
+    svg = re.sub(r"xmlns='[^']*'|rgb\([^)]*\)|#[0-9a-f]+", "", svg)
+    return re.findall(r"-?\d+\.?\d*", svg)
+
+
+class TestCompact(unittest.TestCase):
+    def test_compact(self):
+        """Verify compact output drops optional whitespace and shortens colors."""
+        svg = create_pikchr(MD, "", PikchrFlags.COMPACT, 0, 0)
+        full = create_pikchr(MD, "", 0, 0, 0)
+        self.assertLess(len(svg), len(full))
+        self.assertNotIn("\n", svg)
+        self.assertNotIn(" />", svg)
+        self.assertIn("fill:#f00", svg)
+        self.assertNotIn("rgb(", svg)
+        self.assertEqual(numbers(svg), numbers(full))
+
+    def test_precision(self):
+        """Verify precision limits the decimals of every number."""
+        for digits in range(4):
+            flags = PikchrFlags.precision(digits)
+            svg = create_pikchr(MD, "", flags, 0, 0)
+            for num in numbers(svg):
+                self.assertLessEqual(len(num.partition(".")[2]), digits, num)
+                self.assertNotEqual(num, "-0")
+        svg = create_pikchr(MD, "", PikchrFlags.precision(0), 0, 0)
+        self.assertTrue(all(num.isdigit() for num in numbers(svg)))
+        with self.assertRaises(ValueError):
+            PikchrFlags.precision(7)
+
+    def test_style_classes(self):
+        """Verify repeated styles are merged into a <style> block."""
+        flags = PikchrFlags.COMPACT | PikchrFlags.STYLE_CLASSES
+        svg = create_pikchr(MD, "", flags, 0, 0)
+        match = re.search(r"<style>\.(p[0-9a-f]+)\{([^}]*)\}", svg)
+        self.assertIsNotNone(match)
+        name, style = match.groups()
+        self.assertIn("fill:#f00", style)
+        self.assertEqual(svg.count(f'class="{name}"'), 3)
+        self.assertNotIn(f'style="{style}"', svg)
+        self.assertLess(len(svg), len(create_pikchr(MD, "", PikchrFlags.COMPACT, 0, 0)))
+
+        # Styles that only appear once stay inline
+        single = create_pikchr('box "A"', "", PikchrFlags.STYLE_CLASSES, 0, 0)
+        self.assertEqual(single, create_pikchr('box "A"', "", 0, 0, 0))
+
+    def test_themes_and_streaming(self):
+        """Verify the flags apply to dark copies and to streamed output."""
+        flags = PikchrFlags.COMPACT | PikchrFlags.STYLE_CLASSES
+        light, dark = create_pikchr_themes(MD, "", flags)
+        self.assertEqual(light, create_pikchr(MD, "", flags, 0, 0))
+        self.assertEqual(
+            dark, create_pikchr(MD, "", flags | PikchrFlags.DARK_MODE, 0, 0)
+        )
+        self.assertIn("<style>", dark)
+
+        # Styles are left inline when the output is streamed
+        d = Diagram(flags=flags).add(Box("A").fill("red")).add(Box("B").fill("red"))
+        out = io.StringIO()
+        render_to(d, out)
+        self.assertNotIn("<style>", out.getvalue())
+        self.assertNotIn("\n", out.getvalue())
+
+    def test_diagram_flags(self):
+        """Verify Diagram accepts and validates the new flags."""
+        flags = PikchrFlags.COMPACT | PikchrFlags.precision(1)
+        box = Box("B")
+        d = Diagram(flags=flags).add(Box("A")).add(Arrow()).add(box)
+        svg = str(d)
+        self.assertNotIn("\n", svg)
+        self.assertTrue(all(len(n.partition(".")[2]) <= 1 for n in numbers(svg)))
+        self.assertIn(f'data-pypikchr-id="{box._id}"', svg)
+        with self.assertRaises(PikchrException):
+            Diagram(flags=0x0080)
+
+
+if __name__ == "__main__":
+    unittest.main()
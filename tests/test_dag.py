@@ -1,6 +1,6 @@
 import unittest
 
-from pypikchr.diagram import Box, Arrow, Diagram, Direction
+from pypikchr.diagram import Box, Arrow, Diagram, Direction, Group, Stack
 
 
 class TestDAG(unittest.TestCase):
@@ -18,6 +18,38 @@ class TestDAG(unittest.TestCase):
         self.assertIn("arrow", d.md)
         self.assertIn('S2: box "End" at S1.s', d.md)
 
+    def test_long_chain(self):
+        """Verify long chains emit the same markdown as joining each step."""
+        start = Box("S").label("S")
+        shape = start
+        expected = ['S: box "S"']
+        for i in range(2000):
+            shape = shape >> Arrow() >> Box(f"B{i}") >> "move"
+            expected.extend(["arrow", f'box "B{i}"', "move"])
+        shape = shape << "down"
+        d = Diagram(direction=Direction.down)
+        d.add(shape)
+        self.assertEqual(shape.md, "down; " + "; ".join(expected))
+        self.assertIn(shape.md, d.md)
+        # Shapes earlier in the chain are unaffected by later links
+        self.assertEqual(start.md, 'S: box "S"')
+
+        # The tag points at the last shape, past the chained markdown
+        _, nbytes, tags = shape._fragment()
+        self.assertEqual(nbytes, len(shape.md.encode()))
+        self.assertEqual(tags[0][0], shape.md.rindex("box"))
+
+    def test_chain_group(self):
+        """Verify chaining a Group or Stack keeps its contents."""
+        group = Group().add(Box("A")).add(Box("B"))
+        d = Diagram().add(group >> Box("C"))
+        self.assertEqual(d.md, '[\n  box "A";\n  box "B"\n]; box "C"')
+
+        stack = Stack().add(Box("A"))
+        d = Diagram().add(Box("C") << stack)
+        self.assertEqual(d.md, '[\n  down;\n  box "A"\n]; box "C"')
+        self.assertIn("<svg", str(d))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,237 @@
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+import pypikchr
+from pypikchr.util.pikchr import (
+    PikchrCompileError,
+    PikchrException,
+    SvgBuffer,
+    create_pikchr,
+    create_pikchr_buffer,
+    create_pikchr_stats,
+    create_pikchr_themes,
+    measure_text,
+    render_to,
+    validate,
+)
+
+
+class TestExtension(unittest.TestCase):
+    def test_buffer_matches_str(self):
+        """Verify the buffer output holds the same SVG as create_pikchr."""
+        md = 'box "A"; arrow; circle "B"'
+        buf = create_pikchr_buffer(md, svg_class="diag")
+        self.assertIsInstance(buf, SvgBuffer)
+        self.assertEqual(str(buf), create_pikchr(md, "diag", 0, 0, 0))
+        self.assertEqual(bytes(buf), buf.tobytes())
+        self.assertEqual(len(buf), len(buf.tobytes()))
+
+    def test_buffer_dimensions(self):
+        """Verify the pixel width and height are reported."""
+        buf = create_pikchr_buffer('box "A"')
+        self.assertGreater(buf.width, 0)
+        self.assertGreater(buf.height, 0)
+
+    def test_buffer_protocol(self):
+        """Verify the buffer can be viewed without copying."""
+        buf = create_pikchr_buffer('box "A"')
+        view = memoryview(buf)
+        self.assertTrue(view.readonly)
+        self.assertEqual(view.tobytes()[:4], b"<svg")
+
+    def test_buffer_error(self):
+        """Verify errors report negative dimensions and the error text."""
+        buf = create_pikchr_buffer("box foo bar", flags=0x0001)
+        self.assertEqual(buf.width, -1)
+        self.assertEqual(buf.height, -1)
+        self.assertIn("ERROR", str(buf))
+
+    def test_non_ascii(self):
+        """Verify multi-byte UTF-8 text round trips through both outputs."""
+        svg = create_pikchr('box "Größe"', "", 0, 0, 0)
+        self.assertIn("Größe", svg)
+        self.assertIn("Größe".encode(), bytes(create_pikchr_buffer('box "Größe"')))
+
+    def test_name_lookup_most_recent(self):
+        """Verify a reused name resolves to the most recent object."""
+        md = 'A: box "first"; A: box "second" at 2,0; dot at A.c'
+        svg = create_pikchr(md, "", 0x0001, 0, 0)
+        ref = create_pikchr(
+            'box "first"; A: box "second" at 2,0; dot at A.c', "", 0x0001, 0, 0
+        )
+        self.assertEqual(svg, ref)
+
+    def test_name_lookup_by_text(self):
+        """Verify objects can be referenced by their text and names win."""
+        by_text = create_pikchr(
+            'box "Alpha"; B: box at 2,0; arrow from Alpha to B', "", 1, 0, 0
+        )
+        self.assertNotIn("ERROR", by_text)
+        # The tagged name takes precedence over the more recent text match
+        by_name = create_pikchr(
+            'Alpha: box; box "Alpha" at 2,0; dot at Alpha.c', "", 1, 0, 0
+        )
+        self.assertIn('<circle cx="56.16"', by_name)
+
+    def test_name_lookup_missing(self):
+        """Verify unknown names still raise a pikchr error."""
+        svg = create_pikchr("box; arrow from Nope to last box", "", 1, 0, 0)
+        self.assertIn("no such object", svg)
+
+    def test_validate(self):
+        """Verify validation reports the size a render would produce."""
+        md = 'scale = 2; box "A"; arrow; circle "B"'
+        buf = create_pikchr_buffer(md)
+        self.assertEqual(validate(md), (buf.width, buf.height))
+        self.assertEqual(validate(""), (0, 0))
+
+    def test_validate_error(self):
+        """Verify compile errors carry the line, column and message."""
+        with self.assertRaises(PikchrCompileError) as ctx:
+            validate('box "é"\nbox; arrow from Nope to last box')
+        err = ctx.exception
+        self.assertIsInstance(err, PikchrException)
+        self.assertEqual((err.line, err.column), (2, 17))
+        self.assertEqual(err.message, "no such object")
+        self.assertEqual(str(err), "line 2, column 17: no such object")
+
+    def test_themes_match_separate_renders(self):
+        """Verify both themes match rendering with and without dark mode."""
+        md = (
+            'box "A" fill red; arrow <-> right then down; spline -> from last.end '
+            'to (1,1) then to (2,0) then to (3,1) "s"; circle "B" color blue'
+        )
+        objects = [(0, 1, "https://example.com")]
+        light, dark = create_pikchr_themes(md, "c", 2, objects)
+        self.assertEqual(light, create_pikchr(md, "c", 0, 0, 0, objects))
+        self.assertEqual(dark, create_pikchr(md, "c", 2, 0, 0, objects))
+        self.assertNotEqual(light, dark)
+        light, dark = create_pikchr_themes("box fill", flags=1)
+        self.assertIn("syntax error", light)
+        self.assertEqual(light, dark)
+
+    def test_size_hint(self):
+        """Verify a size hint does not change the output."""
+        md = 'box "A"; arrow; circle "B"'
+        svg = create_pikchr(md, "", 0, 0, 0)
+        for hint in (1, len(svg), 10 * len(svg)):
+            self.assertEqual(create_pikchr(md, "", 0, 0, 0, None, hint), svg)
+            buf = create_pikchr_buffer(md, size_hint=hint)
+            self.assertEqual(buf.tobytes().decode(), svg)
+        self.assertEqual(
+            create_pikchr("", "", 0, 0, 0, None, 100), create_pikchr("", "", 0, 0, 0)
+        )
+
+    def test_size_hint_range(self):
+        """Verify negative or oversized size hints are rejected."""
+        for hint in (-1, 2**31, 2**32 - 1):
+            with self.assertRaises(ValueError):
+                create_pikchr("box", "", 0, 0, 0, None, hint)
+            with self.assertRaises(ValueError):
+                create_pikchr_buffer("box", size_hint=hint)
+            with self.assertRaises(ValueError):
+                create_pikchr_stats("box", size_hint=hint)
+
+    def test_render_to(self):
+        """Verify streamed output matches create_pikchr, in several chunks."""
+        md = ";\n".join(f'box "n{i}" fill red; arrow' for i in range(1000))
+        svg = create_pikchr(md, "c", 0, 0, 0).encode()
+        self.assertGreater(len(svg), 4 * 65536)
+
+        chunks = []
+
+        class Writer:
+            def write(self, data):
+                chunks.append(data)
+
+        self.assertEqual(render_to(Writer(), md, "c")[2], len(svg))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(b"".join(chunks), svg)
+
+        with tempfile.TemporaryFile() as f:
+            width, height, size = render_to(f.fileno(), md, "c")
+            f.seek(0)
+            self.assertEqual(f.read(), svg)
+        self.assertEqual(
+            (width, height, size), (create_pikchr_buffer(md).width, 76, len(svg))
+        )
+
+    def test_render_to_errors(self):
+        """Verify compile and write errors are raised with nothing written."""
+        out = io.BytesIO()
+        with self.assertRaises(PikchrCompileError):
+            render_to(out, 'box "x" fill')
+        self.assertEqual(out.getvalue(), b"")
+
+        class Failing:
+            def write(self, data):
+                raise RuntimeError("disk full")
+
+        with self.assertRaisesRegex(RuntimeError, "disk full"):
+            render_to(Failing(), "box")
+        with self.assertRaises(ValueError):
+            render_to(-1, "box")
+
+    def test_measure_text(self):
+        """Verify text is measured with pikchr's character width table."""
+        widths = measure_text(["iii", "WWW", "", "&lt;", "\\x", "é"])
+        self.assertLess(widths[0], widths[1])
+        self.assertEqual(widths[2], 0.0)
+        # Entities count as 1.5 average characters, escapes as the character
+        self.assertAlmostEqual(widths[3], 1.5 * 0.08)
+        self.assertEqual(widths[4], measure_text(["x"])[0])
+        self.assertAlmostEqual(widths[5], 0.08)
+        mono = measure_text(("iii", "WWW"), mono=True, charwid=0.1)
+        self.assertEqual(mono[0], mono[1])
+        self.assertAlmostEqual(mono[0], 3 * 0.82 * 0.1)
+        with self.assertRaises(TypeError):
+            measure_text("abc")
+        with self.assertRaises(TypeError):
+            measure_text([1])
+
+    def test_buffer_not_instantiable(self):
+        """Verify SvgBuffer objects can only come from the renderer."""
+        with self.assertRaises(TypeError):
+            SvgBuffer()
+
+    def test_threaded_renders(self):
+        """Verify concurrent renders on many threads produce the same output."""
+        md = 'A: box "A"; arrow; circle "B" at A.e + (1, 0)'
+        expected = create_pikchr(md, "", 0, 0, 0)
+        results = []
+
+        def work():
+            results.extend(create_pikchr(md, "", 0, 0, 0) for _ in range(50))
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [expected] * 400)
+
+    def test_isolated_subinterpreter(self):
+        """Verify the module loads in sub-interpreters with their own GIL."""
+        try:
+            import _interpreters as interpreters
+        except ImportError:
+            self.skipTest("Requires Python 3.13+")
+        path = os.path.dirname(os.path.dirname(pypikchr.__file__))
+        iid = interpreters.create("isolated")
+        try:
+            err = interpreters.exec(
+                iid,
+                f"import sys; sys.path.insert(0, {path!r})\n"
+                "from pypikchr.util.pikchr import create_pikchr_buffer\n"
+                "assert create_pikchr_buffer('box').width > 0\n",
+            )
+        finally:
+            interpreters.destroy(iid)
+        self.assertIsNone(err)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,15 @@
+import io
 import re
 import unittest
 
+import pypikchr
 from pypikchr.diagram import Box, Arrow, Diagram, Stack, Group
+from pypikchr.diagram.diagram import Direction
+from pypikchr.util.pikchr import (
+    PikchrCompileError,
+    create_pikchr_buffer,
+    measure_text,
+)
 
 
 class TestFeatures(unittest.TestCase):
@@ -29,8 +37,26 @@ class TestFeatures(unittest.TestCase):
         self.assertEqual(len(widths), 2)
         # They should both be the same
         self.assertEqual(widths[0], widths[1])
-        # And should be based on the long label (approx 21 chars * 0.1 + 0.2 = 2.3)
-        self.assertAlmostEqual(float(widths[0]), 2.3, places=2)
+        # And should be based on the measured long label
+        expected = measure_text(["Veeeery Looong Labeel"])[0] + 0.2
+        self.assertAlmostEqual(float(widths[0]), expected, places=4)
+
+    def test_auto_size_boxes_matches_fit(self):
+        """Verify measured widths agree with pikchr's fit, inside groups too."""
+        text = "Wide WWW text &amp; more"
+        fitted = Diagram()
+        fitted.add(Box(text).fit())
+        sized = Diagram()
+        inner = Box(text)
+        sized.add(Box("i")).add(Stack().add(Group().add(inner)))
+        # fit pads the text by one character width, 0.08in
+        sized.auto_size_boxes(padding=0.08)
+        self.assertIn("width", inner.md)
+        fit_box = fitted.layout(svg=False).shapes[0].bbox
+        sized_box = sized.layout(svg=False).get(inner).bbox
+        self.assertAlmostEqual(
+            fit_box[2] - fit_box[0], sized_box[2] - sized_box[0], delta=0.01
+        )
 
     def test_stack_layout(self):
         """Verify Stack helper generates correct pikchr markdown subdiagram."""
@@ -70,6 +96,144 @@ class TestFeatures(unittest.TestCase):
         self.assertEqual(svg.count("<a "), 2)
         self.assertEqual(svg.count("</a>"), 2)
 
+    def test_iter_svg_matches_str(self):
+        """Verify streamed SVG chunks concatenate to the full SVG."""
+        d = Diagram()
+        d.add(Box("A").url("urlA")).add(Arrow()).add(Box("B"))
+        self.assertEqual("".join(d.iter_svg()), str(d))
+
+    def test_shape_wrappers(self):
+        """Verify every shape is wrapped in an element carrying its id."""
+        d = Diagram()
+        a = Box("A").url("urlA")
+        arrow = Arrow()
+        b = Box("B")
+        d.add(a).add(arrow).add(b)
+        svg = str(d)
+        self.assertIn(f'<a href="urlA" data-pypikchr-id="{a._id}">', svg)
+        self.assertIn(f'<g data-pypikchr-id="{arrow._id}">', svg)
+        self.assertIn(f'<g data-pypikchr-id="{b._id}">', svg)
+        self.assertNotIn("pypikchr-id:", svg)
+
+    def test_url_does_not_resize(self):
+        """Verify URLs do not change the layout of the shape they wrap."""
+        plain = Diagram().add(Box("A"))
+        linked = Diagram().add(Box("A").url("https://example.com/a/long/path"))
+        self.assertEqual(plain.md, linked.md)
+
+        def strip(svg, close):
+            """Lines of an SVG without the object wrapper elements."""
+            return [
+                line
+                for line in svg.splitlines()
+                if "pypikchr-id" not in line and line != close
+            ]
+
+        self.assertEqual(strip(str(plain), "</g>"), strip(str(linked), "</a>"))
+
+    def test_url_escaped(self):
+        """Verify URLs are escaped for use in the href attribute."""
+        d = Diagram().add(Box("A").url('https://example.com/?a=1&b="2"'))
+        self.assertIn('href="https://example.com/?a=1&amp;b=&quot;2&quot;"', str(d))
+
+    def test_group_child_change(self):
+        """Verify changing a shape inside a group updates the diagram."""
+        g = Group()
+        inner = Box("Inner")
+        g.add(inner)
+        d = Diagram().add(g)
+        self.assertNotIn("fill red", d.md)
+        inner.fill("red")
+        self.assertIn('box "Inner" fill red', d.md)
+        g.add(Box("Second"))
+        self.assertIn('box "Second"', d.md)
+
+    def test_group_in_diagram(self):
+        """Verify groups render inside a diagram and wrap their children."""
+        g = Group()
+        inner = Box("Inner").url("urlI")
+        g.add(inner)
+        d = Diagram().add(g).add(Box("Ünïcode"))
+        self.assertIn('box "Inner"', d.md)
+        svg = str(d)
+        self.assertNotIn("ERROR", svg)
+        self.assertIn(f'<g data-pypikchr-id="{g._id}">', svg)
+        self.assertLess(
+            svg.index(f'data-pypikchr-id="{g._id}"'),
+            svg.index(f'data-pypikchr-id="{inner._id}"'),
+        )
+        self.assertEqual(svg.count("<g "), 2)
+
+    def test_iter_svg_empty(self):
+        """Verify an empty diagram streams nothing."""
+        self.assertEqual(list(Diagram().iter_svg()), [])
+
+    def test_iter_svg_chunks(self):
+        """Verify large diagrams are streamed in several chunks."""
+        d = Diagram()
+        for i in range(2000):
+            d.add(Box(f"node {i}")).add(Arrow())
+        chunks = list(d.iter_svg())
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), str(d))
+
+        # Stopping early releases the rendering thread
+        stream = d.iter_svg()
+        next(stream)
+        stream.close()
+
+    def test_iter_svg_error(self):
+        """Verify a diagram which does not compile streams its error text."""
+        d = Diagram().add("box fill")
+        self.assertEqual("".join(d.iter_svg()), str(d))
+
+    def test_get_md_deprecated(self):
+        """Verify the deprecated Shape.get_md still returns the markdown."""
+        box = Box("A").fill("red")
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(box.get_md(), box.md)
+
+    def test_validate(self):
+        """Verify diagrams can be checked without rendering."""
+        d = Diagram(shape=Box("A"))
+        buf = create_pikchr_buffer(d.md)
+        self.assertEqual(d.validate(), (buf.width, buf.height))
+        d.add("arrow from Nope")
+        with self.assertRaises(PikchrCompileError) as ctx:
+            d.validate()
+        self.assertEqual(ctx.exception.line, 2)
+
+    def test_render_to(self):
+        """Verify Diagram.render_to streams the same SVG to text and bytes."""
+        d = Diagram()
+        for i in range(2000):
+            d.add(Box(f"ünïcødé {i}").url(f"https://example.com/{i}"))
+        svg = str(d)
+        text = io.StringIO()
+        size = d.render_to(text)
+        self.assertEqual(text.getvalue(), svg)
+        self.assertEqual(size, len(svg.encode()))
+        binary = io.BytesIO()
+        pypikchr.render_to(d, binary)
+        self.assertEqual(binary.getvalue().decode(), svg)
+        self.assertEqual(Diagram().render_to(binary), 0)
+
+    def test_iter_md_matches_md(self):
+        """Verify streamed markdown matches the md property, nested groups too."""
+        d = Diagram(direction=Direction.down)
+        g = Group().add(Box("A")).add(Stack("right").add(Box("B")).add("move"))
+        d.add(Box("Start")).add(g).add(Arrow())
+        streamed = "".join(d.iter_md())
+        self.assertIsNone(g._fragment_cache)
+        self.assertEqual(streamed, d.md)
+
+        text = io.StringIO()
+        d.write_md(text)
+        self.assertEqual(text.getvalue(), d.md)
+        data = io.BytesIO()
+        d.write_md(data)
+        self.assertEqual(data.getvalue(), d.md.encode())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+from pypikchr.diagram import Arrow, Box, Circle, Diagram, Group
+from pypikchr.geometry import ShapeGeometry, SpatialIndex
+from pypikchr.util.pikchr import create_pikchr_geometry
+
+
+class TestGeometry(unittest.TestCase):
+    def test_geometry_matches_svg(self):
+        """Verify geometry is reported in the coordinates of the SVG."""
+        d = Diagram()
+        box = Box("A").label("A")
+        arrow = Arrow()
+        d.add(box).add(arrow)
+        layout = d.layout()
+        self.assertEqual(layout.svg, str(d))
+
+        geom = layout.get("A")
+        self.assertIs(geom.shape, box)
+        self.assertIs(layout.get(box), geom)
+        x0, y0, x1, y1 = geom.bbox
+        self.assertIn(f'd="M{x0:g},{y1:g}L{x1:g},{y1:g}L{x1:g},{y0:g}', layout.svg)
+        self.assertAlmostEqual(geom.center[0], (x0 + x1) / 2)
+
+        path = layout.get(arrow).path
+        self.assertEqual(len(path), 2)
+        self.assertEqual(path[0][0], x1)
+
+    def test_nested_shapes(self):
+        """Verify shapes inside groups are reported after their group."""
+        d = Diagram()
+        circle = Circle("C")
+        group = Group().add(circle)
+        d.add(Box("A")).add(group)
+        layout = d.layout(svg=False)
+        self.assertIsNone(layout.svg)
+        self.assertEqual([g.shape for g in layout.shapes][1:], [group, circle])
+
+    def test_raw_geometry_error(self):
+        """Verify errors return the error text and no geometry."""
+        svg, geometry = create_pikchr_geometry("box fill", svg=False)
+        self.assertIn("syntax error", svg)
+        self.assertEqual(geometry, [])
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        self.shape = Box()
+        self.items = [
+            ShapeGeometry(self.shape, (0, 0, 100, 50), (50, 25), ()),
+            ShapeGeometry(
+                self.shape, (100, 25, 200, 25), (150, 25), ((100, 25), (200, 25))
+            ),
+            ShapeGeometry(self.shape, (200, 0, 300, 50), (250, 25), ()),
+            # Diagonal line, and a large group over everything
+            ShapeGeometry(
+                self.shape, (0, 0, 300, 300), (150, 150), ((0, 0), (300, 300))
+            ),
+            ShapeGeometry(self.shape, (0, 0, 3000, 3000), (1500, 1500), ()),
+        ]
+        self.index = SpatialIndex(self.items, cell_size=10)
+
+    def test_at_point(self):
+        """Verify point queries return the topmost shape first."""
+        hits = self.index.at_point(20, 10)
+        self.assertEqual(hits, [self.items[4], self.items[0]])
+        self.assertEqual(self.index.at_point(150, 27)[1], self.items[1])
+
+    def test_lines_use_path(self):
+        """Verify lines are only hit near their path, not their whole bbox."""
+        self.assertIn(self.items[3], self.index.at_point(151, 150))
+        self.assertNotIn(self.items[3], self.index.at_point(250, 60))
+
+    def test_in_rect(self):
+        """Verify rect queries return overlapping or contained shapes."""
+        hits = self.index.in_rect(90, 20, 210, 30)
+        self.assertEqual(hits, self.items[:5])
+        contained = self.index.in_rect(-1, -1, 301, 60, contained=True)
+        self.assertEqual(contained, self.items[:3])
+
+    def test_large_index(self):
+        """Verify queries against many shapes agree with a linear scan."""
+        items = [
+            ShapeGeometry(self.shape, (x, y, x + 8, y + 5), (x + 4, y + 2.5), ())
+            for x in range(0, 1000, 10)
+            for y in range(0, 1000, 7)
+        ]
+        index = SpatialIndex(items)
+        for px, py in [(3, 4), (503.5, 702), (999, 999), (9, 2)]:
+            expected = [
+                g
+                for g in reversed(items)
+                if g.bbox[0] <= px <= g.bbox[2] and g.bbox[1] <= py <= g.bbox[3]
+            ]
+            self.assertEqual(index.at_point(px, py), expected)
+        rect = index.in_rect(100, 100, 200, 150)
+        self.assertEqual(
+            rect,
+            [
+                g
+                for g in items
+                if g.bbox[0] <= 200
+                and g.bbox[2] >= 100
+                and g.bbox[1] <= 150
+                and g.bbox[3] >= 100
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
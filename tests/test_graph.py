@@ -0,0 +1,74 @@
+import random
+import unittest
+
+from pypikchr.diagram import Direction, from_graph, layered_layout
+
+
+class TestLayeredLayout(unittest.TestCase):
+    def test_chain(self):
+        """Verify a chain is laid out one node per layer."""
+        layout = layered_layout([("a", "b"), ("b", "c")], height=0.5, layer_gap=0.5)
+        self.assertEqual(layout.nodes, ["a", "b", "c"])
+        self.assertEqual(
+            [layout.positions[n] for n in "abc"], [(0.0, 0.0), (0.0, -1.0), (0.0, -2.0)]
+        )
+        right = layered_layout({"a": ["b"]}, direction=Direction.right, width=1)
+        self.assertEqual(right.positions["b"], (1.5, 0.0))
+
+    def test_long_edges_and_cycles(self):
+        """Verify long edges bend through each layer and cycles are broken."""
+        layout = layered_layout({"a": ["b", "d", "a"], "b": ["c"], "c": ["d", "a"]})
+        edges = {(s, t): bends for s, t, bends in layout.edges}
+        self.assertNotIn(("a", "a"), edges)
+        self.assertEqual(len(edges[("a", "d")]), 2)
+        # c -> a is drawn against the flow, bending through layer 1
+        self.assertEqual(len(edges[("c", "a")]), 1)
+        self.assertGreater(edges[("c", "a")][0][1], layout.positions["c"][1])
+
+    def test_no_overlaps(self):
+        """Verify nodes in the same layer are kept apart."""
+        rng = random.Random(0)
+        edges = [(rng.randrange(i), i) for i in range(1, 300)]
+        layout = layered_layout(edges, width=0.75, node_gap=0.25)
+        layers = {}
+        for x, y in layout.positions.values():
+            layers.setdefault(y, []).append(x)
+        for xs in layers.values():
+            xs.sort()
+            for a, b in zip(xs, xs[1:]):
+                self.assertGreaterEqual(b - a, 0.9999)
+
+
+class TestFromGraph(unittest.TestCase):
+    def test_diagram(self):
+        """Verify nodes are placed absolutely and arrows join labelled nodes."""
+        d = from_graph({"start": ["end"], "end": ["start"]}, texts={"end": "stop"})
+        md = d.md
+        self.assertIn('N0: box "start" width 0.75 height 0.5 at (0.0, 0.0)', md)
+        self.assertIn('N1: box "stop"', md)
+        self.assertIn("arrow from N0.s to N1.n", md)
+        self.assertIn("arrow from N1.n to N0.s", md)
+        self.assertTrue(str(d).startswith("<svg"))
+
+    def test_quoted_labels(self):
+        """Verify quotes and backslashes in node text are escaped."""
+        d = from_graph([('"hi"', "C:\\")], texts={"C:\\": 'a"b'})
+        self.assertIn('box "\\"hi\\""', d.md)
+        svg = str(d)
+        self.assertTrue(svg.startswith("<svg"))
+        self.assertIn('>"hi"</text>', svg)
+        self.assertIn('>a"b</text>', svg)
+        d = from_graph([("x", "C:\\")])
+        self.assertIn(">C:&#92;</text>", str(d))
+
+    def test_large_graph(self):
+        """Verify a large graph renders without errors."""
+        rng = random.Random(1)
+        edges = [(rng.randrange(max(0, i - 50), i), i) for i in range(1, 1000)]
+        d = from_graph(edges, direction=Direction.right)
+        self.assertTrue(str(d).startswith("<svg"))
+        self.assertEqual(len(from_graph([]).md), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
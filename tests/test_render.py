@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from pypikchr import render, render_async, render_many, render_many_async
+from pypikchr.diagram import Box, Diagram
+
+
+class TestRender(unittest.TestCase):
+    def test_render_source(self):
+        """Verify raw pikchr sources render with the requested class."""
+        svg = render('box "A"', svg_class="diag")
+        self.assertIn("<svg", svg)
+        self.assertIn('class="diag"', svg)
+
+    def test_render_many_order(self):
+        """Verify batch results are returned in input order."""
+        sources = [f'box "Item{i}"' for i in range(50)]
+        svgs = render_many(sources, max_workers=8)
+        self.assertEqual(len(svgs), len(sources))
+        for i, svg in enumerate(svgs):
+            self.assertIn(f"Item{i}<", svg)
+
+    def test_render_many_mixed(self):
+        """Verify diagrams and raw sources can be mixed in one batch."""
+        d = Diagram().add(Box("Link").url("https://example.com"))
+        svgs = render_many([d, 'circle "C"'], max_workers=2)
+        self.assertEqual(svgs[0], str(d))
+        self.assertIn("<circle", svgs[1])
+
+    def test_render_many_empty(self):
+        self.assertEqual(render_many([]), [])
+
+
+class TestRenderAsync(unittest.TestCase):
+    def test_render_async(self):
+        """Verify async renders match synchronous ones and run off the loop."""
+        d = Diagram(shape=Box("A").url("https://example.com"))
+        threads = []
+
+        class Recording(ThreadPoolExecutor):
+            def submit(self, fn, *args, **kwargs):
+                def run():
+                    threads.append(threading.get_ident())
+                    return fn(*args, **kwargs)
+
+                return super().submit(run)
+
+        async def main():
+            with Recording(max_workers=2) as pool:
+                svg = await render_async(d, executor=pool)
+            src = await render_async('box "B"', svg_class="diag")
+            return svg, src
+
+        svg, src = asyncio.run(main())
+        self.assertEqual(svg, str(d))
+        self.assertEqual(src, render('box "B"', svg_class="diag"))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    def test_render_many_async_bounded(self):
+        """Verify batch results keep input order and respect the limit."""
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        class Counting(ThreadPoolExecutor):
+            def submit(self, fn, *args, **kwargs):
+                def run():
+                    nonlocal active, peak
+                    with lock:
+                        active += 1
+                        peak = max(peak, active)
+                    try:
+                        return fn(*args, **kwargs)
+                    finally:
+                        with lock:
+                            active -= 1
+
+                return super().submit(run)
+
+        sources = [f'box "Item{i}"' for i in range(40)]
+
+        async def main():
+            with Counting(max_workers=8) as pool:
+                return await render_many_async(
+                    sources, max_concurrency=3, executor=pool
+                )
+
+        svgs = asyncio.run(main())
+        for i, svg in enumerate(svgs):
+            self.assertIn(f"Item{i}<", svg)
+        self.assertLessEqual(peak, 3)
+
+    def test_render_many_async_cancel(self):
+        """Verify cancelling a batch cancels the renders still pending."""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        class Blocking(ThreadPoolExecutor):
+            def submit(self, fn, *args, **kwargs):
+                def run():
+                    calls.append(args[0])
+                    started.set()
+                    release.wait(5)
+                    return fn(*args, **kwargs)
+
+                return super().submit(run)
+
+        async def main(pool):
+            task = asyncio.ensure_future(
+                render_many_async(
+                    [f'box "B{i}"' for i in range(10)],
+                    max_concurrency=1,
+                    executor=pool,
+                )
+            )
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with Blocking(max_workers=1) as pool:
+            asyncio.run(main(pool))
+            release.set()
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,347 @@
+import asyncio
+import gzip
+import http.client
+import io
+import json
+import threading
+import unittest
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+from wsgiref.util import setup_testing_defaults
+from wsgiref.validate import validator
+
+from pypikchr.diagram import Arrow, Box, Diagram, PikchrFlags
+from pypikchr.serve import ASGIApp, DiagramService, WSGIApp, encode_diagram
+from pypikchr.util.pikchr import create_pikchr
+
+SOURCE = 'A: box "A" fill lightblue; arrow; B: box "B"; circle "C" fill red'
+
+Result_T = Tuple[int, Dict[str, str], bytes]
+
+
+def wsgi_request(
+    app,
+    method: str = "GET",
+    query: str = "",
+    body: bytes = b"",
+    headers: Optional[Dict[str, str]] = None,
+) -> Result_T:
+    """Call a WSGI app in-process through the wsgiref validator.
+
+    Header names in the result are lowercase.
+    """
+    environ = {
+        "REQUEST_METHOD": method,
+        "QUERY_STRING": query,
+        "wsgi.input": io.BytesIO(body),
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for name, value in (headers or {}).items():
+        if name.lower() == "content-type":
+            environ["CONTENT_TYPE"] = value
+        else:
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+    setup_testing_defaults(environ)
+    started = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        started["status"] = int(status.split()[0])
+        started["headers"] = {k.lower(): v for k, v in response_headers}
+        return lambda data: None
+
+    result = validator(app)(environ, start_response)
+    try:
+        data = b"".join(result)
+    finally:
+        result.close()
+    return started["status"], started["headers"], data
+
+
+def asgi_request(
+    app,
+    method: str = "GET",
+    query: str = "",
+    body: bytes = b"",
+    headers: Optional[Dict[str, str]] = None,
+    chunk: int = 1 << 20,
+) -> Result_T:
+    """Call an ASGI app in-process, sending the body in chunks."""
+    chunks: List[bytes] = [body[i : i + chunk] for i in range(0, len(body), chunk)]
+    messages = [
+        {"type": "http.request", "body": c, "more_body": i < len(chunks) - 1}
+        for i, c in enumerate(chunks or [b""])
+    ]
+    sent: List[dict] = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "query_string": query.encode(),
+        "headers": [
+            (k.lower().encode(), v.encode()) for k, v in (headers or {}).items()
+        ],
+    }
+    asyncio.run(app(scope, receive, send))
+    start, response = sent
+    return (
+        start["status"],
+        {k.decode(): v.decode() for k, v in start["headers"]},
+        response["body"],
+    )
+
+
+class TestServe(unittest.TestCase):
+    def test_get_and_post(self):
+        """Verify sources are rendered from the query string and the body."""
+        svg = create_pikchr(SOURCE, "", 0, 0, 0).encode()
+        for request in (wsgi_request, asgi_request):
+            app = (WSGIApp if request is wsgi_request else ASGIApp)()
+            status, headers, body = request(app, query="source=" + quote(SOURCE))
+            self.assertEqual((status, body), (200, svg))
+            self.assertEqual(headers["content-type"], "image/svg+xml; charset=utf-8")
+
+            status, _, body = request(app, "POST", body=SOURCE.encode())
+            self.assertEqual((status, body), (200, svg))
+            status, _, body = request(app, "HEAD", query="source=" + quote(SOURCE))
+            self.assertEqual((status, body), (200, b""))
+
+    def test_diagram_body(self):
+        """Verify a serialized Diagram renders exactly as str(diagram)."""
+        flags = PikchrFlags.COMPACT
+        d = (
+            Diagram(flags=flags)
+            .add(Box("A").url("a?b=1&c=2"))
+            .add(Arrow())
+            .add(Box("B"))
+        )
+        app = WSGIApp()
+        status, _, body = wsgi_request(
+            app,
+            "POST",
+            body=encode_diagram(d, "diag"),
+            headers={"Content-Type": "application/json"},
+        )
+        self.assertEqual(status, 200)
+        expected = str(d).replace('class=""', 'class="diag"', 1)
+        self.assertEqual(body.decode(), expected)
+        self.assertIn('href="a?b=1&amp;c=2"', expected)
+
+    def test_hostile_input(self):
+        """Verify classes and object URLs cannot inject markup."""
+        service = DiagramService()
+        hostile = '"><script>alert(1)</script><a x="'
+        status = service.handle("GET", "source=box&class=" + quote(hostile)).status
+        self.assertEqual(status, 400)
+        status = service.handle(
+            "POST",
+            "",
+            {"content-type": "application/json"},
+            json.dumps({"source": "box", "class": hostile}).encode(),
+        ).status
+        self.assertEqual(status, 400)
+        with self.assertRaises(ValueError):
+            DiagramService(svg_class=hostile)
+
+        def post(url):
+            body = json.dumps({"source": "box", "objects": [[0, 1, url]]})
+            return service.handle(
+                "POST", "", {"content-type": "application/json"}, body.encode()
+            )
+
+        for url in ("javascript:alert(1)", " JavaScript:alert(1)", "data:text/html,x"):
+            self.assertEqual(post(url).status, 400)
+        response = post(hostile)
+        self.assertEqual(response.status, 200)
+        self.assertNotIn(b"<script>", response.body)
+        self.assertIn(b"&lt;script&gt;", response.body)
+        self.assertEqual(post("https://example.com/").status, 200)
+
+    def test_etag(self):
+        """Verify conditional requests are answered without rendering."""
+        service = DiagramService()
+        app = ASGIApp(service)
+        query = "source=" + quote(SOURCE)
+        _, headers, _ = asgi_request(app, query=query)
+        etag = headers["etag"]
+        self.assertEqual(headers["vary"], "Accept-Encoding")
+
+        status, headers, body = asgi_request(
+            app, query=query, headers={"If-None-Match": f'"other", W/{etag}'}
+        )
+        self.assertEqual((status, body, headers["etag"]), (304, b"", etag))
+        self.assertEqual(service.stats.renders, 1)
+        self.assertEqual(service.stats.not_modified, 1)
+
+        # The tag depends on the flags and class
+        _, headers, _ = asgi_request(app, query=query + "&flags=2")
+        self.assertNotEqual(headers["etag"], etag)
+        _, headers, _ = asgi_request(app, query=query + "&class=diag")
+        self.assertNotEqual(headers["etag"], etag)
+
+    def test_compression(self):
+        """Verify compressed variants are negotiated and cached."""
+        service = DiagramService(min_compress=0)
+        app = WSGIApp(service)
+        query = "source=" + quote(SOURCE)
+        svg = create_pikchr(SOURCE, "", 0, 0, 0).encode()
+        status, headers, body = wsgi_request(
+            app, query=query, headers={"Accept-Encoding": "gzip;q=0.8, deflate"}
+        )
+        self.assertEqual(headers["content-encoding"], "gzip")
+        self.assertTrue(headers["etag"].endswith('-gzip"'))
+        self.assertEqual(gzip.decompress(body), svg)
+
+        _, _, again = wsgi_request(app, query=query, headers={"Accept-Encoding": "*"})
+        self.assertEqual(again, body)
+        _, headers, plain = wsgi_request(
+            app, query=query, headers={"Accept-Encoding": "gzip;q=0"}
+        )
+        self.assertNotIn("content-encoding", headers)
+        self.assertEqual(plain, svg)
+        stats = service.stats
+        self.assertEqual(stats.renders, 1)
+        self.assertEqual(stats.entries, 2)
+        self.assertEqual(stats.bytes, len(svg) + len(body))
+
+        # A compressed request for the same content revalidates
+        status, _, _ = wsgi_request(
+            app,
+            query=query,
+            headers={"If-None-Match": headers["etag"][:-1] + '-gzip"'},
+        )
+        self.assertEqual(status, 304)
+
+        # Small SVGs are not worth compressing
+        service = DiagramService(min_compress=len(svg) + 1)
+        _, headers, body = wsgi_request(
+            WSGIApp(service), query=query, headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertNotIn("content-encoding", headers)
+        self.assertEqual(body, svg)
+
+    def test_cache_bounds(self):
+        """Verify the cache of responses is bounded by count and size."""
+        service = DiagramService(max_entries=2)
+        for i in range(4):
+            service.handle("GET", f"source=box+%22{i}%22")
+        stats = service.stats
+        self.assertEqual((stats.entries, stats.evictions), (2, 2))
+
+        service = DiagramService(max_bytes=10)
+        service.handle("GET", "source=box")
+        self.assertEqual(service.stats.entries, 0)
+
+    def test_limits(self):
+        """Verify oversized and malformed requests are rejected."""
+        service = DiagramService(max_body=64, max_query=64)
+        for request in (wsgi_request, asgi_request):
+            app = (WSGIApp if request is wsgi_request else ASGIApp)(service)
+            status, _, _ = request(app, "POST", body=b"box;" * 20)
+            self.assertEqual(status, 413)
+            status, _, _ = request(app, query="source=" + "box;" * 20)
+            self.assertEqual(status, 414)
+            status, _, _ = request(app, "PUT", body=b"box")
+            self.assertEqual(status, 405)
+            status, _, _ = request(app, query="flags=x&source=box")
+            self.assertEqual(status, 400)
+            status, _, _ = request(app, query="flags=256&source=box")
+            self.assertEqual(status, 400)
+            status, _, _ = request(app)
+            self.assertEqual(status, 400)
+            status, _, _ = request(
+                app,
+                "POST",
+                body=b'{"source": 1}',
+                headers={"Content-Type": "application/json"},
+            )
+            self.assertEqual(status, 400)
+            status, _, _ = request(
+                app,
+                "POST",
+                body=b'{"source": "box", "objects": [[0, 1, 2]]}',
+                headers={"Content-Type": "application/json"},
+            )
+            self.assertEqual(status, 400)
+
+        # Bodies are counted as they arrive, whatever the Content-Length says
+        status, _, _ = asgi_request(
+            ASGIApp(service), "POST", body=b"box;" * 20, chunk=8
+        )
+        self.assertEqual(status, 413)
+
+    def test_compile_errors(self):
+        """Verify pikchr errors are reported with 422 and are not cached."""
+        service = DiagramService()
+        status, headers, body = asgi_request(ASGIApp(service), "POST", body=b"box fill")
+        self.assertEqual(status, 422)
+        self.assertNotIn("etag", headers)
+        self.assertIn(b"syntax error", body)
+        self.assertEqual(headers["content-type"], "text/html; charset=utf-8")
+        self.assertEqual(headers["vary"], "Accept-Encoding")
+        self.assertEqual(headers["cache-control"], "no-cache")
+        self.assertEqual(service.stats.entries, 0)
+
+        status, headers, _ = asgi_request(
+            ASGIApp(service), "POST", query="flags=1", body=b"box fill"
+        )
+        self.assertEqual(headers["content-type"], "text/plain; charset=utf-8")
+
+    def test_lifespan(self):
+        """Verify the ASGI lifespan protocol is acknowledged."""
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(ASGIApp()({"type": "lifespan"}, receive, send))
+        self.assertEqual(
+            sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        )
+
+    def test_wsgi_server(self):
+        """Verify the WSGI app answers real HTTP requests."""
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = make_server("127.0.0.1", 0, WSGIApp(), handler_class=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+            conn.request("POST", "/", SOURCE.encode(), {"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            body = response.read()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(
+                gzip.decompress(body), create_pikchr(SOURCE, "", 0, 0, 0).encode()
+            )
+            conn.request(
+                "POST",
+                "/",
+                SOURCE.encode(),
+                {"If-None-Match": response.getheader("ETag")},
+            )
+            response = conn.getresponse()
+            response.read()
+            self.assertEqual(response.status, 304)
+            conn.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,6 +46,38 @@ class TestShapes(unittest.TestCase):
         self.assertIn("fill red", md)
         self.assertIn("color blue", md)
 
+    def test_md_cache_invalidation(self):
+        """Verify builder methods refresh the cached markdown."""
+        b = Box("Cached")
+        md = b.md
+        self.assertIs(b.md, md)
+        b.fill("red")
+        self.assertIn("fill red", b.md)
+        b.label("C1")
+        self.assertTrue(b.md.startswith('C1: box "Cached"'))
+
+    def test_diagram_incremental_md(self):
+        """Verify diagram markdown follows changes to shapes already added."""
+        d = Diagram()
+        boxes = [Box(f"B{i}") for i in range(600)]
+        for b in boxes:
+            d.add(b)
+        before = d.md
+        boxes[3].fill("red")
+        boxes[599].color("blue")
+        after = d.md
+        self.assertNotEqual(before, after)
+        self.assertIn('box "B3" fill red', after)
+        self.assertIn('box "B599" color blue', after)
+        self.assertEqual(after, ";\n".join(b.md for b in boxes))
+
+    def test_compact_shapes(self):
+        """Verify shapes use slots and keep attribute order on update."""
+        b = Box("Slots").fill("red").color("blue")
+        self.assertFalse(hasattr(b, "__dict__"))
+        b.fill("green")
+        self.assertIn('box "Slots" fill green color blue', b.md)
+
 
 if __name__ == "__main__":
     unittest.main()
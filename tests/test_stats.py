@@ -0,0 +1,82 @@
+import io
+import unittest
+
+from pypikchr import (
+    RenderCache,
+    RenderStats,
+    render_with_stats,
+    set_render_cache,
+    set_render_hook,
+)
+from pypikchr.diagram import Arrow, Box, Diagram
+from pypikchr.render import render, render_to
+from pypikchr.util.pikchr import create_pikchr, create_pikchr_stats
+
+
+class TestRenderStats(unittest.TestCase):
+    def tearDown(self):
+        set_render_hook(None)
+        set_render_cache(None)
+
+    def test_counters(self):
+        """Verify the extension counts tokens, objects, lookups and output."""
+        md = "A: box; B: box; arrow from A.s to B.n"
+        svg, stats = create_pikchr_stats(md, size_hint=16)
+        self.assertEqual(svg, create_pikchr(md, "", 0, 0, 0))
+        self.assertEqual(stats["objects"], 3)
+        self.assertEqual(stats["lookups"], 2)
+        self.assertEqual(stats["output_bytes"], len(svg.encode()))
+        self.assertGreater(stats["reallocs"], 0)
+        self.assertGreaterEqual(stats["tokens"], 15)
+        phases = stats["parse"] + stats["layout"] + stats["render"]
+        self.assertLessEqual(phases, stats["total"])
+
+    def test_error_phases(self):
+        """Verify phases after a parse error are reported as 0."""
+        svg, stats = render_with_stats("box fill")
+        self.assertIn("syntax error", svg)
+        self.assertEqual((stats.layout, stats.render), (0.0, 0.0))
+        self.assertGreater(stats.parse, 0.0)
+
+    def test_profile(self):
+        """Verify Diagram.profile measures the markdown and pikchr phases."""
+        d = Diagram()
+        for i in range(50):
+            d.add(Box(f"n{i}")).add(Arrow())
+        svg, stats = d.profile()
+        self.assertEqual(svg, str(d))
+        self.assertIsInstance(stats, RenderStats)
+        self.assertEqual(stats.objects, 100)
+        self.assertGreater(stats.markdown, 0.0)
+        self.assertAlmostEqual(
+            sum(seconds for _, seconds in stats.phases()), stats.total, places=3
+        )
+        self.assertEqual(Diagram().profile(), ("", RenderStats()))
+
+    def test_hook(self):
+        """Verify the hook sees every render, including cached ones."""
+        seen = []
+        set_render_hook(seen.append)
+        d = Diagram().add(Box("A"))
+        svg = str(d)
+        render('box "B"')
+        self.assertEqual(len(seen), 2)
+        self.assertEqual(seen[0].objects, 1)
+        self.assertEqual(seen[0].output_bytes, len(svg.encode()))
+
+        set_render_cache(RenderCache())
+        self.assertEqual(str(d), svg)
+        self.assertEqual(str(d), svg)
+        self.assertEqual([s.cached for s in seen[2:]], [False, True])
+
+        # Streaming is not observed
+        render_to(d, io.BytesIO())
+        self.assertEqual(len(seen), 4)
+
+        set_render_hook(None)
+        str(d)
+        self.assertEqual(len(seen), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from pypikchr.diagram import Box, Circle, Diagram, Group, ShapeTable
+
+
+class TestShapeTable(unittest.TestCase):
+    def test_matches_shapes(self):
+        """Verify a table emits the same markdown as the equivalent shapes."""
+        n = 50
+        shapes = Diagram()
+        for i in range(n):
+            shape = Circle(f"c{i}") if i % 3 == 0 else Box(f"b{i}")
+            shape.label(f"S{i}").width(0.5).fill("red").at(f"({i}, {i // 10})")
+            shapes.add(shape)
+        table = ShapeTable(
+            shapes=["circle" if i % 3 == 0 else "box" for i in range(n)],
+            texts=[f"c{i}" if i % 3 == 0 else f"b{i}" for i in range(n)],
+            labels=[f"S{i}" for i in range(n)],
+            widths=0.5,
+            fills="red",
+            positions=[(i, i // 10) for i in range(n)],
+        )
+        self.assertEqual(len(table), n)
+        self.assertEqual(Diagram().add(table).md, shapes.md)
+
+    def test_missing_values(self):
+        """Verify None entries leave attributes unset for their row."""
+        table = ShapeTable(
+            texts=["a", None],
+            labels=[None, "B"],
+            positions=["1, 1", None],
+            attrs=[None, "thick"],
+        )
+        table.dashed()
+        self.assertEqual(table.md, 'box "a" at 1, 1 dashed;\nB: box thick dashed')
+
+    def test_invalid_columns(self):
+        """Verify mismatched or missing columns are rejected."""
+        with self.assertRaises(ValueError):
+            ShapeTable(texts=["a", "b"], widths=[1])
+        with self.assertRaises(ValueError):
+            ShapeTable(texts="a")
+        with self.assertRaises(TypeError):
+            ShapeTable(texts=["a"]).label("T")
+        with self.assertWarns(RuntimeWarning):
+            table = ShapeTable(texts=["a"], labels=["low"])
+        self.assertEqual(table.md, 'LOW: box "a"')
+
+    def test_render(self):
+        """Verify tables render alongside shapes and inside groups."""
+        d = Diagram()
+        d.add(Box("first").label("FIRST"))
+        d.add(ShapeTable(texts=("x", "y"), positions=["FIRST.s", (2, 0)]))
+        d.add(Group().add(ShapeTable(shapes="circle", texts=range(3))))
+        svg = str(d)
+        self.assertIn("<svg", svg)
+        for text in ("first", "x", "y", "0", "2"):
+            self.assertIn(f">{text}</text>", svg)
+
+
+if __name__ == "__main__":
+    unittest.main()
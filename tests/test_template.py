@@ -0,0 +1,113 @@
+import re
+import unittest
+
+from pypikchr import RenderCache
+from pypikchr.diagram import Arrow, Box, Circle, Diagram, Group, Param, Template
+from pypikchr.util.pikchr import PikchrException
+from pypikchr.util.pikchr import create_pikchr
+
+
+def _strip_ids(svg):
+    return re.sub(r'data-pypikchr-id="\d+"', "", svg)
+
+
+class TestTemplate(unittest.TestCase):
+    def build(self, text, status, link):
+        d = Diagram()
+        d.add(Box("é"))
+        d.add(Group().add(Box(text).fill(status).url(link)))
+        d.add(Arrow())
+        d.add(Circle("db").fill(status).color("blue"))
+        return d
+
+    def test_render_matches_diagram(self):
+        """Verify rendered templates match diagrams built with the values."""
+        template = self.build(Param("text"), Param("status"), Param("link")).compile(
+            defaults={"link": "https://example.com/?a=1&b=2"}
+        )
+        self.assertEqual(template.params, ("text", "status", "link"))
+        for text, status in [("ünïcødé", "red"), ("ok", "green")]:
+            expected = self.build(text, status, "https://example.com/?a=1&b=2")
+            self.assertEqual(
+                _strip_ids(template.render(text=text, status=status)),
+                _strip_ids(str(expected)),
+            )
+            self.assertEqual(
+                template.markdown({"text": text}, status=status), expected.md
+            )
+
+    def test_tags_follow_values(self):
+        """Verify object tags are shifted by the length of earlier values."""
+        d = Diagram()
+        box = Box(Param("a"))
+        circle = Circle("c").url("https://example.com")
+        d.add(box).add(circle)
+        svg = d.compile().render(a="a much longer text than the placeholder")
+        self.assertIn(f'data-pypikchr-id="{box._id}"', svg)
+        self.assertIn(
+            f'<a href="https://example.com" data-pypikchr-id="{circle._id}"', svg
+        )
+
+    def test_cache(self):
+        """Verify renders are cached by the bound values."""
+        d = Diagram().add(Box("A").fill(Param("fill")))
+        template = d.compile()
+        svg = template.render(fill="red")
+        self.assertIs(template.render({"fill": "red"}), svg)
+        self.assertNotEqual(template.render(fill="blue"), svg)
+        stats = template.cache.stats
+        self.assertEqual((stats.hits, stats.misses), (1, 2))
+        self.assertIsNone(d.compile(cache_entries=0).cache)
+
+    def test_shared_cache(self):
+        """Verify templates sharing a cache do not return each other's SVGs."""
+        cache = RenderCache()
+        box = Template('box "\x00x\x00"', cache=cache)
+        circle = Template('circle "\x00x\x00"', cache=cache)
+        self.assertNotEqual(box.render(x="hi"), circle.render(x="hi"))
+        self.assertIn("<circle", circle.render(x="hi"))
+        self.assertEqual(cache.stats.hits, 1)
+
+    def test_unbound_params(self):
+        """Verify rendering a diagram containing params names them."""
+        d = Diagram().add(Box(Param("t")).url(Param("link")))
+        with self.assertRaisesRegex(PikchrException, "Unbound parameters: t, link"):
+            str(d)
+        with self.assertRaisesRegex(PikchrException, "Unbound parameters: t"):
+            d.validate()
+        self.assertIn("\x00t\x00", d.md)
+        self.assertEqual(d.compile().markdown(t="A", link="u"), 'box "A"')
+
+    def test_snapshot(self):
+        """Verify later changes to the diagram do not affect the template."""
+        box = Box(Param("t"))
+        d = Diagram().add(box)
+        template = d.compile()
+        box.fill("red")
+        self.assertEqual(template.markdown(t="x"), 'box "x"')
+
+    def test_errors(self):
+        """Verify unknown, missing and invalid params are rejected."""
+        template = Diagram().add(Box(Param("t")).fill(Param("f"))).compile()
+        with self.assertRaisesRegex(ValueError, "No value given for parameters: f"):
+            template.render(t="x")
+        with self.assertRaisesRegex(ValueError, "Unknown parameters: g"):
+            template.render(t="x", g="y")
+        with self.assertRaisesRegex(ValueError, "Unknown parameters: g"):
+            Diagram().add(Box("A")).compile(defaults={"g": 1})
+        with self.assertRaises(ValueError):
+            Param("not a name")
+        self.assertEqual(Param("fill").name, "fill")
+
+    def test_no_params(self):
+        """Verify a diagram without params renders as usual."""
+        d = Diagram().add(Box("A"))
+        self.assertEqual(d.compile().render(), str(d))
+        self.assertEqual(
+            d.compile().render(),
+            create_pikchr('box "A"', "", 0, 0, 0, [(0, d._shapes[0]._id, None)]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()